@@ -0,0 +1,214 @@
+import argparse
+import json
+import sys
+import time
+
+from pyspark import SparkConf
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import abs as abs_, col, count, greatest, lit, sum as sum_
+
+# 可合并的部分聚合状态：书籍数、sum(average_rating*ratings_count)、sum(ratings_count)、sum(text_reviews_count)
+# 两批数据的状态按key相加就是合并后的状态，由它可以算出分析3、4、6、7、10的结果
+STATE_COLUMNS = ["books_num", "rating_weight", "ratings_sum", "reviews_sum"]
+BASE_KEYS = ["publisher", "language_code", "year", "first_author"]
+# 每张聚合表的名称和分组的key
+DIMENSIONS = {
+    "publisher": ["publisher"],
+    "language": ["language_code"],
+    "year": ["year"],
+    "author": ["first_author"],
+}
+# 作者维度(datapreprocess.py --authors)上的两种作者归属：first只计第一作者，all把一本书计入它的每一位作者
+# 值为结果中作者列的名称
+AUTHOR_ATTRIBUTIONS = {"first": "first_author", "all": "author"}
+
+
+def partial_state(books_df, keys):
+    # 从明细数据计算按keys分组的部分聚合状态
+    return books_df.groupBy(*keys) \
+                   .agg(count("*").alias("books_num"),
+                        sum_(col("average_rating") * col("ratings_count")).alias("rating_weight"),
+                        sum_("ratings_count").alias("ratings_sum"),
+                        sum_("text_reviews_count").alias("reviews_sum"))
+
+
+def merge_states(state_df, keys):
+    # 合并(或上卷)部分聚合状态：按keys把各列相加，输入可以是多份状态union后的结果
+    return state_df.groupBy(*keys).agg(*[sum_(c).alias(c) for c in STATE_COLUMNS])
+
+
+def read_author_dimension(spark, author_dir):
+    # 返回(作者表, 书籍-作者桥表)
+    return spark.read.parquet(f"{author_dir}/authors"), spark.read.parquet(f"{author_dir}/book_authors")
+
+
+def author_dimension_state(books_df, authors_df, bridge_df, attribution="first"):
+    # 在作者维度上计算作者的聚合状态：明细与桥表按整数bookID连接、按整数author_id分组，
+    # 聚合之后才连接作者名，shuffle的只有整数key和数值列，不再在查询时拆分authors字符串
+    if attribution == "first":
+        bridge_df = bridge_df.filter(col("position") == 0)
+    metrics = books_df.select("bookID", "average_rating", "ratings_count", "text_reviews_count")
+    state = partial_state(metrics.join(bridge_df.select("bookID", "author_id"), "bookID"), ["author_id"])
+    return state.join(authors_df, "author_id") \
+                .select(col("author").alias(AUTHOR_ATTRIBUTIONS[attribution]), *STATE_COLUMNS)
+
+
+def _hadoop_path(spark, path):
+    # 通过Hadoop FileSystem操作目录，本地路径和HDFS路径都适用
+    jvm_path = spark._jvm.org.apache.hadoop.fs.Path(path)
+    return jvm_path.getFileSystem(spark._jsc.hadoopConfiguration()), jvm_path
+
+
+# 聚合表按版本保存：state_dir/v-00001/<维度>/...，所有维度写完后才写入_COMMITTED标记，标记中记录已合并的批次
+# 读取时使用有标记的最大版本；写到一半失败的版本没有标记，不会被读到，上一个版本保持不变
+# 提交是把临时文件重命名为不存在的_COMMITTED，本地和HDFS上都是原子的，不需要先删除再重命名
+COMMITTED = "_COMMITTED"
+
+
+def version_name(version):
+    return f"v-{version:05d}"
+
+
+def parse_version(name):
+    # 版本目录名 -> 版本号，其他文件和目录返回None
+    return int(name[2:]) if name.startswith("v-") and name[2:].isdigit() else None
+
+
+def committed_versions(spark, state_dir):
+    # 已提交的版本号(从小到大)
+    fs, root = _hadoop_path(spark, state_dir)
+    if not fs.exists(root):
+        return []
+    versions = [parse_version(status.getPath().getName()) for status in fs.listStatus(root)]
+    return sorted(v for v in versions if v is not None
+                  and fs.exists(_hadoop_path(spark, f"{state_dir}/{version_name(v)}/{COMMITTED}")[1]))
+
+
+def read_commit(spark, state_dir, version):
+    # 版本的提交记录：{"version": 版本号, "batches": [已合并的批次id, ...]}
+    fs, path = _hadoop_path(spark, f"{state_dir}/{version_name(version)}/{COMMITTED}")
+    stream = fs.open(path)
+    try:
+        return json.loads(spark._jvm.org.apache.commons.io.IOUtils.toString(stream, "UTF-8"))
+    finally:
+        stream.close()
+
+
+def current_state(spark, state_dir):
+    # 当前版本号和提交记录，还没有聚合表时返回(None, None)
+    versions = committed_versions(spark, state_dir)
+    if not versions:
+        return None, None
+    return versions[-1], read_commit(spark, state_dir, versions[-1])
+
+
+def read_state(spark, state_dir, dimension, version=None):
+    # 默认读取当前版本
+    if version is None:
+        version, _ = current_state(spark, state_dir)
+        if version is None:
+            raise FileNotFoundError(f"{state_dir}中没有已提交的聚合表")
+    return spark.read.parquet(f"{state_dir}/{version_name(version)}/{dimension}")
+
+
+def commit_version(spark, state_dir, version, commit):
+    # 先写临时文件(以_开头，Spark读取时忽略)，再重命名为_COMMITTED
+    fs, tmp = _hadoop_path(spark, f"{state_dir}/{version_name(version)}/{COMMITTED}.tmp")
+    out = fs.create(tmp, True)
+    try:
+        out.write(bytearray(json.dumps(commit).encode("utf-8")))
+    finally:
+        out.close()
+    if not fs.rename(tmp, _hadoop_path(spark, f"{state_dir}/{version_name(version)}/{COMMITTED}")[1]):
+        raise IOError(f"无法提交聚合表版本{version_name(version)}")
+
+
+def remove_old_versions(spark, state_dir, current):
+    # 删除current之前的版本(包括写到一半失败、没有提交标记的版本)，只保留上一个已提交版本给还在读取它的作业
+    fs, root = _hadoop_path(spark, state_dir)
+    previous = [v for v in committed_versions(spark, state_dir) if v < current][-1:]
+    for status in fs.listStatus(root):
+        v = parse_version(status.getPath().getName())
+        if v is not None and v < current and v not in previous:
+            fs.delete(status.getPath(), True)
+
+
+def refresh_states(spark, state_dir, batch_df, batch_id):
+    # 只聚合新到的一批数据，再与已保存的状态合并，耗时与这批数据和key的数量有关，与全量数据无关
+    # 第一次运行(没有已保存的状态)时，batch_df就是全量数据
+    # batch_id已在提交记录中的批次不再合并，重复运行同一批数据不会重复计数；返回是否合并了这批数据
+    # 所有维度写进一个新版本目录后一起提交，中途失败时当前版本不受影响
+    version, commit = current_state(spark, state_dir)
+    batches = commit["batches"] if commit else []
+    if batch_id in batches:
+        return False
+    new_version = (version or 0) + 1
+    # 缓存的表不会被AQE合并分区，与dataAnalysis.build_base_agg一样按输入的分区数合并
+    batch_state = partial_state(batch_df, BASE_KEYS).coalesce(batch_df.rdd.getNumPartitions()).cache()
+    for dimension, keys in DIMENSIONS.items():
+        delta = merge_states(batch_state, keys)
+        if version is not None:
+            delta = merge_states(read_state(spark, state_dir, dimension, version).unionByName(delta), keys)
+        delta.coalesce(1).write.parquet(f"{state_dir}/{version_name(new_version)}/{dimension}", mode="overwrite")
+    batch_state.unpersist()
+    commit_version(spark, state_dir, new_version, {"version": new_version, "batches": batches + [batch_id]})
+    remove_old_versions(spark, state_dir, new_version)
+    return True
+
+
+def check_states(spark, state_dir, books_df, rel_tol=1e-9):
+    # 与全量重新计算的结果比较，返回每张聚合表中不一致的key的数量
+    mismatches = {}
+    for dimension, keys in DIMENSIONS.items():
+        full = partial_state(books_df, keys).alias("full")
+        stored = read_state(spark, state_dir, dimension).alias("stored")
+        condition = None
+        for key in keys:
+            match = col(f"full.{key}").eqNullSafe(col(f"stored.{key}"))
+            condition = match if condition is None else condition & match
+        joined = full.join(stored, condition, "full_outer")
+        differs = lit(False)
+        for c in STATE_COLUMNS:
+            full_value, stored_value = col(f"full.{c}"), col(f"stored.{c}")
+            tolerance = greatest(lit(1.0), abs_(full_value)) * rel_tol
+            differs = differs | (~full_value.eqNullSafe(stored_value)
+                                 & (full_value.isNull() | stored_value.isNull()
+                                    | (abs_(full_value - stored_value) > tolerance)))
+        mismatches[dimension] = joined.filter(differs).count()
+    return mismatches
+
+
+if __name__ == "__main__":
+    from dataAnalysis import read_books
+
+    parser = argparse.ArgumentParser(description="维护出版社/语言/年份/作者的可合并聚合表")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    refresh_parser = subparsers.add_parser("refresh", help="把一批新书合并进聚合表(第一次运行传入全量数据)")
+    refresh_parser.add_argument("--batch", required=True, help="新书数据的路径(csv或Parquet)")
+    refresh_parser.add_argument("--batch-id", default=None,
+                                help="批次的唯一标识，已合并过的批次会被跳过，默认使用--batch的路径")
+    check_parser = subparsers.add_parser("check", help="与全量重新计算的结果比较")
+    check_parser.add_argument("--input", required=True, help="全量数据的路径(csv或Parquet)")
+    for sub in (refresh_parser, check_parser):
+        sub.add_argument("--state", required=True, help="聚合表目录(本地或HDFS)")
+        sub.add_argument("--format", default="auto", choices=["auto", "csv", "parquet"])
+        sub.add_argument("--master", default=None)
+    args = parser.parse_args()
+
+    conf = SparkConf()
+    if args.master:
+        conf.setMaster(args.master)
+    spark = SparkSession.builder.config(conf = conf).getOrCreate()
+
+    start = time.perf_counter()
+    if args.command == "refresh":
+        batch_id = args.batch_id or args.batch
+        if refresh_states(spark, args.state, read_books(spark, args.batch, args.format), batch_id):
+            print(f"## State refreshed in {time.perf_counter() - start:.2f}s")
+        else:
+            print(f"## Batch {batch_id} was already applied, state unchanged")
+    else:
+        mismatches = check_states(spark, args.state, read_books(spark, args.input, args.format))
+        for dimension, n in mismatches.items():
+            print(f"{dimension:<12}{'OK' if n == 0 else f'{n} mismatched keys'}")
+        sys.exit(1 if any(mismatches.values()) else 0)
@@ -0,0 +1,105 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+from topk import topk_from_scores
+
+
+class IVFIndex:
+    """
+    Approximate nearest-neighbour index built on a k-means coarse quantizer (IVF).
+
+    Items are clustered into n_lists spherical k-means cells. A query only scores
+    the items of the n_probe cells whose centroids are closest to it, so the work
+    per query is roughly n_probe / n_lists of an exact search. Raising n_probe
+    trades speed for recall; n_probe == n_lists is an exact search.
+
+    Parameters:
+    - n_lists (int): Number of k-means cells (inverted lists).
+    - n_probe (int): Default number of cells scored per query.
+    - n_iter (int): Number of k-means iterations when fitting the quantizer.
+    - random_state (int): Seed for the centroid initialisation.
+    """
+
+    def __init__(self, n_lists=100, n_probe=8, n_iter=10, random_state=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+    def fit(self, items):
+        """
+        Cluster the item vectors and build the inverted lists.
+
+        Parameters:
+        - items (sparse matrix or numpy array): Row-normalized item vectors.
+
+        Returns:
+        - IVFIndex: The fitted index.
+        """
+        items = sp.csr_matrix(items)
+        n_lists = min(self.n_lists, items.shape[0])
+        rng = np.random.default_rng(self.random_state)
+        centroids = items[rng.choice(items.shape[0], n_lists, replace=False)].toarray()
+
+        for _ in range(self.n_iter):
+            assign = np.asarray((items @ centroids.T).argmax(axis=1)).ravel()
+            membership = sp.csr_matrix(
+                (np.ones(items.shape[0]), (assign, np.arange(items.shape[0]))),
+                shape=(n_lists, items.shape[0])
+            )
+            centroids = np.asarray((membership @ items).todense())
+            # Re-seed empty cells with random items so every list stays usable
+            empty = np.flatnonzero(np.asarray(membership.sum(axis=1)).ravel() == 0)
+            if len(empty):
+                centroids[empty] = items[rng.choice(items.shape[0], len(empty), replace=False)].toarray()
+            centroids = normalize(centroids, norm='l2')
+
+        assign = np.asarray((items @ centroids.T).argmax(axis=1)).ravel()
+        self.centroids_ = centroids
+        # Store the items grouped by cell; list l occupies rows offsets_[l]:offsets_[l + 1]
+        self.order_ = np.argsort(assign, kind='stable')
+        self.offsets_ = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists))))
+        self.items_ = items[self.order_]
+        return self
+
+    def search(self, queries, k=10, n_probe=None):
+        """
+        Find approximately the top-k most similar items for every query.
+
+        Parameters:
+        - queries (sparse matrix or numpy array): Row-normalized query vectors.
+        - k (int): Number of neighbours to return per query.
+        - n_probe (int): Number of cells scored per query; defaults to the index setting.
+
+        Returns:
+        - tuple: (indices, scores) arrays of shape n_queries x k, sorted by descending
+          score, in the same layout as topk.topk_similarity. Missing neighbours are -1.
+        """
+        n_probe = min(n_probe or self.n_probe, len(self.centroids_))
+        coarse = queries @ self.centroids_.T
+        coarse = np.asarray(coarse.todense() if sp.issparse(coarse) else coarse)
+        probes, _ = topk_from_scores(coarse, n_probe)
+
+        n_queries = queries.shape[0]
+        best_idx = np.full((n_queries, k), -1, dtype=np.int64)
+        best_scores = np.full((n_queries, k), -np.inf)
+        # Visit each cell once and score all queries that probe it with one multiply
+        for cell in np.unique(probes):
+            start, stop = self.offsets_[cell], self.offsets_[cell + 1]
+            if start == stop:
+                continue
+            rows = np.flatnonzero((probes == cell).any(axis=1))
+            scores = queries[rows] @ self.items_[start:stop].T
+            scores = scores.toarray() if sp.issparse(scores) else np.asarray(scores)
+            cell_idx, cell_scores = topk_from_scores(scores, k)
+            merged_idx, merged_scores = topk_from_scores(
+                np.hstack((best_scores[rows], cell_scores)), k
+            )
+            candidates = np.hstack((best_idx[rows], cell_idx + start))
+            best_idx[rows] = np.take_along_axis(candidates, merged_idx, axis=1)
+            best_scores[rows] = merged_scores
+
+        found = best_idx >= 0
+        best_idx[found] = self.order_[best_idx[found]]
+        return best_idx, best_scores
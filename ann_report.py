@@ -0,0 +1,78 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from ann import IVFIndex
+from recommend import load_and_clean_data, prepare_features, transform_features
+from topk import topk_similarity
+
+
+def recall_at_k(approx_scores, exact_scores):
+    """
+    Tie-aware recall@K of an approximate search against the exact top-K.
+
+    An approximate neighbour counts as a hit when its score reaches the exact
+    K-th best score, so swapping equally similar books is not a miss.
+
+    Parameters:
+    - approx_scores (numpy array): Scores returned by the approximate search, n_queries x K.
+    - exact_scores (numpy array): Scores of the exact top-K, n_queries x K.
+
+    Returns:
+    - float: Mean recall@K over all queries.
+    """
+    return float(np.mean(approx_scores >= exact_scores[:, -1:] - 1e-9))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@K of the IVF index versus exact search")
+    parser.add_argument("--data", default="books_cleaned.csv")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--lists", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--output", default=None, help="Optional CSV file for the report")
+    args = parser.parse_args()
+
+    numerical_features = ["average_rating", "ratings_count", "text_reviews_count"]
+    df = load_and_clean_data(args.data)
+    train_df, val_df = train_test_split(df, test_size=0.2, random_state=42)
+    combined_features, tfidf, scaler = prepare_features(train_df, numerical_features)
+    val_combined = transform_features(val_df, tfidf, scaler, numerical_features)
+
+    start = time.perf_counter()
+    _, exact_scores = topk_similarity(val_combined, combined_features, k=args.k)
+    exact_ms = (time.perf_counter() - start) * 1000 / val_combined.shape[0]
+    print(f"items: {combined_features.shape[0]}, queries: {val_combined.shape[0]}, "
+          f"exact search: {exact_ms:.3f} ms/query")
+
+    rows = []
+    for n_lists in args.lists:
+        start = time.perf_counter()
+        index = IVFIndex(n_lists=n_lists).fit(combined_features)
+        build_s = time.perf_counter() - start
+        for n_probe in args.probes:
+            if n_probe > n_lists:
+                continue
+            start = time.perf_counter()
+            _, approx_scores = index.search(val_combined, k=args.k, n_probe=n_probe)
+            query_ms = (time.perf_counter() - start) * 1000 / val_combined.shape[0]
+            rows.append({
+                "n_lists": n_lists,
+                "n_probe": n_probe,
+                "build_s": round(build_s, 3),
+                "ms_per_query": round(query_ms, 4),
+                "speedup": round(exact_ms / query_ms, 2),
+                f"recall@{args.k}": round(recall_at_k(approx_scores, exact_scores), 4),
+            })
+
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
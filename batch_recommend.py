@@ -0,0 +1,143 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from model_store import RecommenderModel
+
+HEADER = "book_id,recommended_books\n"
+
+# Model opened once per worker process by _open_model
+_model = None
+
+
+def _open_model(model_dir):
+    global _model
+    _model = RecommenderModel(model_dir)
+
+
+def _recommend_chunk(book_ids, n, block_size):
+    """
+    Score one chunk of catalog books in a worker and format its CSV lines.
+
+    The worker's model maps the same .npy files as every other worker, so the
+    item matrix is shared through the page cache; only the bookIDs go in and the
+    formatted text comes back.
+    """
+    rows = _model.rows_for(book_ids)
+    recommended, _ = _model.search(_model.item_vectors(rows), n=n, exclude_rows=rows, n_jobs=1,
+                                   block_size=block_size)
+    return "".join(f"{book_id},{' '.join(map(str, row))}\n" for book_id, row in zip(book_ids, recommended))
+
+
+class Progress:
+    """
+    Prints rows done, throughput and ETA to stderr at most every interval seconds.
+    """
+
+    def __init__(self, total, interval=1.0, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, rows):
+        self.done += rows
+        now = time.perf_counter()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            print(self.format(now), file=self.stream, flush=True)
+
+    def format(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float("nan")
+        return (f"## {self.done}/{self.total} books ({100 * self.done / max(self.total, 1):.1f}%), "
+                f"{rate:.0f} books/s, elapsed {elapsed:.1f}s, eta {eta:.1f}s")
+
+
+def recommend_all(model_dir, output_path, n=5, chunk_size=2048, workers=None, book_ids=None, block_size=256,
+                  progress=True):
+    """
+    Write the top-N recommendations of every catalog book (or of the given books) to a CSV.
+
+    Query rows are split into chunks that are scored in a process pool; every
+    worker opens the memory-mapped model once, so the item matrix is not copied
+    into the workers, and a worker holds one block_size x n_items score block at
+    a time. At most two chunks per worker are in flight and finished chunks are
+    written in input order, so memory stays bounded and the output streams to
+    disk while later chunks are still being scored.
+
+    Parameters:
+    - model_dir (str): Artifact directory written by model_store.build_model.
+    - output_path (str): CSV written in the submission.csv format (book_id,recommended_books).
+    - n (int): Number of recommendations per book.
+    - chunk_size (int): Query books scored per task.
+    - workers (int): Worker processes; defaults to the number of CPUs.
+    - book_ids (list): Optional bookIDs to recommend for instead of the whole catalog.
+    - block_size (int): Query rows scored per matrix multiply inside a worker.
+    - progress (bool): Print progress and throughput to stderr.
+
+    Returns:
+    - dict: Number of books written, wall time in seconds and books per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    model = RecommenderModel(model_dir)
+    # Every edition of a work-level model gets a line (the recommendations of its work)
+    book_ids = model.catalog_ids() if book_ids is None else np.asarray(book_ids, dtype=np.int64)
+    # Unknown bookIDs raise KeyError here rather than in a worker
+    model.rows_for(book_ids)
+    chunks = (book_ids[start:start + chunk_size] for start in range(0, len(book_ids), chunk_size))
+    tracker = Progress(len(book_ids)) if progress else None
+
+    start = time.perf_counter()
+    with open(output_path, "w", encoding="utf-8") as f, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_open_model, initargs=(model_dir,)) as pool:
+        f.write(HEADER)
+        pending = deque()
+        for chunk in chunks:
+            pending.append((len(chunk), pool.submit(_recommend_chunk, chunk, n, block_size)))
+            while len(pending) >= 2 * workers:
+                _write_next(pending, f, tracker)
+        while pending:
+            _write_next(pending, f, tracker)
+    wall = time.perf_counter() - start
+    return {"books": len(book_ids), "wall_s": wall, "books_per_s": len(book_ids) / wall if wall > 0 else None}
+
+
+def _write_next(pending, f, tracker):
+    # Waits for the oldest chunk, so rows are written in the order they were submitted
+    size, future = pending.popleft()
+    f.write(future.result())
+    if tracker is not None:
+        tracker.update(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend for every book of a saved model, in parallel")
+    parser.add_argument("--model", default="model")
+    parser.add_argument("--output", default="recommendations.csv")
+    parser.add_argument("-n", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=2048, help="Query books scored per task")
+    parser.add_argument("--block-size", type=int, default=256,
+                        help="Query rows scored per matrix multiply; a worker holds block-size x catalog scores")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to the number of CPUs")
+    parser.add_argument("--book-id", type=int, nargs="*", default=None,
+                        help="Only recommend for these bookIDs instead of the whole catalog")
+    parser.add_argument("--quiet", action="store_true", help="Do not print progress")
+    args = parser.parse_args()
+
+    result = recommend_all(args.model, args.output, n=args.n, chunk_size=args.chunk_size, workers=args.workers,
+                           book_ids=args.book_id, block_size=args.block_size, progress=not args.quiet)
+    print(f"Wrote {result['books']} books to {args.output} in {result['wall_s']:.2f}s "
+          f"({result['books_per_s']:.0f} books/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from profiler import ENV_VAR
+from synth import generate_catalog, parse_rows
+
+# 在不同规模的合成目录(synth.py)上运行整条流水线并记录每个阶段的耗时、吞吐量和峰值内存：
+#   preprocess  datapreprocess.py --stream
+#   analysis    dataAnalysis.py，Spark local模式，作业逐个运行以便分别计时
+#   build       model_store.py build；query  从保存的模型按bookID批量推荐
+#   evaluate    recommend.py(TF-IDF、相似度、MAP评估、写submission)
+# 每个脚本在子进程中运行，阶段明细来自profiler.py；结果与保存的基线比较，变慢或内存增长超过阈值的阶段标记为回归
+# 基线按机器(CPU架构和CPU数)分别保存，不同机器的耗时不可比；在新机器上先用--save-baseline记录一次
+# facets子命令单独测量带过滤条件的推荐：先用分面索引求交集只给候选打分，与全部打分后再过滤比较延迟
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE = "bench_baseline.json"
+SUITES = ["preprocess", "analysis", "build", "query", "evaluate"]
+
+
+def machine_key():
+    return f"{platform.machine()}-{os.cpu_count()}cpu"
+
+
+def run_stage(command, cwd, log_path, profile_path=None):
+    # 运行一个子进程，返回(耗时, 峰值RSS MB, profiler记录的阶段明细)
+    env = {k: v for k, v in os.environ.items() if k != ENV_VAR}
+    if profile_path:
+        if os.path.exists(profile_path):
+            os.remove(profile_path)
+        env[ENV_VAR] = profile_path
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed with exit code {process.returncode}, see {log_path}")
+    peak = usage.ru_maxrss / 1024
+    stages = []
+    if profile_path:
+        with open(profile_path) as f:
+            run = json.load(f)["runs"][-1]
+        # profiler在阶段之间重置过VmHWM，进程的峰值以它的记录为准
+        peak = max(peak, run["peak_rss_mb"])
+        stages = run["stages"]
+    return wall, peak, stages
+
+
+def stage_result(wall, peak, items):
+    return {"wall_s": round(wall, 3), "per_s": round(items / wall, 1) if wall > 0 else None,
+            "peak_rss_mb": round(peak, 1)}
+
+
+def record(results, name, wall, peak, items, stages=()):
+    results[name] = stage_result(wall, peak, items)
+    for stage in stages:
+        results[stage["name"]] = stage_result(stage["wall_s"], stage["peak_rss_mb"], items)
+        spark = stage.get("spark")
+        if spark:
+            results[stage["name"]]["shuffle_mb"] = round(
+                (spark.get("shuffleReadBytes", 0) + spark.get("shuffleWriteBytes", 0)) / 2 ** 20, 2)
+
+
+def benchmark_size(rows, workdir, suites, seed=42, master="local[*]", queries=2000):
+    # 一种规模的所有阶段；per_s为每秒处理的书籍数(query为每秒的查询数)
+    # 子进程在workdir中运行，路径都用绝对路径
+    workdir = os.path.abspath(workdir)
+    os.makedirs(workdir, exist_ok=True)
+    raw = os.path.join(workdir, "books.csv")
+    cleaned = os.path.join(workdir, "books_cleaned.csv")
+    profile = os.path.join(workdir, "profile.json")
+    model = os.path.join(workdir, "model")
+    results = {}
+
+    if not os.path.exists(raw):
+        start = time.perf_counter()
+        generate_catalog(raw, rows, seed=seed, src=os.path.join(REPO_DIR, "books.csv"))
+        print(f"## generated {rows} rows in {time.perf_counter() - start:.1f}s")
+
+    def script(name, *args):
+        return [sys.executable, os.path.join(REPO_DIR, name), *args]
+
+    def log(name):
+        return os.path.join(workdir, f"{name}.log")
+
+    if "preprocess" in suites or not os.path.exists(cleaned):
+        wall, peak, stages = run_stage(script("datapreprocess.py", "--stream", "--input", raw, "--output", cleaned),
+                                       workdir, log("preprocess"), profile)
+        record(results, "preprocess", wall, peak, rows, stages)
+    if "analysis" in suites:
+        wall, peak, stages = run_stage(
+            script("dataAnalysis.py", "--backend", "spark", "--master", master, "--workers", "1", "--no-cache",
+                   "--input", cleaned, "--output", os.path.join(workdir, "result")),
+            workdir, log("analysis"), profile)
+        record(results, "analysis", wall, peak, rows, stages)
+    if "build" in suites or ("query" in suites and not os.path.exists(model)):
+        wall, peak, _ = run_stage(script("model_store.py", "build", "--data", cleaned, "--model", model),
+                                  workdir, log("build"))
+        record(results, "build", wall, peak, rows)
+    if "query" in suites:
+        wall, peak, _ = run_stage(script("benchmark.py", "query", "--model", model, "--queries", str(queries)),
+                                  workdir, log("query"))
+        with open(log("query")) as f:
+            seconds = json.loads(f.read().strip().splitlines()[-1])["seconds"]
+        # 只计查询本身的时间，不含进程启动和打开模型
+        record(results, "query", seconds, peak, queries)
+    if "evaluate" in suites:
+        # recommend.py读取当前目录下的books_cleaned.csv并写出submission.csv，因此在工作目录中运行
+        wall, peak, stages = run_stage(script("recommend.py"), workdir, log("evaluate"), profile)
+        record(results, "evaluate", wall, peak, rows, stages)
+    return results
+
+
+def query_benchmark(model_dir, queries, batch=64, seed=0):
+    # 打开模型后按bookID批量推荐，返回纯查询耗时
+    from model_store import RecommenderModel
+
+    model = RecommenderModel(model_dir)
+    book_ids = np.random.default_rng(seed).choice(model.book_ids, size=queries)
+    start = time.perf_counter()
+    for i in range(0, queries, batch):
+        model.recommend(book_ids[i:i + batch], n=5)
+    return time.perf_counter() - start
+
+
+def facet_filters(model):
+    # 选择性从高到低的一组过滤条件：最常见/较少/最少见的语言、评分人数的分位数、年份区间和组合条件
+    facets = model.segments[0].facets
+    counts = np.diff(np.asarray(facets.language_offsets))
+    languages = [facets.languages[i] for i in np.argsort(-counts, kind="stable") if facets.languages[i]]
+    ratings_count = np.asarray(facets.sorted_values["ratings_count"])
+    years = np.asarray(facets.sorted_values["year"])
+    filters = [{"language": languages[0]}, {"language": languages[1]}, {"language": languages[min(5, len(languages) - 1)]},
+               {"language": languages[-1]}]
+    for q in (0.5, 0.9, 0.99, 0.999):
+        filters.append({"min_ratings_count": int(np.quantile(ratings_count, q))})
+    middle = int(np.median(years))
+    filters += [{"year_min": middle - 5, "year_max": middle + 5}, {"year_min": middle, "year_max": middle},
+                {"language": languages[0], "year_min": middle, "year_max": middle, "min_rating": 4.0}]
+    return filters
+
+
+def facet_benchmark(model_dir, queries=256, batch=64, n=5, seed=0):
+    # 每种过滤条件的选择性和每次查询的平均延迟(毫秒)：filtered为先求交集再打分，post_filter为全部打分后把不符合的置为-inf
+    from model_store import RecommenderModel
+    from topk import topk_from_scores
+
+    model = RecommenderModel(model_dir)
+    if len(model.segments) != 1 or model.segments[0].facets is None:
+        raise ValueError("facet benchmark needs a single-segment model built with facets")
+    segment = model.segments[0]
+    n_items = len(model.book_ids)
+    rows = np.random.default_rng(seed).choice(n_items, size=queries, replace=False)
+    items_t = segment.items_csc.T.tocsr()
+    results = []
+    for filters in facet_filters(model):
+        candidates = segment.facets.rows(filters)
+        mask = np.zeros(n_items, dtype=bool)
+        mask[candidates] = True
+        start = time.perf_counter()
+        for i in range(0, queries, batch):
+            model.search(model.item_vectors(rows[i:i + batch]), n=n, exclude_rows=rows[i:i + batch], filters=filters)
+        filtered = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(0, queries, batch):
+            scores = (model.item_vectors(rows[i:i + batch]) @ items_t).toarray()
+            scores[:, ~mask] = -np.inf
+            scores[np.arange(len(scores)), rows[i:i + batch]] = -np.inf
+            topk_from_scores(scores, n)
+        post_filter = time.perf_counter() - start
+        results.append({"filters": filters, "candidates": len(candidates),
+                        "selectivity": len(candidates) / n_items,
+                        "filtered_ms": 1000 * filtered / queries, "post_filter_ms": 1000 * post_filter / queries})
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.5, min_mb=32):
+    # 返回回归列表；很短的阶段和很小的内存差异不计，避免测量噪声
+    regressions = []
+    for size, stages in results.items():
+        for name, current in stages.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            if current["wall_s"] > base["wall_s"] * (1 + tolerance) and current["wall_s"] - base["wall_s"] > min_seconds:
+                regressions.append((size, name, "time", base["wall_s"], current["wall_s"]))
+            if (current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance)
+                    and current["peak_rss_mb"] - base["peak_rss_mb"] > min_mb):
+                regressions.append((size, name, "memory", base["peak_rss_mb"], current["peak_rss_mb"]))
+    return regressions
+
+
+def print_results(results, baseline):
+    print(f"{'size':<8}{'stage':<42}{'wall s':>9}{'baseline':>10}{'per s':>12}{'peak MB':>9}")
+    for size, stages in results.items():
+        for name, current in stages.items():
+            base = baseline.get(size, {}).get(name, {}).get("wall_s")
+            print(f"{size:<8}{name:<42}{current['wall_s']:>9.2f}{base if base is not None else '-':>10}"
+                  f"{current['per_s'] or 0:>12.0f}{current['peak_rss_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合成目录上的流水线规模测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="运行测试并与基线比较")
+    run_parser.add_argument("--sizes", default="100k", help="逗号分隔的规模，例如100k,1m,10m")
+    run_parser.add_argument("--suites", default=",".join(SUITES), help=f"要运行的阶段，可选{','.join(SUITES)}")
+    run_parser.add_argument("--workdir", default="bench", help="合成数据和中间结果的目录，已生成的数据会复用")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--master", default="local[*]")
+    run_parser.add_argument("--queries", type=int, default=2000)
+    run_parser.add_argument("--baseline", default=BASELINE)
+    run_parser.add_argument("--machine", default=machine_key(),
+                            help="基线中使用哪台机器的记录，默认为本机(CPU架构-CPU数)")
+    run_parser.add_argument("--save-baseline", action="store_true", help="把本次结果写入基线(与已有的规模合并)")
+    run_parser.add_argument("--tolerance", type=float, default=0.25, help="超过基线这个比例视为回归")
+    run_parser.add_argument("--output", default=None, help="把本次结果写成JSON")
+    query_parser = subparsers.add_parser("query", help="(run在子进程中调用)测量模型的查询耗时")
+    query_parser.add_argument("--model", required=True)
+    query_parser.add_argument("--queries", type=int, default=2000)
+    facet_parser = subparsers.add_parser("facets", help="带过滤条件的推荐延迟与选择性的关系")
+    facet_parser.add_argument("--model", required=True, help="model_store.py build生成的模型目录")
+    facet_parser.add_argument("--queries", type=int, default=256)
+    facet_parser.add_argument("--output", default=None, help="把结果写成JSON")
+    args = parser.parse_args()
+
+    if args.command == "query":
+        print(json.dumps({"queries": args.queries, "seconds": query_benchmark(args.model, args.queries)}))
+        sys.exit(0)
+    if args.command == "facets":
+        results = facet_benchmark(args.model, args.queries)
+        print(f"{'filters':<72}{'selectivity':>12}{'filtered ms':>13}{'post-filter ms':>16}{'speedup':>9}")
+        for r in results:
+            filters = ", ".join(f"{k}={v}" for k, v in r["filters"].items())
+            print(f"{filters:<72}{r['selectivity']:>11.2%}{r['filtered_ms']:>13.3f}{r['post_filter_ms']:>16.3f}"
+                  f"{r['post_filter_ms'] / r['filtered_ms']:>8.1f}x")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        sys.exit(0)
+
+    suites = args.suites.split(",")
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    results = {}
+    for size in args.sizes.split(","):
+        rows = parse_rows(size)
+        results[size] = benchmark_size(rows, os.path.join(args.workdir, size), suites, args.seed, args.master,
+                                       args.queries)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    baseline = baselines.get(args.machine, {})
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baseline.update(results)
+        baselines[args.machine] = baseline
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"## baseline for {args.machine} saved to {args.baseline}")
+        sys.exit(0)
+    if not baseline:
+        print(f"## no baseline for {args.machine} in {args.baseline}, record one with --save-baseline on this machine")
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for size, name, kind, before, after in regressions:
+        print(f"## REGRESSION {size} {name}: {kind} {before} -> {after}")
+    sys.exit(1 if regressions else 0)
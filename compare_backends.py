@@ -0,0 +1,153 @@
+import argparse
+import csv
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from collections import Counter
+from glob import glob
+
+from dataAnalysis import ANALYSES
+
+# 在同一份数据上分别用Spark后端和本地后端运行dataAnalysis.py：
+# 比较两者输出的文件是否一致(一致性检查)，并比较启动时间和总耗时
+# 浮点数的求和顺序不同会导致最后一位不同，因此浮点数按相对误差比较；行的顺序只在并列时可能不同，按多重集合比较
+# 没有Spark的环境用--reference：只运行本地后端，与仓库中保存的Spark输出(reference/spark)比较文件布局、schema和内容
+# 该参考输出由--save-reference从Spark后端的结果生成，分析逻辑或数据变化后需要重新生成
+
+FLOAT_PATTERN = re.compile(r"-?\d+\.\d+(E-?\d+)?")
+INT_PATTERN = re.compile(r"-?\d+")
+REFERENCE_DIR = "reference/spark"
+
+
+def read_result(path):
+    rows = []
+    for part in sorted(glob(f"{path}/part-*.csv")):
+        with open(part, encoding="utf-8", newline="") as f:
+            rows.extend(tuple(row) for row in csv.reader(f, escapechar="\\", doublequote=False))
+    return rows
+
+
+def normalize(row, digits):
+    return tuple(f"{float(v):.{digits}g}" if FLOAT_PATTERN.fullmatch(v) else v for v in row)
+
+
+def compare_results(spark_dir, local_dir, digits=12):
+    # 返回{分析名称: (Spark的行数, 本地的行数, 不一致的行数)}
+    report = {}
+    for name, analysis in ANALYSES.items():
+        spark_rows = read_result(f"{spark_dir}/{analysis.output}")
+        local_rows = read_result(f"{local_dir}/{analysis.output}")
+        difference = Counter(normalize(r, digits) for r in spark_rows)
+        difference.subtract(normalize(r, digits) for r in local_rows)
+        report[name] = (len(spark_rows), len(local_rows), sum(abs(n) for n in difference.values()))
+    return report
+
+
+def column_kind(value):
+    if INT_PATTERN.fullmatch(value):
+        return "int"
+    if FLOAT_PATTERN.fullmatch(value):
+        return "float"
+    return "string"
+
+
+def row_schema(rows):
+    # 每行的列数，以及每一列出现过的值类型(int/float/string)；空字符串(null)不计类型
+    widths = {len(r) for r in rows}
+    kinds = {}
+    for row in rows:
+        for i, v in enumerate(row):
+            if v != "":
+                kinds.setdefault(i, set()).add(column_kind(v))
+    return widths, {i: sorted(k) for i, k in kinds.items()}
+
+
+def compare_layout(spark_dir, local_dir):
+    # 不依赖行内容的检查：每个分析的输出目录和part文件是否存在，以及两边的列数和列类型是否一致
+    # 返回{分析名称: 问题描述列表}，没有问题的分析不出现
+    problems = {}
+    for name, analysis in ANALYSES.items():
+        found = []
+        for label, root in (("spark", spark_dir), ("local", local_dir)):
+            if not glob(f"{root}/{analysis.output}/part-*.csv"):
+                found.append(f"{label}: no part-*.csv in {analysis.output}")
+        if not found:
+            spark_widths, spark_kinds = row_schema(read_result(f"{spark_dir}/{analysis.output}"))
+            local_widths, local_kinds = row_schema(read_result(f"{local_dir}/{analysis.output}"))
+            if spark_widths != local_widths:
+                found.append(f"columns: spark {sorted(spark_widths)}, local {sorted(local_widths)}")
+            for i in sorted(set(spark_kinds) | set(local_kinds)):
+                if spark_kinds.get(i) != local_kinds.get(i):
+                    found.append(f"column {i}: spark {spark_kinds.get(i)}, local {local_kinds.get(i)}")
+        if found:
+            problems[name] = found
+    return problems
+
+
+def save_reference(spark_dir, reference_dir):
+    # 只保留part文件并改成固定的文件名(part-00000.csv, ...)，去掉_SUCCESS和.crc，便于提交到仓库
+    for analysis in ANALYSES.values():
+        target = f"{reference_dir}/{analysis.output}"
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(target)
+        for i, part in enumerate(sorted(glob(f"{spark_dir}/{analysis.output}/part-*.csv"))):
+            shutil.copyfile(part, f"{target}/part-{i:05d}.csv")
+
+
+def run_backend(backend, args, output_dir):
+    # 在子进程中运行，计时包含解释器、JVM和SparkSession的启动
+    # 不使用结果缓存，两个后端都实际计算一遍
+    command = [sys.executable, "dataAnalysis.py", "--backend", backend, "--input", args.input,
+               "--output", output_dir, "--no-cache"]
+    if args.master and backend == "spark":
+        command += ["--master", args.master]
+    start = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        sys.exit(f"{backend} backend failed:\n{completed.stdout}\n{completed.stderr}")
+    total = float(re.search(r"^\(total\)\s+([\d.]+)s$", completed.stdout, re.M).group(1))
+    return wall, total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较Spark后端与本地后端的输出和耗时")
+    parser.add_argument("--input", default="books_cleaned.csv")
+    parser.add_argument("--output", default="backend_compare", help="两个后端的结果分别写到其中的spark/和local/")
+    parser.add_argument("--master", default="local[*]")
+    parser.add_argument("--repeat", type=int, default=1, help="每个后端运行的次数，取最快的一次")
+    parser.add_argument("--reference", nargs="?", const=REFERENCE_DIR, default=None,
+                        help=f"不运行Spark，只把本地后端的结果与保存的Spark输出比较(默认{REFERENCE_DIR})")
+    parser.add_argument("--save-reference", nargs="?", const=REFERENCE_DIR, default=None,
+                        help="把这次Spark后端的结果保存为参考输出")
+    args = parser.parse_args()
+
+    args.input = os.path.abspath(args.input)
+    backends = ("local",) if args.reference else ("spark", "local")
+    timings = {}
+    for backend in backends:
+        output_dir = os.path.abspath(f"{args.output}/{backend}")
+        timings[backend] = min(run_backend(backend, args, output_dir) for _ in range(args.repeat))
+
+    print(f"{'backend':<10}{'wall':>10}{'analyses':>10}{'startup':>10}")
+    for backend, (wall, total) in timings.items():
+        print(f"{backend:<10}{wall:>9.2f}s{total:>9.2f}s{wall - total:>9.2f}s")
+
+    spark_dir = args.reference or f"{args.output}/spark"
+    if args.save_reference and not args.reference:
+        save_reference(spark_dir, args.save_reference)
+        print(f"\nreference saved to {args.save_reference}")
+
+    problems = compare_layout(spark_dir, f"{args.output}/local")
+    for name, found in problems.items():
+        print(f"{name}: " + "; ".join(found))
+
+    report = compare_results(spark_dir, f"{args.output}/local")
+    print(f"\n{'analysis':<34}{'spark':>8}{'local':>8}  parity")
+    for name, (spark_rows, local_rows, mismatched) in report.items():
+        print(f"{name:<34}{spark_rows:>8}{local_rows:>8}  {'OK' if mismatched == 0 else f'{mismatched} rows differ'}")
+    sys.exit(1 if problems or any(r[2] for r in report.values()) else 0)
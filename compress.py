@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from topk import topk_from_scores
+
+DTYPES = ("float32", "int8")
+
+
+class CompressedIndex:
+    """
+    Exact search over reduced, quantized item vectors.
+
+    The combined feature vectors are projected onto their top `rank` singular
+    directions with TruncatedSVD and re-normalized, so dot products stay cosine
+    similarities. The projected items are then stored either as float32 or as
+    int8 codes with a per-dimension scale and offset (x ~ code * scale + offset).
+    Int8 similarities are computed on the codes directly: the query is multiplied
+    by the scales once, so a score is (query * scale) . code + query . offset and
+    the items are never decoded as a whole.
+
+    Parameters:
+    - rank (int): Number of SVD dimensions kept.
+    - dtype (str): Storage type of the item codes, "float32" or "int8".
+    - item_block (int): Item rows converted to float32 per multiply when scoring int8 codes.
+    - random_state (int): Seed for the randomized SVD.
+    """
+
+    def __init__(self, rank=128, dtype="int8", item_block=65536, random_state=42):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        self.rank = rank
+        self.dtype = dtype
+        self.item_block = item_block
+        self.random_state = random_state
+
+    def fit(self, items):
+        """
+        Fit the projection on the item vectors and store their compressed codes.
+
+        Parameters:
+        - items (sparse matrix or numpy array): Row-normalized item vectors.
+
+        Returns:
+        - CompressedIndex: The fitted index.
+        """
+        rank = min(self.rank, items.shape[1] - 1)
+        self.svd_ = TruncatedSVD(n_components=rank, random_state=self.random_state).fit(items)
+        self.components_ = self.svd_.components_.astype(np.float32)
+        reduced = self.project(items)
+        if self.dtype == "float32":
+            self.codes_ = reduced
+            self.scales_ = self.offsets_ = None
+            return self
+
+        # Asymmetric per-dimension quantization: each column's [min, max] is mapped onto [-128, 127]
+        low, high = reduced.min(axis=0), reduced.max(axis=0)
+        scales = (high - low) / 255
+        scales[scales == 0] = 1.0
+        self.scales_ = scales.astype(np.float32)
+        self.offsets_ = (low + 128 * scales).astype(np.float32)
+        codes = np.rint((reduced - self.offsets_) / self.scales_)
+        self.codes_ = np.clip(codes, -128, 127).astype(np.int8)
+        return self
+
+    def project(self, vectors):
+        """
+        Project vectors onto the fitted SVD directions.
+
+        Parameters:
+        - vectors (sparse matrix or numpy array): Vectors in the original feature space.
+
+        Returns:
+        - numpy array: Row-normalized float32 vectors of shape n x rank.
+        """
+        reduced = np.asarray(vectors @ self.components_.T, dtype=np.float32)
+        return normalize(reduced, norm='l2', copy=False)
+
+    @property
+    def memory_bytes(self):
+        """
+        Bytes held by the stored item codes and the quantization parameters.
+        """
+        extra = 0 if self.scales_ is None else self.scales_.nbytes + self.offsets_.nbytes
+        return self.codes_.nbytes + extra
+
+    @property
+    def projection_bytes(self):
+        """
+        Bytes of the float32 projection matrix needed to encode queries.
+        """
+        return self.components_.nbytes
+
+    def score(self, queries):
+        """
+        Similarities between projected queries and all stored items.
+
+        Parameters:
+        - queries (numpy array): Projected float32 query vectors, see project.
+
+        Returns:
+        - numpy array: float32 scores of shape n_queries x n_items.
+        """
+        if self.scales_ is None:
+            return queries @ self.codes_.T
+        weighted = queries * self.scales_
+        scores = np.empty((len(queries), len(self.codes_)), dtype=np.float32)
+        # Convert a bounded slice of the codes at a time, so no float copy of the whole matrix exists
+        for start in range(0, len(self.codes_), self.item_block):
+            block = self.codes_[start:start + self.item_block].astype(np.float32)
+            scores[:, start:start + len(block)] = weighted @ block.T
+        scores += (queries @ self.offsets_)[:, None]
+        return scores
+
+    def search(self, queries, k=10, block_size=1024, n_jobs=None):
+        """
+        Find the top-k most similar items for every query on the compressed codes.
+
+        Parameters:
+        - queries (sparse matrix or numpy array): Row-normalized query vectors in the original feature space.
+        - k (int): Number of neighbours to return per query.
+        - block_size (int): Number of query rows scored per multiply.
+        - n_jobs (int): Number of worker threads; defaults to the number of CPUs.
+
+        Returns:
+        - tuple: (indices, scores) arrays of shape n_queries x k, sorted by descending
+          score, in the same layout as topk.topk_similarity.
+        """
+        n_jobs = n_jobs or os.cpu_count() or 1
+        k = min(k, len(self.codes_))
+        indices = np.empty((queries.shape[0], k), dtype=np.int64)
+        scores = np.empty((queries.shape[0], k), dtype=np.float32)
+
+        def run(start):
+            block = self.score(self.project(queries[start:start + block_size]))
+            indices[start:start + block_size], scores[start:start + block_size] = topk_from_scores(block, k)
+
+        starts = range(0, queries.shape[0], block_size)
+        if n_jobs == 1:
+            for start in starts:
+                run(start)
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                list(pool.map(run, starts))
+        return indices, scores
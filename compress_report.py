@@ -0,0 +1,97 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from ann_report import recall_at_k
+from compress import DTYPES, CompressedIndex
+from evaluate import TopKEvaluator, exact_scores_of
+from recommend import load_and_clean_data, prepare_features, transform_features
+from topk import topk_similarity
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="MAP@K, recall, memory and throughput of SVD + quantized vectors versus the uncompressed search")
+    parser.add_argument("--data", default="books_cleaned.csv")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ranks", type=int, nargs="+", default=[32, 64, 128, 256])
+    parser.add_argument("--dtypes", nargs="+", choices=DTYPES, default=list(DTYPES))
+    parser.add_argument("--repeat", type=int, default=3, help="Timed searches per setting, the fastest is reported")
+    parser.add_argument("--output", default=None, help="Optional CSV file for the report")
+    args = parser.parse_args()
+
+    numerical_features = ["average_rating", "ratings_count", "text_reviews_count"]
+    df = load_and_clean_data(args.data)
+    train_df, val_df = train_test_split(df, test_size=0.2, random_state=42)
+    combined_features, tfidf, scaler = prepare_features(train_df, numerical_features)
+    val_combined = transform_features(val_df, tfidf, scaler, numerical_features)
+    n_queries = val_combined.shape[0]
+
+    # Relevance is always judged on the uncompressed similarities, so every row ranks the same items
+    n_relevant = np.zeros(n_queries, dtype=np.int64)
+    baseline = TopKEvaluator(k=args.k)
+
+    def observe(start, scores, top_scores):
+        n_relevant[start:start + len(scores)] = (scores > baseline.similarity_threshold).sum(axis=1)
+        baseline.observe_block(start, scores, top_scores)
+
+    _, exact_scores = topk_similarity(val_combined, combined_features, k=args.k, on_block=observe)
+    exact_s = min(_timed(lambda: topk_similarity(val_combined, combined_features, k=args.k))
+                  for _ in range(args.repeat))
+    metrics = baseline.result()
+    baseline_bytes = combined_features.data.nbytes + combined_features.indices.nbytes \
+        + combined_features.indptr.nbytes
+    rows = [{
+        "rank": combined_features.shape[1],
+        "dtype": "sparse float64",
+        "fit_s": 0.0,
+        "item_bytes": baseline_bytes,
+        "projection_bytes": 0,
+        "compression": 1.0,
+        "queries_per_s": round(n_queries / exact_s, 1),
+        f"map@{args.k}": round(metrics[f"map@{args.k}"], 4),
+        f"recall@{args.k}": 1.0,
+    }]
+    print(f"items: {combined_features.shape[0]}, queries: {n_queries}, dimensions: {combined_features.shape[1]}")
+
+    for rank in args.ranks:
+        for dtype in args.dtypes:
+            start = time.perf_counter()
+            index = CompressedIndex(rank=rank, dtype=dtype).fit(combined_features)
+            fit_s = time.perf_counter() - start
+            indices, _ = index.search(val_combined, k=args.k)
+            search_s = min(_timed(lambda: index.search(val_combined, k=args.k)) for _ in range(args.repeat))
+
+            # Rank by the compressed scores, judge by the exact ones
+            found = exact_scores_of(val_combined, combined_features, indices)
+            evaluator = TopKEvaluator(k=args.k)
+            evaluator.update(found, n_relevant)
+            rows.append({
+                "rank": index.codes_.shape[1],
+                "dtype": dtype,
+                "fit_s": round(fit_s, 3),
+                "item_bytes": index.memory_bytes,
+                "projection_bytes": index.projection_bytes,
+                "compression": round(baseline_bytes / index.memory_bytes, 1),
+                "queries_per_s": round(n_queries / search_s, 1),
+                f"map@{args.k}": round(evaluator.result()[f"map@{args.k}"], 4),
+                f"recall@{args.k}": round(recall_at_k(found, exact_scores), 4),
+            })
+
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+def _timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -1,141 +1,471 @@
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from pyspark import SparkConf
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import date_format,split,rank
-from pyspark.sql.window import Window
-import pandas as pd
+from pyspark.sql import Window
+from pyspark.sql.functions import coalesce, col, count, date_format, row_number, split
+from pyspark.sql.types import (DateType, DoubleType, IntegerType, LongType, StringType, StructField,
+                               StructType)
 
-spark = SparkSession.builder.config(conf = SparkConf()).getOrCreate()
+import aggregates
+import local_backend
+import profiler
+from aggregates import (AUTHOR_ATTRIBUTIONS, BASE_KEYS, DIMENSIONS, author_dimension_state, merge_states,
+                        partial_state, read_author_dimension, read_state)
+from local_backend import (LOCAL_ANALYSES, LOCAL_MAX_MB, LocalContext, choose_backend, is_local_path,
+                           write_spark_csv)
+from result_cache import ResultCache, code_digests
 
-# 使用spark读取csv文件，创建dataframe
-books_df = spark.read.csv("hdfs://linux01:8020/user/root/input/books_cleaned.csv", header=True, inferSchema=True)
-# 确保所有数据在同一个分区以便于后续操作
-books_df = books_df.repartition(1)
-# 显示数据的前10行
-books_df.show(10)
+INPUT_PATH = "hdfs://linux01:8020/user/root/input/books_cleaned.csv"
+OUTPUT_DIR = "result"
+TOP_N = 10
 
-# 创建视图
-books_df.createOrReplaceTempView("books")
+# 显式声明books_cleaned的schema，不再用inferSchema多扫描一遍数据
+BOOKS_SCHEMA = StructType([
+    StructField("bookID", LongType()),
+    StructField("title", StringType()),
+    StructField("authors", StringType()),
+    StructField("average_rating", DoubleType()),
+    StructField("isbn", StringType()),
+    StructField("isbn13", LongType()),
+    StructField("language_code", StringType()),
+    StructField("num_pages", LongType()),
+    StructField("ratings_count", LongType()),
+    StructField("text_reviews_count", LongType()),
+    StructField("publication_date", DateType()),
+    StructField("publisher", StringType()),
+])
+# datapreprocess.py --parquet写出的数据集多一个分区列publication_year(另一个分区列是language_code)
+BOOKS_PARQUET_SCHEMA = StructType(BOOKS_SCHEMA.fields + [StructField("publication_year", IntegerType())])
+# editions.py写出的bookID -> work_id映射
+EDITIONS_SCHEMA = StructType([StructField("bookID", LongType()), StructField("work_id", LongType())])
+# 分析用到的列，缓存时只保留这些列
+ANALYSIS_COLUMNS = ["bookID", "title", "first_author", "average_rating", "language_code", "num_pages",
+                    "ratings_count", "text_reviews_count", "publication_date", "publisher", "year"]
 
 
-##---- 1.前10本最受关注的书籍(text_reviews_count)
-top_10_text=spark.sql("SELECT bookID,title,SUBSTRING_INDEX(authors, '/', 1) AS first_author,average_rating,language_code,text_reviews_count,publication_date \
-                      FROM books \
-                      ORDER BY text_reviews_count DESC")
-top_10_text.show(n=10,truncate=False)
-print("## Top 10 text_reviews_count\n")
+def resolve_format(input_path, input_format="auto"):
+    # auto表示以.csv结尾的路径按csv读取，否则按Parquet读取
+    if input_format == "auto":
+        return "csv" if input_path.rstrip("/").endswith(".csv") else "parquet"
+    return input_format
+
+
+def read_books(spark, input_path, input_format="auto"):
+    # 按声明的schema读取csv或Parquet(本地路径或HDFS都可以)，并派生first_author和year两列
+    if resolve_format(input_path, input_format) == "csv":
+        books_df = spark.read.schema(BOOKS_SCHEMA).csv(input_path, header=True)
+    else:
+        books_df = spark.read.schema(BOOKS_PARQUET_SCHEMA).parquet(input_path)
+    return books_df.withColumn("first_author", split(books_df["authors"], "/").getItem(0)) \
+                   .withColumn("year", date_format(books_df["publication_date"], "yyyy"))
+
+
+def load_books(books_df, editions_df=None):
+    # 不再repartition(1)，保留按输入切分的分区以便并行计算
+    # 只缓存分析需要的列，后续所有分析都从内存读取，不再重复扫描源数据
+    # 指定了版本映射时多一列work_id，不在映射中的书自成一个作品
+    books_df = books_df.select(*ANALYSIS_COLUMNS)
+    if editions_df is not None:
+        books_df = books_df.join(editions_df, "bookID", "left") \
+                           .withColumn("work_id", coalesce(col("work_id"), col("bookID")))
+    return books_df.cache()
+
+
+def one_per_work(ctx, df, column, ascending=False):
+    # 指定了版本映射时每个作品只保留按column排在最前的版本(并列时取bookID最小的)，前N名中不会出现同一作品的多个版本
+    # 窗口按work_id分区，各分区独立排序，不会把数据移到单个分区
+    if not ctx.editions:
+        return df
+    order = col(column).asc() if ascending else col(column).desc()
+    first = row_number().over(Window.partitionBy("work_id").orderBy(order, col("bookID")))
+    return df.withColumn("edition_rank", first).filter(col("edition_rank") == 1).drop("edition_rank")
+
+
+def build_base_agg(books_df, keys=BASE_KEYS):
+    # 按(publisher, language_code, year, first_author)预聚合，保存可再汇总的部分结果(见aggregates.py)
+    # 分析3、4、6、7、10都在这张较小的表上再次汇总，不再扫描明细数据
+    # 使用作者维度时作者聚合不从这张表上卷，去掉first_author后表的行数只与出版社、语言和年份的组合有关
+    # 缓存的表不会被AQE合并分区，因此按明细数据的分区数合并，避免200个小分区
+    return partial_state(books_df, keys) \
+                   .coalesce(books_df.rdd.getNumPartitions()) \
+                   .cache()
+
+
+def top_n_with_ties(df, column, n):
+    # 与rank().over(Window.orderBy(column.desc())) <= n完全相同的结果，但不把数据移到单个分区
+    # 先用orderBy+limit(TakeOrderedAndProject，每个分区取前n再合并)求第n大的值作为阈值，再按阈值过滤
+    # 排名<=n等价于严格大于它的行少于n行，即值>=第n大的值；值并列时全部保留，与rank()一致
+    top_values = [row[0] for row in df.select(column).where(col(column).isNotNull())
+                                        .orderBy(col(column).desc()).limit(n).collect()]
+    if len(top_values) < n:
+        # 非空值不足n个时，空值的排名也不超过n，全部保留
+        return df
+    return df.filter(col(column) >= top_values[-1])
+
+
+_print_lock = threading.Lock()
+
+
+def save_result(df, name, output_dir, show_rows=20, title=None):
+    # 结果只计算一次：先缓存，写文件时计算并填充缓存，展示的行直接读缓存
+    # 结果集都很小，合并为一个分区写出(coalesce不打乱已排好的顺序)
+    result = df.coalesce(1).cache()
+    result.write.csv(f"{output_dir}/{name}", mode='overwrite')
+    preview = result.limit(show_rows).toPandas().to_string(index=False)
+    result.unpersist()
+    # 多个分析并发运行，整段输出加锁打印，避免互相穿插
+    with _print_lock:
+        print(f"{title or name}\n{preview}\n")
+
+
+def save_local_result(df, name, output_dir, show_rows=20, title=None):
+    # 本地后端的结果是pandas DataFrame，按Spark的csv格式写出
+    write_spark_csv(df, f"{output_dir}/{name}")
+    preview = df.head(show_rows).to_string(index=False)
+    with _print_lock:
+        print(f"{title or name}\n{preview}\n")
+
+
+class AnalysisContext:
+    # 各分析共用的中间结果(源数据、缓存的明细、预聚合表、前1000本书)，第一次使用时构建，线程安全
+    def __init__(self, spark, input_path=INPUT_PATH, input_format="auto", state_dir=None, author_dir=None,
+                 attribution="first", editions=None):
+        self.spark = spark
+        self.input_path = input_path
+        self.input_format = resolve_format(input_path, input_format)
+        self.state_dir = state_dir
+        # 作者维度目录(datapreprocess.py --authors)和作者归属方式，author_column为结果中作者列的名称
+        self.author_dir = author_dir
+        self.attribution = attribution
+        self.author_column = AUTHOR_ATTRIBUTIONS[attribution]
+        self.base_keys = [k for k in BASE_KEYS if k != "first_author"] if author_dir else BASE_KEYS
+        # editions.py写出的版本映射，分析1、2、5每个作品只列出一个版本
+        self.editions = editions
+        self._resources = {}
+        self._lock = threading.RLock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = RESOURCES[name](self)
+            return self._resources[name]
+
+    def materialize(self, name):
+        # 在并发提交分析之前把缓存填好，避免多个作业同时扫描同一份源数据
+        df = self.get(name)
+        if df.is_cached:
+            df.count()
+
+    def release(self):
+        for df in self._resources.values():
+            if df.is_cached:
+                df.unpersist()
+        self._resources.clear()
+
+
+RESOURCES = {
+    "source": lambda ctx: read_books(ctx.spark, ctx.input_path, ctx.input_format),
+    "books": lambda ctx: load_books(ctx.get("source"), ctx.editions and
+                                    ctx.spark.read.schema(EDITIONS_SCHEMA).csv(ctx.editions, header=True)),
+    "base_agg": lambda ctx: build_base_agg(ctx.get("books"), ctx.base_keys),
+    # 按text_reviews_count排名(rank)在前1000的记录，分布式计算，没有单分区的窗口
+    "top_1000_books": lambda ctx: top_n_with_ties(
+        ctx.get("books").select("publisher", "language_code", "text_reviews_count"),
+        "text_reviews_count", 1000).cache(),
+}
+
+
+def dimension_state(ctx, dimension):
+    # 指定了作者维度时作者聚合在整数ID上计算(分析7、10会用到两次，缓存并按输入的分区数合并)
+    # 指定了聚合表目录时直接读取增量维护的聚合表，否则从预聚合表上卷
+    if dimension == "author" and ctx.author_dir:
+        books = ctx.get("books")
+        authors_df, bridge_df = read_author_dimension(ctx.spark, ctx.author_dir)
+        state = author_dimension_state(books, authors_df, bridge_df, ctx.attribution)
+        return state.coalesce(books.rdd.getNumPartitions()).cache()
+    if ctx.state_dir:
+        return read_state(ctx.spark, ctx.state_dir, dimension)
+    return merge_states(ctx.get("base_agg"), DIMENSIONS[dimension])
 
-top_10_text.write.csv("result/top_10_text.csv",mode='overwrite') # 文件写入hdfs的result中
+
+for _dimension in DIMENSIONS:
+    RESOURCES[f"{_dimension}_state"] = lambda ctx, dimension=_dimension: dimension_state(ctx, dimension)
+
+
+class Analysis:
+    # 一个命名的分析作业：build根据AnalysisContext返回结果DataFrame，needs为用到的共享中间结果
+    def __init__(self, name, output, title, build, needs):
+        self.name = name
+        self.output = output
+        self.title = title
+        self.build = build
+        self.needs = needs
+
+
+ANALYSES = {}
+
+
+def register(name, output, title, needs=("books",)):
+    def wrap(build):
+        ANALYSES[name] = Analysis(name, output, title, build, needs)
+        return build
+    return wrap
+
+
+##---- 1.前10本最受关注的书籍(text_reviews_count)
+@register("top_10_text", "top_10_text.csv", "## Top 10 text_reviews_count")
+def top_10_text(ctx):
+    # orderBy+limit会被优化为TakeOrderedAndProject(每个分区取top-k再合并)，不做全局排序
+    return one_per_work(ctx, ctx.get("books"), "text_reviews_count") \
+        .select("bookID", "title", "first_author", "average_rating", "language_code", "text_reviews_count",
+                "publication_date") \
+        .orderBy(col("text_reviews_count").desc()).limit(TOP_N)
 
 
 ##---- 2.前10个最长篇幅的书籍（num_pages）
-top_10_numpages=spark.sql("SELECT bookID,title,SUBSTRING_INDEX(authors, '/', 1) AS first_author,average_rating,language_code,num_pages,publication_date \
-                          FROM books \
-                          ORDER BY num_pages DESC")
-top_10_numpages.show(n=10,truncate=False)
-print("## Top 10 num_pages\n")
-top_10_numpages.write.csv("result/top_10_numpages.csv",mode='overwrite')
+@register("top_10_numpages", "top_10_numpages.csv", "## Top 10 num_pages")
+def top_10_numpages(ctx):
+    return one_per_work(ctx, ctx.get("books"), "num_pages") \
+        .select("bookID", "title", "first_author", "average_rating", "language_code", "num_pages",
+                "publication_date") \
+        .orderBy(col("num_pages").desc()).limit(TOP_N)
 
 
 ##---- 3.不同出版社出版的书籍数量，统计前50个
-pubulisher_books_num=spark.sql("SELECT publisher,COUNT(*) as books_num \
-                               FROM books \
-                               GROUP BY publisher \
-                               ORDER BY books_num DESC")
-pubulisher_books_num.show(truncate=False)
-print("## Pubulisher books num\n")
-pubulisher_books_num.write.csv("result/pubulisher_books_num.csv",mode='overwrite')
+@register("pubulisher_books_num", "pubulisher_books_num.csv", "## Pubulisher books num",
+          needs=("publisher_state",))
+def pubulisher_books_num(ctx):
+    return ctx.get("publisher_state").select("publisher", "books_num").orderBy(col("books_num").desc())
 
 
 ##---- 4.不同语言的书籍数量
-language_books_num=spark.sql("SELECT language_code,COUNT(*) as books_num \
-                             FROM books \
-                             GROUP BY language_code \
-                             ORDER BY books_num DESC")
-language_books_num.show(truncate=False)
-print("## Language books num\n")
-language_books_num.write.csv("result/language_books_num.csv",mode='overwrite')
+@register("language_books_num", "language_books_num.csv", "## Language books num", needs=("language_state",))
+def language_books_num(ctx):
+    return ctx.get("language_state").select("language_code", "books_num").orderBy(col("books_num").desc())
 
 
 ##---- 5.前10本最不受关注的高分书籍(评分在4.5分以上，评分人数超过1万，评论数少于200) —— 冷门高分书籍
-top_10_high_score=spark.sql("SELECT bookID,title,SUBSTRING_INDEX(authors, '/', 1) AS first_author,average_rating,language_code,ratings_count,text_reviews_count,publication_date \
-                            FROM books \
-                            where average_rating>4.5 and ratings_count>=10000 and text_reviews_count<=300 \
-                            ORDER BY text_reviews_count ASC")
-top_10_high_score.show(n=10,truncate=False)
-print("## Top 10 high score\n")
-top_10_high_score.write.csv("result/top_10_high_score.csv",mode='overwrite')
+@register("top_10_high_score", "top_10_high_score.csv", "## Top 10 high score")
+def top_10_high_score(ctx):
+    # Parquet输入直接查询源数据，过滤条件和列裁剪下推到文件扫描，按row group统计跳过不满足条件的数据
+    # 需要按作品去重时源数据中没有work_id，使用缓存的明细
+    gem_source = ctx.get("source") if ctx.input_format == "parquet" and not ctx.editions else ctx.get("books")
+    gems = gem_source.filter("average_rating>4.5 and ratings_count>=10000 and text_reviews_count<=300")
+    return one_per_work(ctx, gems, "text_reviews_count", ascending=True) \
+                     .select("bookID", "title", "first_author", "average_rating", "language_code",
+                             "ratings_count", "text_reviews_count", "publication_date") \
+                     .orderBy(col("text_reviews_count").asc()).limit(TOP_N)
 
 
 ##---- 6.出版书籍的数量与时间（年份）的关系
-# 从publication_date列中提取年份并创建一个新列year
-books_df_with_year = books_df.withColumn("year",  date_format(books_df["publication_date"], "yyyy"))
-# 使用带有年份列的DataFrame创建视图
-books_df_with_year.createOrReplaceTempView("books_with_year")
-books_df_with_year.show(n=10)
-# 构造sql
-relation_booknum_year=spark.sql("SELECT year,COUNT(*) as books_num FROM books_with_year GROUP BY year ORDER BY year ASC")
-relation_booknum_year.show(truncate=False)
-print("## Relation_booknum_year\n")
-relation_booknum_year.write.csv("result/relation_booknum_year",mode='overwrite')
-
+@register("relation_booknum_year", "relation_booknum_year", "## Relation_booknum_year", needs=("year_state",))
+def relation_booknum_year(ctx):
+    return ctx.get("year_state").select("year", "books_num").orderBy(col("year").asc())
 
 
 ##---- 7.不同作者的书的平均评分(sum(average_rating*ratings_count)/sum(ratings_count))
-# 从authors列中提取年份并创建一个新列first_author
-books_df_with_first_author = books_df.withColumn("first_author",split(books_df["authors"], "/").getItem(0))
-# 使用带有第一作者列的DataFrame创建视图
-books_df_with_first_author.createOrReplaceTempView("books_df_with_first_author")
-books_df_with_first_author.show(n=10)
-# 构造sql
-avg_rate_author=spark.sql("SELECT first_author,SUM(average_rating*ratings_count)/SUM(ratings_count) as avg_rate,COUNT(*) as books_num \
-                          FROM books_df_with_first_author \
-                          GROUP BY first_author \
-                          ORDER BY books_num DESC,avg_rate DESC")
-avg_rate_author.show(truncate=False)
-print("## avg_attention_author\n")
-avg_rate_author.write.csv("result/avg_rate_author.csv",mode='overwrite')
-
+@register("avg_rate_author", "avg_rate_author.csv", "## avg_attention_author", needs=("author_state",))
+def avg_rate_author(ctx):
+    return ctx.get("author_state").select(ctx.author_column,
+                                          (col("rating_weight") / col("ratings_sum")).alias("avg_rate"),
+                                          "books_num") \
+                                  .orderBy(col("books_num").desc(), col("avg_rate").desc())
 
 
 ##---- 8.前1000个最受关注的书籍数量与出版社的关系
-# 定义一个窗口用于排名
-windowSpec = Window.orderBy(books_df_with_first_author["text_reviews_count"].desc())
-# 计算每行的排名
-books_df_ranked = books_df_with_first_author.withColumn("rank", rank().over(windowSpec))
-# 提取排名在前1000的记录
-top_1000_books = books_df_ranked.filter(books_df_ranked["rank"] <= 1000).drop("rank")
-# 使用筛选后的DataFrame创建视图
-top_1000_books.createOrReplaceTempView("top_1000_books_by_reviews")
-top_1000_books.show(n=10)
-# 构造sql
-relation_ratebooknum_publisher=spark.sql("SELECT publisher,COUNT(*) as ratebooks_num FROM top_1000_books_by_reviews GROUP BY publisher ORDER BY ratebooks_num DESC")
-relation_ratebooknum_publisher.show(truncate=False)
-print("## relation_ratebooknum_publisher\n")
-relation_ratebooknum_publisher.write.csv("result/relation_ratebooknum_publisher.csv",mode='overwrite')
-
+@register("relation_ratebooknum_publisher", "relation_ratebooknum_publisher.csv",
+          "## relation_ratebooknum_publisher", needs=("top_1000_books",))
+def relation_ratebooknum_publisher(ctx):
+    return ctx.get("top_1000_books").groupBy("publisher").agg(count("*").alias("ratebooks_num")) \
+                                    .orderBy(col("ratebooks_num").desc())
 
 
 ##---- 9.前1000个最受关注的书籍数量与语言的关系
-# 沿用前面的视图top_1000_books_by_reviews
-relation_ratebooknum_language=spark.sql("SELECT language_code,COUNT(*) as ratebooks_num \
-                                        FROM top_1000_books_by_reviews \
-                                        GROUP BY language_code \
-                                        ORDER BY ratebooks_num DESC")
-relation_ratebooknum_language.show(truncate=False)
-print("## relation_ratebooknum_language\n")
-relation_ratebooknum_language.write.csv("result/relation_ratebooknum_language.csv",mode='overwrite')
-
+@register("relation_ratebooknum_language", "relation_ratebooknum_language.csv",
+          "## relation_ratebooknum_language", needs=("top_1000_books",))
+def relation_ratebooknum_language(ctx):
+    # 沿用缓存的top_1000_books
+    return ctx.get("top_1000_books").groupBy("language_code").agg(count("*").alias("ratebooks_num")) \
+                                    .orderBy(col("ratebooks_num").desc())
 
 
 ##---- 10.不同作者的书的平均受关注程度(sum(text_reviews_count)/COUNT(*))
-# 沿用前面的视图books_df_with_first_author
-avg_attention_author=spark.sql("SELECT first_author,COUNT(*) as books_num,SUM(text_reviews_count)/COUNT(*) as avg_attention \
-                               FROM books_df_with_first_author \
-                               GROUP BY first_author \
-                               ORDER BY avg_attention DESC,books_num DESC")
-avg_attention_author.show(truncate=False)
-print("## avg_attention_author\n")
-avg_attention_author.write.csv("result/avg_attention_author.csv",mode='overwrite')
+@register("avg_attention_author", "avg_attention_author.csv", "## avg_attention_author",
+          needs=("author_state",))
+def avg_attention_author(ctx):
+    return ctx.get("author_state").select(ctx.author_column, "books_num",
+                                          (col("reviews_sum") / col("books_num")).alias("avg_attention")) \
+                                  .orderBy(col("avg_attention").desc(), col("books_num").desc())
+
+
+def cache_plan(cache, names, spark, input_path, input_format="auto", state_dir=None, author_dir=None,
+               attribution="first", editions=None):
+    # 计算每个分析的缓存键：所有输入(源数据、版本映射、聚合表、作者维度)的指纹 + 运行选项 + 代码指纹
+    # 两个后端的输出相同，后端不属于键；远程输入在没有spark时无法计算指纹，返回None
+    inputs = {"input": input_path, "editions": editions, "state": state_dir, "authors": author_dir}
+    inputs = {role: cache.fingerprint(path, spark) for role, path in inputs.items() if path}
+    if any(fp is None for fp in inputs.values()):
+        return None
+    options = {"format": resolve_format(input_path, input_format), "attribution": attribution}
+    codes = code_digests([aggregates, sys.modules[__name__], local_backend],
+                         {name: [ANALYSES[name].build, LOCAL_ANALYSES[name]] for name in names})
+    keys = {name: cache.key(inputs, options, codes[name]) for name in names}
+    return keys, inputs, options, codes
+
+
+def stale_analyses(cache, names, plan, refresh=()):
+    # 需要重新计算的分析：没有缓存计划、指定强制刷新、键不同或输出文件已被改动
+    if plan is None:
+        return list(names)
+    keys = plan[0]
+    return [name for name in names if name in refresh or not cache.is_fresh(name, keys[name])]
+
+
+def run_analyses(spark, names=None, input_path=INPUT_PATH, output_dir=OUTPUT_DIR, input_format="auto",
+                 workers=4, state_dir=None, backend="spark", author_dir=None, attribution="first", editions=None,
+                 cache=None, refresh=()):
+    # 运行选中的分析(默认全部)：先准备共享缓存，再用线程池并发提交各个作业
+    # 每个作业使用自己的FAIR调度池，小的聚合不用排在大的排序后面
+    # backend为local时spark可以为None，用local_backend.py中的pandas实现计算，输出的文件相同
+    # 指定cache(result_cache.ResultCache)时，输入、选项和代码都没有变化的分析直接沿用结果目录中的文件，
+    # refresh中的分析总是重新计算；选中的分析都是最新的时spark可以为None
+    names = list(names or ANALYSES)
+    timings = {}
+    plan = None
+    if cache is not None:
+        plan = cache_plan(cache, names, spark, input_path, input_format, state_dir, author_dir, attribution,
+                          editions)
+        stale = stale_analyses(cache, names, plan, refresh)
+        for name in names:
+            if name not in stale:
+                print(f"{ANALYSES[name].title} (cached)\n{cache.preview(name)}\n")
+                timings[name] = "cached"
+        names = stale
+    if not names:
+        cache.save()
+        print("## All results are up to date")
+        return []
+
+    if backend == "local":
+        ctx = LocalContext(input_path, resolve_format(input_path, input_format), state_dir, TOP_N, author_dir,
+                           attribution, editions)
+        builders, save = LOCAL_ANALYSES, save_local_result
+    else:
+        ctx = AnalysisContext(spark, input_path, input_format, state_dir, author_dir, attribution, editions)
+        builders, save = {name: analysis.build for name, analysis in ANALYSES.items()}, save_result
+
+    start = time.perf_counter()
+    # 设置环境变量PIPELINE_PROFILE时记录每个作业的耗时、内存和Spark作业指标(见profiler.py)
+    with profiler.stage("analysis.shared_inputs", spark):
+        for resource in dict.fromkeys(need for name in names for need in ANALYSES[name].needs):
+            ctx.materialize(resource)
+    timings["(shared inputs)"] = time.perf_counter() - start
+
+    def run(analysis):
+        if spark is not None:
+            spark.sparkContext.setLocalProperty("spark.scheduler.pool", analysis.name)
+        job_start = time.perf_counter()
+        with profiler.stage(f"analysis.{analysis.name}", spark):
+            save(builders[analysis.name](ctx), analysis.output, output_dir, title=analysis.title)
+        return time.perf_counter() - job_start
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(run, ANALYSES[name]) for name in names}
+        for name, future in futures.items():
+            try:
+                timings[name] = future.result()
+            except Exception as e:
+                failed.append(name)
+                print(f"## {name} failed: {e}")
+    ctx.release()
+    if cache is not None:
+        # 记录成功的分析由哪些输入和代码生成，失败的分析从清单中删除
+        if plan is not None:
+            keys, inputs, options, codes = plan
+            for name in names:
+                if name not in failed:
+                    cache.record(name, keys[name], ANALYSES[name].output, inputs, options, codes[name],
+                                 timings[name])
+        cache.invalidate(failed)
+        cache.save()
+
+    print("## Job timings")
+    for name, seconds in timings.items():
+        print(f"{name:<34}{seconds:>8}" if isinstance(seconds, str) else f"{name:<34}{seconds:>8.2f}s")
+    print(f"{'(total)':<34}{time.perf_counter() - start:>8.2f}s")
+    return failed
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图书数据的分析报告(Spark或本地pandas后端)")
+    parser.add_argument("jobs", nargs="*", help="要运行的分析名称，默认全部运行，--list查看可选名称")
+    parser.add_argument("--list", action="store_true", help="列出所有分析名称")
+    parser.add_argument("--input", default=INPUT_PATH, help="books_cleaned.csv或Parquet数据集的路径(HDFS或本地)")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="结果输出目录")
+    parser.add_argument("--format", default="auto", choices=["auto", "csv", "parquet"],
+                        help="输入格式，默认按路径后缀判断")
+    parser.add_argument("--master", default=None,
+                        help="Spark master，例如local[*]为本地模式、yarn为集群模式，默认使用spark-submit的设置")
+    parser.add_argument("--workers", type=int, default=4, help="同时提交的分析作业数")
+    parser.add_argument("--state", default=None,
+                        help="aggregates.py维护的聚合表目录，指定后分析3、4、6、7、10直接读取聚合表")
+    parser.add_argument("--authors", default=None,
+                        help="datapreprocess.py --authors写出的作者维度目录，指定后分析7、10按整数作者ID连接和分组")
+    parser.add_argument("--author-attribution", default="first", choices=list(AUTHOR_ATTRIBUTIONS),
+                        help="作者归属：first只计第一作者，all把书计入每一位作者(需要--authors)")
+    parser.add_argument("--editions", default=None,
+                        help="editions.py写出的bookID,work_id映射，指定后分析1、2、5中每个作品只列出一个版本")
+    parser.add_argument("--backend", default="auto", choices=["auto", "spark", "local"],
+                        help="执行后端：local为不启动JVM的pandas实现，auto在本地小数据上选local，其余选spark")
+    parser.add_argument("--local-max-mb", type=float, default=LOCAL_MAX_MB,
+                        help="auto时使用本地后端的最大输入大小(MB)")
+    parser.add_argument("--refresh", nargs="*", default=None,
+                        help="强制重新计算这些分析(不给名称时为全部)，即使输入和代码都没有变化")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用结果缓存，所有选中的分析都重新计算，也不更新清单")
+    args = parser.parse_args()
 
+    if args.list:
+        for name, analysis in ANALYSES.items():
+            print(f"{name:<34}-> {args.output}/{analysis.output}")
+        sys.exit(0)
+    unknown = [name for name in args.jobs if name not in ANALYSES]
+    if unknown:
+        parser.error(f"未知的分析: {', '.join(unknown)}")
+    if args.author_attribution == "all" and not args.authors:
+        parser.error("--author-attribution all需要--authors")
+    unknown = [name for name in args.refresh or [] if name not in ANALYSES]
+    if unknown:
+        parser.error(f"未知的分析: {', '.join(unknown)}")
+    refresh = list(ANALYSES) if args.refresh == [] else args.refresh or []
+    # 结果缓存的清单保存在结果目录中，结果目录不在本地时不使用缓存
+    cache = ResultCache(args.output) if not args.no_cache and is_local_path(args.output) else None
 
+    backend = args.backend
+    if backend == "auto":
+        # 显式指定了--master时按用户的意思使用Spark
+        backend = "spark" if args.master else choose_backend(args.input, [args.output, args.state, args.authors, args.editions],
+                                                             args.local_max_mb)
+    print(f"## Backend: {backend}")
+    spark = None
+    # 选中的分析都是最新的时不启动SparkSession(远程输入需要spark才能计算指纹，总是启动)
+    jobs = args.jobs or list(ANALYSES)
+    up_to_date = cache is not None and not stale_analyses(
+        cache, jobs, cache_plan(cache, jobs, None, args.input, args.format, args.state, args.authors,
+                                args.author_attribution, args.editions), refresh)
+    if backend == "spark" and not up_to_date:
+        start = time.perf_counter()
+        conf = SparkConf().set("spark.scheduler.mode", "FAIR")
+        if args.master:
+            conf.setMaster(args.master)
+        spark = SparkSession.builder.config(conf = conf).getOrCreate()
+        print(f"## Spark session started in {time.perf_counter() - start:.2f}s")
+    failed = run_analyses(spark, args.jobs, args.input, args.output, args.format, args.workers, args.state,
+                          backend, args.authors, args.author_attribution, args.editions, cache, refresh)
+    sys.exit(1 if failed else 0)
@@ -1,28 +1,45 @@
+import argparse
+import itertools
+import os
+
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
 
-dataFrame = pd.read_csv('books.csv',error_bad_lines=False)
-# 显示前10行 
-print(dataFrame.head(10))
-
-# 去除列名前后的空格
-dataFrame.columns=dataFrame.columns.str.strip()
-
-# 查看数据集信息
-print("\nraw dataFrame:")
-print(dataFrame.info())
+import profiler
+from editions import assign_work_ids, cluster_editions, write_work_ids
+from ingest import IngestStats, iter_books_csv, read_books_csv
 
-# 删除空值
-dataFrame_remove_null=dataFrame.dropna()
-print("\ndataFrame_remove_null:")
-print(dataFrame_remove_null.info())
-dataFrame=dataFrame_remove_null
+# 清洗后数据的Parquet schema，按language_code和出版年份分区
+BOOKS_PARQUET_SCHEMA = pa.schema([
+    ('bookID', pa.int64()),
+    ('title', pa.string()),
+    ('authors', pa.string()),
+    ('average_rating', pa.float64()),
+    ('isbn', pa.string()),
+    ('isbn13', pa.int64()),
+    ('language_code', pa.string()),
+    ('num_pages', pa.int64()),
+    ('ratings_count', pa.int64()),
+    ('text_reviews_count', pa.int64()),
+    ('publication_date', pa.date32()),
+    ('publisher', pa.string()),
+    ('publication_year', pa.int32()),
+])
+PARTITION_COLUMNS = ['language_code', 'publication_year']
 
-# 删除重复值
-dataFrame_remove_dup=dataFrame.drop_duplicates(keep='first')
-print("\ndataFrame_remove_dup:")
-print(dataFrame_remove_dup.info())
-dataFrame=dataFrame_remove_dup
+# 作者维度：authors为(作者ID, 作者名)，book_authors为书籍与作者的桥表，position从0开始(0为第一作者)
+AUTHORS_SCHEMA = pa.schema([
+    ('author_id', pa.int32()),
+    ('author', pa.string()),
+])
+BOOK_AUTHORS_SCHEMA = pa.schema([
+    ('bookID', pa.int64()),
+    ('author_id', pa.int32()),
+    ('position', pa.int16()),
+])
 
 
 # 格式化时间列，由9/16/2006变成2006-9-16
@@ -36,20 +53,278 @@ def convert_date(date_str):
         # 转换失败则返回NaN
         return np.nan
 
-dataFrame['publication_date']=dataFrame['publication_date'].apply(convert_date)
 
-# 删除空值
-dataFrame_remove_null=dataFrame.dropna()
-print("\ndataFrame_remove_null:")
-print(dataFrame_remove_null.info())
-dataFrame=dataFrame_remove_null
+def convert_date_column(dates):
+    # 向量化的日期转换：整列一次to_datetime，不规范的日期变为NaN
+    converted = pd.to_datetime(dates, format='%m/%d/%Y', errors='coerce')
+    return converted.dt.strftime('%Y-%m-%d')
+
+
+class PartitionedParquetWriter:
+    # 将清洗后的数据按显式schema写成Parquet数据集，按language_code和出版年份分区(hive风格目录)
+    # path可以是本地路径或hdfs://；每个分区在整个运行中只写一个文件，分块写入也不会产生大量小文件
+    # 各分区的行先缓存，缓存的总行数达到buffer_rows时每个分区追加一个row group，内存与输入大小无关
+    def __init__(self, path, buffer_rows=500000):
+        self.filesystem, self.root = pafs.FileSystem.from_uri(path if '://' in path else os.path.abspath(path))
+        # 开始写之前清空旧数据
+        self.filesystem.delete_dir_contents(self.root, missing_dir_ok=True)
+        self.schema = pa.schema([f for f in BOOKS_PARQUET_SCHEMA if f.name not in PARTITION_COLUMNS])
+        self.buffer_rows = buffer_rows
+        self.writers = {}
+        self.buffers = {}
+        self.buffered = 0
+
+    def write(self, dataFrame):
+        dates = pd.to_datetime(dataFrame['publication_date'], format='%Y-%m-%d')
+        dataFrame = dataFrame.assign(publication_date=dates.dt.date, publication_year=dates.dt.year)
+        for key, group in dataFrame.groupby(PARTITION_COLUMNS):
+            table = pa.Table.from_pandas(group, schema=BOOKS_PARQUET_SCHEMA, preserve_index=False)
+            self.buffers.setdefault(key, []).append(table.drop(PARTITION_COLUMNS))
+            self.buffered += len(group)
+        if self.buffered >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        for (language_code, year), tables in self.buffers.items():
+            writer = self.writers.get((language_code, year))
+            if writer is None:
+                partition_dir = f"{self.root}/language_code={language_code}/publication_year={year}"
+                self.filesystem.create_dir(partition_dir)
+                writer = pq.ParquetWriter(f"{partition_dir}/part-00000.parquet", self.schema,
+                                          filesystem=self.filesystem)
+                self.writers[(language_code, year)] = writer
+            writer.write_table(pa.concat_tables(tables))
+        self.buffers.clear()
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
+def write_parquet(dataFrame, path):
+    # 一次写出整个DataFrame
+    writer = PartitionedParquetWriter(path)
+    writer.write(dataFrame)
+    writer.close()
+
+
+class AuthorDictionary:
+    # 作者名 -> 整数ID，按第一次出现的顺序从1开始编号；分块处理时各块共用一个字典，ID跨块保持一致
+    def __init__(self):
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, names):
+        # 返回(每个名字的ID数组, 本次新增作者的DataFrame)
+        codes = names.map(self.ids)
+        new_names = pd.unique(names[codes.isna()])
+        new_ids = np.arange(len(self.ids) + 1, len(self.ids) + 1 + len(new_names), dtype=np.int32)
+        self.ids.update(zip(new_names, new_ids.tolist()))
+        if len(new_names):
+            codes = names.map(self.ids)
+        new_authors = pd.DataFrame({'author_id': new_ids, 'author': new_names})
+        return codes.to_numpy(dtype=np.int32), new_authors
+
+
+def split_authors(dataFrame, dictionary):
+    # 把authors列按/拆成一行一个作者，去掉名字前后的空格；同一本书中重复的作者只保留第一次出现
+    # 先去重再编号，position在每本书内从0开始连续
+    names = dataFrame.set_index('bookID')['authors'].str.split('/').explode().str.strip()
+    names = names[names.notna() & (names != '')]
+    bridge = pd.DataFrame({'bookID': names.index.to_numpy(dtype=np.int64), 'author': names.to_numpy()})
+    bridge = bridge.drop_duplicates(['bookID', 'author'], keep='first')
+    bridge['position'] = bridge.groupby('bookID', sort=False).cumcount().astype(np.int16)
+    author_ids, new_authors = dictionary.encode(bridge['author'])
+    bridge = pd.DataFrame({'bookID': bridge['bookID'].to_numpy(), 'author_id': author_ids,
+                           'position': bridge['position'].to_numpy()})
+    return new_authors, bridge
+
+
+def write_author_dimension(new_authors, bridge, path, part=0):
+    # 作者维度写成两个Parquet目录path/authors和path/book_authors，分块时每块追加一个文件
+    # 用Parquet而不是CSV：整数列读取时不需要解析，作者名中的引号和逗号也不需要转义
+    filesystem, root = pafs.FileSystem.from_uri(path if '://' in path else os.path.abspath(path))
+    for name, frame, schema in (('authors', new_authors, AUTHORS_SCHEMA),
+                                ('book_authors', bridge, BOOK_AUTHORS_SCHEMA)):
+        if part == 0:
+            filesystem.delete_dir_contents(f"{root}/{name}", missing_dir_ok=True)
+            filesystem.create_dir(f"{root}/{name}")
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        pq.write_table(table, f"{root}/{name}/part-{part:05d}.parquet", filesystem=filesystem)
+
+
+def clean_books(src='books.csv', dst='books_cleaned.csv', parquet_path=None, author_path=None, threads=None,
+                editions_path=None):
+    # 设置环境变量PIPELINE_PROFILE时记录各阶段的耗时和内存(见profiler.py)
+    with profiler.stage("preprocess.load_csv"):
+        # 多线程读取，字段数不对的行先尝试修复再丢弃(见ingest.py)
+        stats = IngestStats()
+        dataFrame = read_books_csv(src, threads=threads, stats=stats)
+    print(stats)
+    for line in stats.dropped_lines:
+        print(f"dropped: {line}")
+    # 显示前10行 
+    print(dataFrame.head(10))
+
+    # 去除列名前后的空格
+    dataFrame.columns=dataFrame.columns.str.strip()
+
+    # 查看数据集信息
+    print("\nraw dataFrame:")
+    print(dataFrame.info())
+
+    with profiler.stage("preprocess.dedup"):
+        # 删除空值
+        dataFrame_remove_null=dataFrame.dropna()
+        print("\ndataFrame_remove_null:")
+        print(dataFrame_remove_null.info())
+        dataFrame=dataFrame_remove_null
+
+        # 删除重复值
+        dataFrame_remove_dup=dataFrame.drop_duplicates(keep='first')
+        print("\ndataFrame_remove_dup:")
+        print(dataFrame_remove_dup.info())
+        dataFrame=dataFrame_remove_dup
+
+    with profiler.stage("preprocess.date_conversion"):
+        dataFrame['publication_date']=dataFrame['publication_date'].apply(convert_date)
+
+    # 删除空值
+    dataFrame_remove_null=dataFrame.dropna()
+    print("\ndataFrame_remove_null:")
+    print(dataFrame_remove_null.info())
+    dataFrame=dataFrame_remove_null
+
+
+    # 查看language_code的数据有没有异常值
+    print(dataFrame['language_code'].unique())
+
+
+    # 将处理后的数据写入新的csv文件中
+    with profiler.stage("preprocess.write_csv"):
+        dataFrame.to_csv(dst,encoding='utf-8',index=False)
+    if parquet_path:
+        with profiler.stage("preprocess.write_parquet"):
+            write_parquet(dataFrame, parquet_path)
+    if author_path:
+        with profiler.stage("preprocess.author_dimension"):
+            dictionary = AuthorDictionary()
+            new_authors, bridge = split_authors(dataFrame, dictionary)
+            write_author_dimension(new_authors, bridge, author_path)
+        print(f"authors: {len(dictionary)}, book-author pairs: {len(bridge)}")
+    if editions_path:
+        with profiler.stage("preprocess.editions"):
+            # 同一作品的不同版本分配同一个work_id(见editions.py)
+            work_ids, edition_stats = cluster_editions(dataFrame)
+            write_work_ids(dataFrame['bookID'].to_numpy(dtype=np.int64), work_ids, editions_path)
+        print(f"books: {edition_stats['books']}, works: {edition_stats['works']}")
+
+
+class RowHashSet:
+    # 紧凑的行哈希集合：用有序的uint64数组代替python set，每行只占8字节
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add_new(self, hashes):
+        # 返回布尔掩码：哪些行是第一次出现(块内和跨块都去重)，并把它们加入集合
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        first_in_chunk = ~pd.Series(hashes).duplicated(keep='first').to_numpy()
+        if len(self.hashes):
+            pos = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+            seen = self.hashes[pos] == hashes
+        else:
+            seen = np.zeros(len(hashes), dtype=bool)
+        mask = first_in_chunk & ~seen
+        new = np.sort(hashes[mask])
+        self.hashes = np.insert(self.hashes, np.searchsorted(self.hashes, new), new)
+        return mask
+
+
+def clean_books_streaming(src='books.csv', dst='books_cleaned.csv', chunksize=100000, parquet_path=None,
+                          author_path=None, threads=None, editions_path=None):
+    # 流式清洗：按固定行数分块读取，逐块向量化处理后追加写入，峰值内存与输入大小无关
+    # 整数列使用可空的Int64，保证各块类型一致；字段数不对的行先尝试修复再丢弃(见ingest.py)
+    stats = IngestStats()
+    reader = iter_books_csv(src, chunksize, threads=threads, nullable_ints=True, stats=stats)
 
+    seen = RowHashSet()
+    dictionary = AuthorDictionary()
+    parquet_writer = PartitionedParquetWriter(parquet_path) if parquet_path else None
+    rows_in = rows_out = pairs = 0
+    header = True
+    # 各阶段按块累计耗时(见profiler.py)，读取发生在取下一块时
+    chunks = iter(reader)
+    for part in itertools.count():
+        with profiler.stage("preprocess.load_csv"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        rows_in += len(chunk)
+        with profiler.stage("preprocess.dedup"):
+            # 删除空值
+            chunk = chunk.dropna()
+            # 删除重复值(按原始行内容的64位哈希，跨块去重)
+            if len(chunk):
+                chunk = chunk[seen.add_new(pd.util.hash_pandas_object(chunk, index=False).to_numpy())]
+        with profiler.stage("preprocess.date_conversion"):
+            # 格式化时间列，整块一次转换
+            chunk = chunk.assign(publication_date=convert_date_column(chunk['publication_date']))
+            # 删除日期不规范的行
+            chunk = chunk.dropna()
 
-# 查看language_code的数据有没有异常值
-print(dataFrame['language_code'].unique())
+        with profiler.stage("preprocess.write_csv"):
+            chunk.to_csv(dst, encoding='utf-8', index=False, mode='w' if header else 'a', header=header)
+        if parquet_writer:
+            with profiler.stage("preprocess.write_parquet"):
+                parquet_writer.write(chunk)
+        if author_path:
+            with profiler.stage("preprocess.author_dimension"):
+                new_authors, bridge = split_authors(chunk, dictionary)
+                write_author_dimension(new_authors, bridge, author_path, part)
+            pairs += len(bridge)
+        header = False
+        rows_out += len(chunk)
 
+    if parquet_writer:
+        with profiler.stage("preprocess.write_parquet"):
+            parquet_writer.close()
+    print(f"rows read: {rows_in}, rows written: {rows_out}, unique rows hashed: {len(seen)}")
+    print(f"malformed rows repaired: {stats.repaired}, dropped: {stats.dropped}")
+    for line in stats.dropped_lines:
+        print(f"dropped: {line}")
+    if author_path:
+        print(f"authors: {len(dictionary)}, book-author pairs: {pairs}")
+    if editions_path:
+        # 版本聚类需要看到所有的书，在全部写出后读取输出文件的bookID、title、authors三列进行
+        with profiler.stage("preprocess.editions"):
+            _, edition_stats = assign_work_ids(dst, editions_path)
+        print(f"books: {edition_stats['books']}, works: {edition_stats['works']}")
 
-# 将处理后的数据写入新的csv文件中
-dataFrame.to_csv('books_cleaned.csv',encoding='utf-8',index=False)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="清洗books.csv并写出books_cleaned.csv")
+    parser.add_argument('--input', default='books.csv')
+    parser.add_argument('--output', default='books_cleaned.csv')
+    parser.add_argument('--stream', action='store_true', help="分块流式清洗，适用于大文件")
+    parser.add_argument('--chunksize', type=int, default=100000, help="流式清洗每块的行数")
+    parser.add_argument('--threads', type=int, default=None, help="解析csv的线程数，默认为CPU核数")
+    parser.add_argument('--parquet', default=None, help="同时写出分区的Parquet数据集(本地路径或hdfs://)")
+    parser.add_argument('--authors', default=None,
+                        help="同时写出作者维度表和书籍-作者桥表的目录(本地路径或hdfs://)，供dataAnalysis.py --authors使用")
+    parser.add_argument('--editions', default=None,
+                        help="同时把同一作品的不同版本聚类，写出bookID,work_id映射(见editions.py)")
+    args = parser.parse_args()
 
+    if args.stream:
+        clean_books_streaming(args.input, args.output, args.chunksize, args.parquet, args.authors, args.threads,
+                              args.editions)
+    else:
+        clean_books(args.input, args.output, args.parquet, args.authors, args.threads, args.editions)
@@ -0,0 +1,174 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# 版本聚类：同一部作品的不同版本(精装/平装/有声书/再版，标题常带不同的丛书后缀)分配同一个work_id
+# 每本书的特征为规范化标题的词集合加上第一作者，用MinHash签名估计Jaccard相似度，
+# LSH分段(band)只让签名某一段完全相同的书成为候选对，再用签名的一致比例验证，整体复杂度与行数近似线性；
+# 通过验证的书用连通分量合并，work_id取分量中最小的bookID，同样的输入得到同样的work_id
+
+NUM_PERM = 64
+BANDS = 16
+THRESHOLD = 0.8
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+# 标题中的版本说明，不属于作品本身
+EDITION_WORDS = ["edition", "ed", "unabridged", "abridged", "illustrated", "annotated", "revised", "anniversary",
+                 "deluxe", "paperback", "hardcover", "boxed", "set", "vol", "volume", "audio", "cd"]
+
+
+def normalize_titles(titles):
+    # 小写，去掉标题末尾括号中的丛书信息(去掉后没有字母数字时保留原标题)，标点换成空格，按空白切成词
+    # 用pyarrow的字符串函数逐列处理，返回每本书的词列表(ListArray)，版本说明在token_hashes中去掉
+    titles = pc.utf8_lower(pc.fill_null(pa.array(titles, pa.string(), from_pandas=True), ""))
+    stripped = pc.replace_substring_regex(titles, r"\([^()]*\)\s*$", "")
+    titles = pc.if_else(pc.match_substring_regex(stripped, r"[\p{L}\p{N}]"), stripped, titles)
+    titles = pc.replace_substring_regex(titles, r"[^\p{L}\p{N}]+", " ")
+    return pc.utf8_split_whitespace(pc.utf8_trim_whitespace(titles))
+
+
+def normalize_authors(authors):
+    # 第一作者(译者、插图作者等排在后面)，去掉空格和标点，作为一个整体的词
+    authors = pc.fill_null(pa.array(authors, pa.string(), from_pandas=True), "")
+    first = pc.list_element(pc.split_pattern(authors, "/", max_splits=1), 0)
+    return pc.binary_join_element_wise(
+        "author:", pc.replace_substring_regex(pc.utf8_lower(first), r"[^\p{L}\p{N}]+", ""), "")
+
+
+def hash_strings(values):
+    # 字符串数组 -> 32位哈希；只对不同的值计算哈希
+    encoded = pc.dictionary_encode(values).combine_chunks() if isinstance(values, pa.ChunkedArray) \
+        else pc.dictionary_encode(values)
+    dictionary = pd.util.hash_array(encoded.dictionary.to_numpy(zero_copy_only=False)) & MAX_HASH
+    return dictionary[encoded.indices.to_numpy(zero_copy_only=False)]
+
+
+def token_hashes(df):
+    # 每本书的词集合 -> (所有词的32位哈希, 每本书在其中的起止位置)
+    # 重复的词不影响最小哈希值，不需要去重；标题为空的书没有词(不参与聚类)
+    tokens = normalize_titles(df["title"])
+    words = pc.list_flatten(tokens)
+    parents = pc.list_parent_indices(tokens).to_numpy()
+    keep = pc.invert(pc.is_in(words, value_set=pa.array(EDITION_WORDS))).to_numpy(zero_copy_only=False)
+    words, parents = words.filter(pa.array(keep)), parents[keep]
+    lengths = np.bincount(parents, minlength=len(df))
+    has_title = lengths > 0
+    authors = normalize_authors(df["authors"]).filter(pa.array(has_title))
+    hashes = np.concatenate((hash_strings(words), hash_strings(authors)))
+    rows = np.concatenate((parents, np.flatnonzero(has_title)))
+    order = np.argsort(rows, kind="stable")
+    offsets = np.concatenate(([0], np.cumsum(lengths + has_title)))
+    return hashes[order], offsets
+
+
+def minhash_signatures(hashes, offsets, num_perm=NUM_PERM, seed=1):
+    # 每个置换为h(x) = (a*x + b) mod (2^61-1)的低32位，对每本书的词取最小值；没有词的书签名为全最大值
+    # 逐个置换计算，临时数组只有词数那么大
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+    n = len(offsets) - 1
+    signatures = np.full((n, num_perm), MAX_HASH, dtype=np.uint32)
+    nonempty = offsets[:-1] < offsets[1:]
+    if not len(hashes):
+        return signatures
+    for i in range(num_perm):
+        permuted = ((hashes * a[i] + b[i]) % MERSENNE_PRIME) & MAX_HASH
+        signatures[nonempty, i] = np.minimum.reduceat(permuted, offsets[:-1][nonempty])
+    return signatures
+
+
+def candidate_pairs(signatures, bands=BANDS, valid=None):
+    # LSH：签名分成bands段，某一段完全相同的书落在同一个桶里；每个桶内的书与桶中第一本配对
+    # 按段排序找相同的键，不需要python字典，也不需要两两比较
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    index = np.arange(n) if valid is None else np.flatnonzero(valid)
+    left, right = [], []
+    for band in range(bands):
+        part = np.ascontiguousarray(signatures[index, band * rows:(band + 1) * rows])
+        keys = _band_keys(part)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        run = np.repeat(starts, np.diff(np.concatenate((starts, [len(keys)]))))
+        member = np.arange(len(keys)) != run
+        left.append(index[order[run[member]]])
+        right.append(index[order[member]])
+    if not left:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.stack((np.concatenate(left), np.concatenate(right)), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _band_keys(part):
+    # 一段签名合成一个64位的键(不同的段偶尔会得到相同的键，候选对之后还要验证)
+    keys = np.zeros(len(part), dtype=np.uint64)
+    for j in range(part.shape[1]):
+        keys = keys * np.uint64(0x9E3779B97F4A7C15) + part[:, j].astype(np.uint64)
+    return keys
+
+
+def cluster_editions(df, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS, seed=1):
+    # 返回每行的work_id(与df的行一一对应)和统计信息
+    hashes, offsets = token_hashes(df)
+    signatures = minhash_signatures(hashes, offsets, num_perm, seed)
+    left, right = candidate_pairs(signatures, bands, valid=offsets[:-1] < offsets[1:])
+    # 签名中相同位置取值相同的比例是Jaccard相似度的无偏估计
+    similarity = (signatures[left] == signatures[right]).mean(axis=1) if len(left) else np.empty(0)
+    keep = similarity >= threshold
+    n = len(df)
+    graph = coo_matrix((np.ones(keep.sum(), dtype=np.int8), (left[keep], right[keep])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    book_ids = df["bookID"].to_numpy(dtype=np.int64)
+    work_ids = pd.Series(book_ids).groupby(labels).transform("min").to_numpy()
+    stats = {"books": n, "works": int(len(np.unique(work_ids))), "candidate_pairs": int(len(left)),
+             "verified_pairs": int(keep.sum())}
+    return work_ids, stats
+
+
+def read_work_ids(path):
+    # editions.py写出的bookID -> work_id映射
+    return pd.read_csv(path, dtype={"bookID": np.int64, "work_id": np.int64})
+
+
+def write_work_ids(book_ids, work_ids, path):
+    pd.DataFrame({"bookID": book_ids, "work_id": work_ids}).to_csv(path, index=False)
+
+
+def assign_work_ids(src="books_cleaned.csv", dst="editions.csv", threshold=THRESHOLD, num_perm=NUM_PERM,
+                    bands=BANDS):
+    # 读取清洗后的数据(只需要bookID、title、authors三列)，写出bookID,work_id
+    df = pd.read_csv(src, usecols=["bookID", "title", "authors"], dtype={"title": str, "authors": str})
+    work_ids, stats = cluster_editions(df, threshold, num_perm, bands)
+    write_work_ids(df["bookID"].to_numpy(dtype=np.int64), work_ids, dst)
+    return df.assign(work_id=work_ids), stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用MinHash-LSH把同一作品的不同版本聚成一个work_id")
+    parser.add_argument("--input", default="books_cleaned.csv")
+    parser.add_argument("--output", default="editions.csv", help="bookID,work_id映射")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="判定为同一作品的最小Jaccard相似度")
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM, help="MinHash签名的长度")
+    parser.add_argument("--bands", type=int, default=BANDS, help="LSH的段数，num-perm须能被它整除")
+    parser.add_argument("--show", type=int, default=10, help="打印版本最多的几个作品")
+    args = parser.parse_args()
+    if args.num_perm % args.bands:
+        parser.error("--num-perm须能被--bands整除")
+
+    start = time.perf_counter()
+    books, stats = assign_work_ids(args.input, args.output, args.threshold, args.num_perm, args.bands)
+    print(f"books: {stats['books']}, works: {stats['works']}, candidate pairs: {stats['candidate_pairs']}, "
+          f"verified: {stats['verified_pairs']} ({time.perf_counter() - start:.2f}s)")
+    sizes = books["work_id"].value_counts()
+    for work_id in sizes.index[:args.show]:
+        editions = books[books["work_id"] == work_id]
+        print(f"## work {work_id}: {sizes[work_id]} editions")
+        print(editions[["bookID", "title", "authors"]].head(5).to_string(index=False))
@@ -0,0 +1,141 @@
+import threading
+
+import numpy as np
+import scipy.sparse as sp
+
+from topk import topk_from_scores, topk_similarity
+
+
+def exact_scores_of(queries, items, indices):
+    """
+    Uncompressed similarity of every query to the items a search returned for it.
+
+    Parameters:
+    - queries (sparse matrix): Row-normalized query vectors.
+    - items (sparse matrix): Row-normalized item vectors.
+    - indices (numpy array): Item indices per query, n_queries x K; -1 marks a missing
+      neighbour (IVFIndex.search) and gets a score of -inf.
+
+    Returns:
+    - numpy array: Exact cosine similarities, n_queries x K.
+    """
+    found = indices >= 0
+    rows = np.repeat(np.arange(queries.shape[0]), indices.shape[1])[found.ravel()]
+    products = sp.csr_matrix(queries)[rows].multiply(items[indices[found]])
+    scores = np.full(indices.shape, -np.inf)
+    scores[found] = np.asarray(products.sum(axis=1)).ravel()
+    return scores
+
+
+def relevant_counts(queries, items, similarity_threshold=0.5, block_size=1024, n_jobs=None):
+    """
+    Number of items above the relevance threshold for every query, from an exact blocked search.
+
+    Used to judge approximate searches (IVF, compressed vectors) against the same
+    relevant sets as the exact path.
+
+    Returns:
+    - numpy array: Relevant item count per query.
+    """
+    counts = np.zeros(queries.shape[0], dtype=np.int64)
+
+    def count(start, scores, top_scores):
+        counts[start:start + len(scores)] = (scores > similarity_threshold).sum(axis=1)
+
+    topk_similarity(queries, items, k=1, block_size=block_size, n_jobs=n_jobs, on_block=count)
+    return counts
+
+
+class TopKEvaluator:
+    """
+    Batched ranking metrics accumulated over blocks of similarity rows.
+
+    An item is relevant to a query when its similarity exceeds the threshold, as in
+    recommend.calculate_map_k. Blocks can be fed as they come out of the similarity
+    step, so the full query x item matrix never has to exist; update is thread-safe.
+
+    Parameters:
+    - k (int): Number of top recommendations to consider.
+    - similarity_threshold (float): Threshold to determine relevance.
+    """
+
+    def __init__(self, k=10, similarity_threshold=0.5):
+        self.k = k
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._discounts = 1.0 / np.log2(np.arange(2, k + 2))
+        self.n_queries = 0
+        self.n_with_relevant = 0
+        self.n_hit = 0
+        self.precision_sum = 0.0
+        self.recall_sum = 0.0
+        self.ap_sum = 0.0
+        self.ndcg_sum = 0.0
+
+    def update(self, top_scores, n_relevant=None):
+        """
+        Add a block of per-query top-k scores.
+
+        Parameters:
+        - top_scores (numpy array): Scores of the top-k items per query, sorted descending.
+        - n_relevant (numpy array): Number of relevant items per query over the whole
+          catalog; defaults to the number of relevant items within the top-k.
+        """
+        top_scores = np.asarray(top_scores)[:, :self.k]
+        k = top_scores.shape[1]
+        relevant = top_scores > self.similarity_threshold
+        hits = relevant.sum(axis=1)
+        n_relevant = hits if n_relevant is None else np.asarray(n_relevant)
+        ranks = np.arange(1, k + 1)
+
+        # Average precision over the rows with at least one relevant item in the top-k
+        precision_at_rank = np.cumsum(relevant, axis=1) / ranks
+        has_hit = hits > 0
+        ap = (precision_at_rank * relevant).sum(axis=1)[has_hit] / np.minimum(k, hits[has_hit])
+
+        # Binary-gain NDCG against the ideal ordering of min(k, n_relevant) relevant items
+        has_relevant = n_relevant > 0
+        dcg = (relevant * self._discounts[:k]).sum(axis=1)
+        ideal = np.concatenate(([0.0], np.cumsum(self._discounts[:k])))[np.minimum(k, n_relevant)]
+
+        with self._lock:
+            self.n_queries += len(top_scores)
+            self.n_with_relevant += int(has_relevant.sum())
+            self.n_hit += int(has_hit.sum())
+            self.precision_sum += float(hits.sum()) / self.k
+            self.recall_sum += float((hits[has_relevant] / n_relevant[has_relevant]).sum())
+            self.ap_sum += float(ap.sum())
+            self.ndcg_sum += float((dcg[has_relevant] / ideal[has_relevant]).sum())
+
+    def update_block(self, scores):
+        """
+        Add a block of full similarity rows (or already trimmed top-k rows).
+
+        Parameters:
+        - scores (numpy array): Dense similarity rows, one per query.
+        """
+        scores = np.asarray(scores)
+        _, top_scores = topk_from_scores(scores, self.k)
+        self.update(top_scores, (scores > self.similarity_threshold).sum(axis=1))
+
+    def observe_block(self, start, scores, top_scores):
+        """
+        Callback for topk_similarity(on_block=...) that reuses the block's top-k.
+        """
+        self.update(top_scores, (scores > self.similarity_threshold).sum(axis=1))
+
+    def result(self):
+        """
+        Returns:
+        - dict: precision@k, recall@k, map@k and ndcg@k, plus the number of queries.
+          MAP is averaged over queries with a relevant item in the top-k, recall and
+          NDCG over queries with any relevant item.
+        """
+        k = self.k
+        return {
+            f"precision@{k}": self.precision_sum / self.n_queries if self.n_queries else 0.0,
+            f"recall@{k}": self.recall_sum / self.n_with_relevant if self.n_with_relevant else 0.0,
+            f"map@{k}": self.ap_sum / self.n_hit if self.n_hit else 0.0,
+            f"ndcg@{k}": self.ndcg_sum / self.n_with_relevant if self.n_with_relevant else 0.0,
+            "queries": self.n_queries,
+        }
@@ -0,0 +1,251 @@
+import csv
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+# 原始books.csv导出(以及清洗后的books_cleaned.csv)的读取层，替代pandas的error_bad_lines=False：
+# 文件按行边界(不在引号中的换行)切成块，各块在线程池中用pyarrow的列式解析器解析(解析和类型转换都不持有GIL)；
+# 字段数不对或数值列无法解析的行不再静默丢弃，而是交给修复步骤按12列的schema和数值锚点重建，
+# 修复和丢弃的行数记录在IngestStats中；修复后的行放回原来的位置，输出的行序与文件一致
+
+BOOKS_COLUMNS = ["bookID", "title", "authors", "average_rating", "isbn", "isbn13", "language_code", "num_pages",
+                 "ratings_count", "text_reviews_count", "publication_date", "publisher"]
+INT_COLUMNS = ["bookID", "isbn13", "num_pages", "ratings_count", "text_reviews_count"]
+FLOAT_COLUMNS = ["average_rating"]
+BLOCK_SIZE = 8 << 20
+
+INT_PATTERN = r"^-?\d+$"
+FLOAT_PATTERN = r"^-?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+# 修复时用来定位字段的锚点：isbn13前后的字段格式都是固定的
+ANCHORS = [
+    (-2, re.compile(r"\d+(\.\d+)?")),                           # average_rating
+    (-1, re.compile(r"[\dX]{9,10}", re.I)),                     # isbn
+    (0, re.compile(r"\d{13}")),                                 # isbn13
+    (1, re.compile(r"[A-Za-z]{2,3}(-[A-Za-z]{2})?")),           # language_code
+    (2, re.compile(r"\d+")),                                    # num_pages
+    (3, re.compile(r"\d+")),                                    # ratings_count
+    (4, re.compile(r"\d+")),                                    # text_reviews_count
+    (5, re.compile(r"\d{1,2}/\d{1,2}/\d{4}|\d{4}-\d{2}-\d{2}")),  # publication_date
+]
+
+
+class IngestStats:
+    # 读取过程的统计：读入的行数、修复的行数、无法修复而丢弃的行数(保留前几行原文便于排查)
+    def __init__(self, samples=5):
+        self.rows = 0
+        self.repaired = 0
+        self.dropped = 0
+        self.samples = samples
+        self.dropped_lines = []
+
+    def drop(self, line):
+        self.dropped += 1
+        if len(self.dropped_lines) < self.samples:
+            self.dropped_lines.append(line)
+
+    def __str__(self):
+        return f"rows read: {self.rows}, repaired: {self.repaired}, dropped: {self.dropped}"
+
+
+def repair_fields(fields):
+    # 用books的12列schema重建一行，返回12个字段，无法确定时返回None
+    # 这份导出中标题里的逗号已经被替换成空格，未加引号的逗号只出现在authors和publisher中：
+    # 以isbn13为中心匹配average_rating到publication_date这8个格式固定的字段，
+    # 它之前多出来的逗号属于authors，之后多出来的属于publisher
+    n = len(fields)
+    if n < len(BOOKS_COLUMNS) or not re.fullmatch(r"\d+", fields[0].strip()):
+        return None
+    candidates = [j for j in range(5, n - 6)
+                  if all(pattern.fullmatch(fields[j + offset].strip()) for offset, pattern in ANCHORS)]
+    if len(candidates) != 1:
+        return None
+    j = candidates[0]
+    return [fields[0], fields[1], ",".join(fields[2:j - 2])] + fields[j - 2:j + 6] + [",".join(fields[j + 6:])]
+
+
+def split_line(line, escape_char=False):
+    reader = csv.reader([line], escapechar=escape_char or None)
+    return next(reader, [])
+
+
+def validity_mask(table):
+    # 数值列中非空但无法解析的值所在的行为无效行
+    invalid = pa.chunked_array([pa.array(np.zeros(table.num_rows, dtype=bool))])
+    for column, pattern in [(c, INT_PATTERN) for c in INT_COLUMNS] + [(c, FLOAT_PATTERN) for c in FLOAT_COLUMNS]:
+        if column not in table.column_names:
+            continue
+        bad = pc.and_(pc.is_valid(table[column]),
+                      pc.invert(pc.match_substring_regex(table[column], pattern)))
+        invalid = pc.or_(invalid, bad)
+    return pc.fill_null(invalid, False)
+
+
+def convert_types(table):
+    # 全为字符串的表 -> 整数列int64、average_rating为float64，其余为字符串
+    columns = {}
+    for column in table.column_names:
+        if column in INT_COLUMNS:
+            columns[column] = pc.cast(table[column], pa.int64())
+        elif column in FLOAT_COLUMNS:
+            columns[column] = pc.cast(table[column], pa.float64())
+        else:
+            columns[column] = table[column]
+    return pa.table(columns)
+
+
+def string_table(rows, column_names):
+    return pa.table({c: pa.array([row[i] if row[i] != "" else None for row in rows], pa.string())
+                     for i, c in enumerate(column_names)})
+
+
+def parse_block(block, column_names, escape_char=False):
+    # 解析一块完整的行，返回(类型转换后的表, 修复的行数, 丢弃的行原文)
+    rejected = []
+
+    def reject(row):
+        # row.number是块内非空行的序号(从1开始)
+        rejected.append((row.number - 1, row.text))
+        return "skip"
+
+    table = pacsv.read_csv(
+        io.BytesIO(block),
+        read_options=pacsv.ReadOptions(column_names=column_names, use_threads=False, block_size=len(block) + 1),
+        parse_options=pacsv.ParseOptions(escape_char=escape_char, invalid_row_handler=reject),
+        convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in column_names},
+                                             strings_can_be_null=True))
+    try:
+        converted = convert_types(table)
+    except pa.ArrowInvalid:
+        converted = None
+    if converted is not None and not rejected:
+        return converted, 0, []
+
+    # 字段数不对的行之外剩下的行在块内的位置
+    positions = np.setdiff1d(np.arange(table.num_rows + len(rejected)),
+                             np.array([p for p, _ in rejected], dtype=np.int64))
+    if converted is None:
+        # 字段数正确但数值列无法解析的行(例如错位的行)也交给修复步骤
+        invalid = validity_mask(table)
+        mask = invalid.to_numpy(zero_copy_only=False)
+        rejected += [(position, ",".join("" if v is None else v for v in row.values()))
+                     for position, row in zip(positions[mask], table.filter(invalid).to_pylist())]
+        table = table.filter(pc.invert(invalid))
+        positions = positions[~mask]
+
+    repaired, repaired_positions, dropped = [], [], []
+    for position, text in sorted(rejected):
+        fields = repair_fields(split_line(text, escape_char)) if len(column_names) == len(BOOKS_COLUMNS) else None
+        if fields is not None and not validity_mask(string_table([fields], column_names))[0].as_py():
+            repaired.append(fields)
+            repaired_positions.append(position)
+        else:
+            dropped.append(text)
+    if repaired:
+        table = pa.concat_tables([table, string_table(repaired, column_names)])
+        table = table.take(np.argsort(np.concatenate([positions, repaired_positions]), kind="stable"))
+    return convert_types(table), len(repaired), dropped
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        header = f.readline()
+    names = [name.strip() for name in next(csv.reader([header.decode("utf-8")]))]
+    return names, len(header)
+
+
+def row_end(data, escape_char=False):
+    # 块内最后一个不在引号中的换行之后的位置，没有时返回0
+    # 引号内的换行属于字段(例如标题中的换行)，不能在那里截断；转义字符和它后面的字符成对跳过，""按两个引号计
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    quotes = np.flatnonzero(buffer == ord('"'))
+    if escape_char and len(quotes):
+        escaped = [m.end() - 1 for m in re.finditer(re.escape(escape_char.encode()) + rb".", data, re.S)]
+        quotes = np.setdiff1d(quotes, np.asarray(escaped, dtype=np.int64), assume_unique=True)
+    newlines = np.flatnonzero(buffer == ord("\n"))
+    outside = np.searchsorted(quotes, newlines) % 2 == 0
+    return int(newlines[outside][-1]) + 1 if outside.any() else 0
+
+
+def iter_blocks(path, offset, block_size, escape_char=False):
+    # 按行边界切块：每块在最后一个不在引号中的换行处截断，剩余部分并入下一块
+    # 引号不成对的坏行会让后面的换行都像在引号中，累积超过4块(至少1MB)仍找不到截断点时退回到最后一个换行
+    with open(path, "rb") as f:
+        f.seek(offset)
+        rest = b""
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            data = rest + data
+            cut = row_end(data, escape_char)
+            if cut == 0 and len(data) > max(4 * block_size, 1 << 20):
+                cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                rest = data
+                continue
+            rest = data[cut:]
+            yield data[:cut]
+        if rest.strip():
+            yield rest + b"\n"
+
+
+def to_pandas(table, nullable_ints=False):
+    # nullable_ints时整数列为可空的Int64(分块读取时各块类型一致)，否则与pandas.read_csv相同：有空值的整数列为float64
+    types_mapper = {pa.int64(): pd.Int64Dtype()}.get if nullable_ints else None
+    return table.to_pandas(types_mapper=types_mapper)
+
+
+def iter_table_blocks(path, threads=None, block_size=BLOCK_SIZE, escape_char=False, stats=None):
+    # 按文件顺序产出每块的表；同时在解析的块数不超过线程数的两倍，内存占用与文件大小无关
+    names, offset = read_header(path)
+    stats = stats if stats is not None else IngestStats()
+    threads = threads or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = []
+        for block in iter_blocks(path, offset, block_size, escape_char):
+            pending.append(pool.submit(parse_block, block, names, escape_char))
+            if len(pending) >= 2 * threads:
+                yield collect(pending.pop(0), stats)
+        for future in pending:
+            yield collect(future, stats)
+
+
+def collect(future, stats):
+    table, repaired, dropped = future.result()
+    stats.rows += table.num_rows + len(dropped)
+    stats.repaired += repaired
+    for line in dropped:
+        stats.drop(line)
+    return table
+
+
+def read_books_csv(path, threads=None, nullable_ints=False, escape_char=False, stats=None,
+                   block_size=BLOCK_SIZE):
+    # 读取整个文件为一个DataFrame，列名去掉前后的空格
+    tables = list(iter_table_blocks(path, threads, block_size, escape_char, stats))
+    if not tables:
+        names, _ = read_header(path)
+        return pd.DataFrame(columns=names)
+    return to_pandas(pa.concat_tables(tables), nullable_ints)
+
+
+def iter_books_csv(path, chunksize=100000, threads=None, nullable_ints=False, escape_char=False, stats=None,
+                   block_size=BLOCK_SIZE):
+    # 分块读取，每块正好chunksize行(最后一块除外)，与pandas.read_csv(chunksize=...)的分块方式相同
+    buffered, rows = [], 0
+    for table in iter_table_blocks(path, threads, block_size, escape_char, stats):
+        buffered.append(table)
+        rows += table.num_rows
+        while rows >= chunksize:
+            merged = pa.concat_tables(buffered)
+            yield to_pandas(merged.slice(0, chunksize), nullable_ints)
+            buffered, rows = [merged.slice(chunksize)], rows - chunksize
+    if rows:
+        yield to_pandas(pa.concat_tables(buffered), nullable_ints)
@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from model_store import artifact_dir
+
+
+async def worker(host, port, paths, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_level(host, port, paths, concurrency):
+    latencies = []
+    chunks = np.array_split(np.asarray(paths, dtype=object), concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(host, port, chunk, latencies) for chunk in chunks if len(chunk)))
+    elapsed = time.perf_counter() - start
+    latencies = np.asarray(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local load generator for serve.py")
+    parser.add_argument("--model", default="model", help="Model directory, used to pick valid bookIDs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests sent per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--text-ratio", type=float, default=0.2, help="Share of /similar requests")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    book_ids = np.load(os.path.join(artifact_dir(args.model), "book_ids.npy"), mmap_mode="r")
+    texts = ["harry potter", "lord of the rings", "history", "poetry", "science fiction", "tolkien"]
+    paths = [
+        f"/similar?text={texts[rng.integers(len(texts))].replace(' ', '+')}"
+        if rng.random() < args.text_ratio
+        else f"/recommend?book_id={book_ids[rng.integers(len(book_ids))]}"
+        for _ in range(args.requests)
+    ]
+
+    print(f"{'concurrency':>11} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for concurrency in args.concurrency:
+        throughput, p50, p99 = asyncio.run(run_level(args.host, args.port, paths, concurrency))
+        print(f"{concurrency:>11} {throughput:>10.1f} {p50:>9.2f} {p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+import io
+import math
+import os
+import shutil
+import threading
+from decimal import Decimal
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from aggregates import AUTHOR_ATTRIBUTIONS, BASE_KEYS, COMMITTED, DIMENSIONS, STATE_COLUMNS, parse_version, version_name
+
+# 不启动JVM的本地执行后端：用pandas/NumPy在进程内计算dataAnalysis.py中的十个分析
+# 读取规则、空值语义、排序方式和输出的csv格式都与Spark后端一致，小数据集上省去SparkSession的启动时间
+
+# 自动选择后端时，输入不超过这个大小(MB)就在本地计算
+LOCAL_MAX_MB = 256
+BOOKS_COLUMNS = ["bookID", "title", "authors", "average_rating", "isbn", "isbn13", "language_code", "num_pages",
+                 "ratings_count", "text_reviews_count", "publication_date", "publisher"]
+LONG_COLUMNS = ["bookID", "isbn13", "num_pages", "ratings_count", "text_reviews_count"]
+# 与dataAnalysis.ANALYSIS_COLUMNS相同
+ANALYSIS_COLUMNS = ["bookID", "title", "first_author", "average_rating", "language_code", "num_pages",
+                    "ratings_count", "text_reviews_count", "publication_date", "publisher", "year"]
+# datapreprocess.py --parquet写出的hive分区目录
+PARTITIONING = ds.partitioning(pa.schema([("language_code", pa.string()), ("publication_year", pa.int32())]),
+                               flavor="hive")
+# 读Parquet时整数和浮点数使用可空类型，空值不会把整数列变成浮点数
+TYPES_MAPPER = {pa.int64(): pd.Int64Dtype(), pa.float64(): pd.Float64Dtype()}.get
+
+
+def is_local_path(path):
+    return "://" not in path or path.startswith("file://")
+
+
+def input_size(path):
+    path = path[len("file://"):] if path.startswith("file://") else path
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def choose_backend(input_path, other_paths=(), max_mb=LOCAL_MAX_MB):
+    # 输入、输出和聚合表目录都在本地，且输入不超过max_mb时使用本地后端，否则使用Spark
+    paths = [input_path] + [p for p in other_paths if p]
+    if not all(is_local_path(p) for p in paths) or not os.path.exists(input_path.replace("file://", "", 1)):
+        return "spark"
+    return "local" if input_size(input_path) <= max_mb * 1024 * 1024 else "spark"
+
+
+##---- 读取数据
+def split_spark_csv(line):
+    # 按Spark(univocity)读取csv的规则切分一行：引号内用\转义；
+    # 带引号的值中出现未转义的引号时(例如pandas写出的"")，整个字段原样保留到下一个逗号
+    fields, start, n = [], 0, len(line)
+    while True:
+        end = line.find(",", start)
+        end = n if end < 0 else end
+        if line.startswith('"', start):
+            value, i = [], start + 1
+            while i < n and line[i] != '"':
+                if line[i] == "\\" and i + 1 < n:
+                    i += 1
+                value.append(line[i])
+                i += 1
+            if i < n and (i + 1 == n or line[i + 1] == ","):
+                fields.append("".join(value))
+                end = i + 1
+            else:
+                fields.append(line[start:end])
+        else:
+            fields.append(line[start:end])
+        if end >= n:
+            return fields
+        start = end + 1
+
+
+def read_csv_table(path):
+    # Spark读取目录时读取其中所有文件，每个文件都有表头；空行跳过；结果为全部是字符串列的表，保持文件中的行序
+    # 没有引号且字段数正确的行(绝大多数)交给pyarrow解析，其余的行按Spark的规则逐行切分
+    files = sorted(glob(os.path.join(path, "*.csv"))) if os.path.isdir(path) else [path]
+    width = len(BOOKS_COLUMNS)
+    tables = []
+    for file in files:
+        with open(file, encoding="utf-8") as f:
+            lines = [line for line in f.read().splitlines()[1:] if line]
+        plain = [i for i, line in enumerate(lines) if '"' not in line and line.count(",") == width - 1]
+        plain_table = pacsv.read_csv(
+            io.BytesIO("\n".join([lines[i] for i in plain]).encode("utf-8")),
+            read_options=pacsv.ReadOptions(column_names=BOOKS_COLUMNS),
+            parse_options=pacsv.ParseOptions(quote_char=False),
+            convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in BOOKS_COLUMNS},
+                                                 strings_can_be_null=False)) if plain else None
+        plain_set = set(plain)
+        other = [i for i in range(len(lines)) if i not in plain_set]
+        # 字段数与schema不一致时与Spark的PERMISSIVE模式相同：缺少的字段为空，多余的字段丢弃
+        rows = [(split_spark_csv(lines[i]) + [None] * width)[:width] for i in other]
+        other_table = pa.table({c: pa.array([row[j] for row in rows], pa.string())
+                                for j, c in enumerate(BOOKS_COLUMNS)})
+        table = other_table if plain_table is None else pa.concat_tables([plain_table, other_table])
+        tables.append(table.take(np.argsort(np.array(plain + other, dtype=np.int64), kind="stable")))
+    return pa.concat_tables(tables)
+
+
+def parse_books(raw):
+    # 按BOOKS_SCHEMA转换类型，空字符串和无法转换的值与Spark一样为空
+    columns = {}
+    for column in ["title", "authors", "language_code", "publisher"]:
+        columns[column] = pc.if_else(pc.equal(raw[column], ""), pa.scalar(None, pa.string()), raw[column])
+    for column in LONG_COLUMNS:
+        valid = pc.match_substring_regex(raw[column], r"^[+-]?\d+$")
+        columns[column] = pc.cast(pc.if_else(valid, raw[column], pa.scalar(None, pa.string())), pa.int64())
+    average_rating = pd.to_numeric(raw["average_rating"].to_pandas(), errors="coerce")
+    columns["average_rating"] = pa.array(average_rating, pa.float64(), from_pandas=True)
+    columns["publication_date"] = pc.cast(pc.strptime(raw["publication_date"], format="%Y-%m-%d", unit="s",
+                                                      error_is_null=True), pa.date32())
+    return pa.table(columns)
+
+
+def read_books_local(input_path, input_format="csv"):
+    # 与dataAnalysis.read_books相同的数据：派生first_author(第一作者)和year(出版年份)两列
+    if input_format == "csv":
+        table = parse_books(read_csv_table(input_path))
+    else:
+        table = ds.dataset(input_path, format="parquet", partitioning=PARTITIONING) \
+                  .to_table(columns=[c for c in BOOKS_COLUMNS if c not in ("isbn", "isbn13")])
+    books = table.to_pandas(types_mapper=TYPES_MAPPER, date_as_object=False)
+    books["first_author"] = books["authors"].str.split("/").str[0]
+    years = books["publication_date"].dt.year
+    books["year"] = years.map("{:04.0f}".format, na_action="ignore")
+    return books[ANALYSIS_COLUMNS]
+
+
+def read_parquet_local(path):
+    return pq.read_table(path).to_pandas(types_mapper=TYPES_MAPPER)
+
+
+##---- 与Spark语义一致的计算
+def partial_state_local(books, keys):
+    # 与aggregates.partial_state相同：空值也作为一组，全为空的求和结果为空
+    weight = books["average_rating"] * books["ratings_count"]
+    grouped = books.assign(rating_weight=weight).groupby(keys, dropna=False, sort=False)
+    return pd.DataFrame({
+        "books_num": grouped.size().astype("Int64"),
+        "rating_weight": grouped["rating_weight"].sum(min_count=1),
+        "ratings_sum": grouped["ratings_count"].sum(min_count=1),
+        "reviews_sum": grouped["text_reviews_count"].sum(min_count=1),
+    }).reset_index()
+
+
+def merge_states_local(state, keys):
+    grouped = state.groupby(keys, dropna=False, sort=False)
+    return grouped[STATE_COLUMNS].sum(min_count=1).reset_index()
+
+
+def author_dimension_state_local(books, authors, bridge, attribution="first"):
+    # 与aggregates.author_dimension_state相同：按整数bookID连接桥表、按整数author_id分组，最后连接作者名
+    if attribution == "first":
+        bridge = bridge[bridge["position"] == 0]
+    metrics = books[["bookID", "average_rating", "ratings_count", "text_reviews_count"]]
+    state = partial_state_local(metrics.merge(bridge[["bookID", "author_id"]], on="bookID"), ["author_id"])
+    state = state.merge(authors, on="author_id")
+    return state.rename(columns={"author": AUTHOR_ATTRIBUTIONS[attribution]})[
+        [AUTHOR_ATTRIBUTIONS[attribution]] + STATE_COLUMNS]
+
+
+def order_by(df, columns, ascending=False):
+    # Spark的排序：升序时空值在前，降序时空值在后；并列的行保持原来的顺序
+    return df.sort_values(columns, ascending=ascending, na_position="first" if ascending else "last",
+                          kind="mergesort")
+
+
+def divide(numerator, denominator):
+    # Spark的除法：除数为0或任一边为空时结果为空
+    denominator = denominator.astype("Float64")
+    return numerator.astype("Float64") / denominator.mask(denominator == 0)
+
+
+def top_n_with_ties_local(df, column, n):
+    # 与dataAnalysis.top_n_with_ties相同：保留值>=第n大的非空值的行，非空值不足n个时全部保留
+    values = df[column].dropna()
+    if len(values) < n:
+        return df
+    return df[(df[column] >= values.nlargest(n).iloc[-1]).fillna(False)]
+
+
+##---- 写出结果
+WHITESPACE = "".join(map(chr, range(33)))
+
+
+def java_double(value):
+    # Java的Double.toString：[1e-3, 1e7)之外使用科学计数法，例如1.0E7
+    if math.isnan(value) or math.isinf(value):
+        return "NaN" if math.isnan(value) else ("Infinity" if value > 0 else "-Infinity")
+    if value == 0 or 1e-3 <= abs(value) < 1e7:
+        return repr(float(value))
+    sign, digits, exponent = Decimal(repr(float(value))).as_tuple()
+    mantissa = "".join(map(str, digits)).rstrip("0") or "0"
+    return f"{'-' if sign else ''}{mantissa[0]}.{mantissa[1:] or '0'}E{exponent + len(digits) - 1}"
+
+
+def csv_value(value):
+    # Spark写csv的规则：去掉首尾空白，含引号、逗号或换行的值加引号，引号用\转义；空字符串写成""
+    value = value.strip(WHITESPACE)
+    if not value:
+        return '""'
+    if any(c in value for c in '",\n\r'):
+        return '"' + value.replace('"', '\\"') + '"'
+    return value
+
+
+def format_column(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime("%Y-%m-%d").fillna("")
+    if pd.api.types.is_integer_dtype(series):
+        return series.map(str, na_action="ignore").fillna("")
+    if pd.api.types.is_float_dtype(series):
+        return series.map(java_double, na_action="ignore").fillna("")
+    return series.map(csv_value, na_action="ignore").fillna("")
+
+
+def write_spark_csv(df, path):
+    # 与Spark的write.csv(mode='overwrite')输出相同的目录结构：一个无表头的part文件和_SUCCESS标记
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    columns = [format_column(df[c]).tolist() for c in df.columns]
+    with open(os.path.join(path, "part-00000.csv"), "w", encoding="utf-8") as f:
+        f.writelines(",".join(row) + "\n" for row in zip(*columns))
+    open(os.path.join(path, "_SUCCESS"), "w").close()
+
+
+class LocalContext:
+    # 与dataAnalysis.AnalysisContext相同的共享中间结果，名称也相同
+    def __init__(self, input_path, input_format="csv", state_dir=None, top_n=10, author_dir=None,
+                 attribution="first", editions=None):
+        self.input_path = input_path
+        self.input_format = input_format
+        self.state_dir = state_dir
+        self.top_n = top_n
+        self.author_dir = author_dir
+        self.attribution = attribution
+        self.author_column = AUTHOR_ATTRIBUTIONS[attribution]
+        self.base_keys = [k for k in BASE_KEYS if k != "first_author"] if author_dir else BASE_KEYS
+        self.editions = editions
+        self._resources = {}
+        self._lock = threading.RLock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = LOCAL_RESOURCES[name](self)
+            return self._resources[name]
+
+    def materialize(self, name):
+        self.get(name)
+
+    def release(self):
+        self._resources.clear()
+
+
+def load_books_local(ctx):
+    # 与dataAnalysis.load_books相同：指定了版本映射时多一列work_id，不在映射中的书自成一个作品
+    books = ctx.get("source")
+    if not ctx.editions:
+        return books
+    work_ids = pd.read_csv(ctx.editions, dtype={"bookID": "Int64", "work_id": "Int64"})
+    books = books.merge(work_ids, on="bookID", how="left")
+    return books.assign(work_id=books["work_id"].fillna(books["bookID"]))
+
+
+def one_per_work_local(ctx, df, column, ascending=False):
+    # 与dataAnalysis.one_per_work相同：每个作品只保留按column排在最前的版本，并列时取bookID最小的
+    if not ctx.editions:
+        return df
+    ranked = df.sort_values([column, "bookID"], ascending=[ascending, True],
+                            na_position="first" if ascending else "last", kind="mergesort")
+    return df.loc[ranked.drop_duplicates("work_id").index.sort_values()]
+
+
+def state_version_local(state_dir):
+    # 与aggregates.current_state相同：有_COMMITTED标记的最大版本
+    versions = [parse_version(name) for name in os.listdir(state_dir)]
+    versions = [v for v in versions if v is not None
+                and os.path.exists(os.path.join(state_dir, version_name(v), COMMITTED))]
+    if not versions:
+        raise FileNotFoundError(f"{state_dir}中没有已提交的聚合表")
+    return version_name(max(versions))
+
+
+def dimension_state_local(ctx, dimension):
+    if dimension == "author" and ctx.author_dir:
+        authors = read_parquet_local(f"{ctx.author_dir}/authors")
+        bridge = read_parquet_local(f"{ctx.author_dir}/book_authors")
+        return author_dimension_state_local(ctx.get("books"), authors, bridge, ctx.attribution)
+    if ctx.state_dir:
+        return read_parquet_local(f"{ctx.state_dir}/{state_version_local(ctx.state_dir)}/{dimension}")
+    return merge_states_local(ctx.get("base_agg"), DIMENSIONS[dimension])
+
+
+LOCAL_RESOURCES = {
+    "source": lambda ctx: read_books_local(ctx.input_path, ctx.input_format),
+    "books": load_books_local,
+    "base_agg": lambda ctx: partial_state_local(ctx.get("books"), ctx.base_keys),
+    "top_1000_books": lambda ctx: top_n_with_ties_local(
+        ctx.get("books")[["publisher", "language_code", "text_reviews_count"]], "text_reviews_count", 1000),
+}
+for _dimension in DIMENSIONS:
+    LOCAL_RESOURCES[f"{_dimension}_state"] = lambda ctx, dimension=_dimension: dimension_state_local(ctx, dimension)
+
+
+# 分析名称 -> 本地实现，名称、输出列和排序与dataAnalysis.ANALYSES中的Spark实现一一对应
+LOCAL_ANALYSES = {}
+
+
+def register_local(name):
+    def wrap(build):
+        LOCAL_ANALYSES[name] = build
+        return build
+    return wrap
+
+
+@register_local("top_10_text")
+def top_10_text(ctx):
+    books = one_per_work_local(ctx, ctx.get("books"), "text_reviews_count")
+    books = books[["bookID", "title", "first_author", "average_rating", "language_code", "text_reviews_count",
+                   "publication_date"]]
+    return order_by(books, ["text_reviews_count"]).head(ctx.top_n)
+
+
+@register_local("top_10_numpages")
+def top_10_numpages(ctx):
+    books = one_per_work_local(ctx, ctx.get("books"), "num_pages")
+    books = books[["bookID", "title", "first_author", "average_rating", "language_code", "num_pages",
+                   "publication_date"]]
+    return order_by(books, ["num_pages"]).head(ctx.top_n)
+
+
+@register_local("pubulisher_books_num")
+def pubulisher_books_num(ctx):
+    return order_by(ctx.get("publisher_state")[["publisher", "books_num"]], ["books_num"])
+
+
+@register_local("language_books_num")
+def language_books_num(ctx):
+    return order_by(ctx.get("language_state")[["language_code", "books_num"]], ["books_num"])
+
+
+@register_local("top_10_high_score")
+def top_10_high_score(ctx):
+    books = ctx.get("books")
+    gems = books[((books["average_rating"] > 4.5) & (books["ratings_count"] >= 10000)
+                  & (books["text_reviews_count"] <= 300)).fillna(False)]
+    gems = one_per_work_local(ctx, gems, "text_reviews_count", ascending=True)
+    gems = gems[["bookID", "title", "first_author", "average_rating", "language_code", "ratings_count",
+                 "text_reviews_count", "publication_date"]]
+    return order_by(gems, ["text_reviews_count"], ascending=True).head(ctx.top_n)
+
+
+@register_local("relation_booknum_year")
+def relation_booknum_year(ctx):
+    return order_by(ctx.get("year_state")[["year", "books_num"]], ["year"], ascending=True)
+
+
+@register_local("avg_rate_author")
+def avg_rate_author(ctx):
+    state = ctx.get("author_state")
+    result = pd.DataFrame({ctx.author_column: state[ctx.author_column],
+                           "avg_rate": divide(state["rating_weight"], state["ratings_sum"]),
+                           "books_num": state["books_num"]})
+    return order_by(result, ["books_num", "avg_rate"])
+
+
+@register_local("relation_ratebooknum_publisher")
+def relation_ratebooknum_publisher(ctx):
+    counts = ctx.get("top_1000_books").groupby("publisher", dropna=False, sort=False).size()
+    return order_by(counts.astype("Int64").rename("ratebooks_num").reset_index(), ["ratebooks_num"])
+
+
+@register_local("relation_ratebooknum_language")
+def relation_ratebooknum_language(ctx):
+    counts = ctx.get("top_1000_books").groupby("language_code", dropna=False, sort=False).size()
+    return order_by(counts.astype("Int64").rename("ratebooks_num").reset_index(), ["ratebooks_num"])
+
+
+@register_local("avg_attention_author")
+def avg_attention_author(ctx):
+    state = ctx.get("author_state")
+    result = pd.DataFrame({ctx.author_column: state[ctx.author_column], "books_num": state["books_num"],
+                           "avg_attention": divide(state["reviews_sum"], state["books_num"])})
+    return order_by(result, ["avg_attention", "books_num"])
@@ -0,0 +1,637 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from editions import read_work_ids
+from recommend import combine_features, load_and_clean_data, make_text_vectorizer, prepare_features
+from topk import topk_from_scores, topk_similarity
+
+NUMERICAL_FEATURES = ["average_rating", "ratings_count", "text_reviews_count"]
+MANIFEST = "segments.json"
+# Written by segments.rebuild: names the generation subdirectory that holds the live artifact
+CURRENT = "CURRENT"
+FACETS = "facets.json"
+# Range facets: filter keyword for the lower bound (and upper bound, if any) of each one
+RANGE_FACETS = {
+    "year": ("year_min", "year_max"),
+    "rating": ("min_rating", None),
+    "ratings_count": ("min_ratings_count", None),
+}
+FILTER_KEYS = {"language"} | {key for bounds in RANGE_FACETS.values() for key in bounds if key}
+
+
+def save_items(item_dir, items):
+    """
+    Save a normalized item matrix as memory-mappable .npy files.
+
+    The matrix is stored in CSR (row lookup) and CSC (scoring) layout.
+
+    Parameters:
+    - item_dir (str): Directory the files are written to.
+    - items (sparse matrix): Row-normalized item vectors.
+    """
+    os.makedirs(item_dir, exist_ok=True)
+    items = sp.csr_matrix(items, dtype=np.float32)
+    # scipy keeps int32 index arrays as they are, so the mapped pages are never copied
+    index_dtype = np.int32 if max(items.nnz, *items.shape) < 2 ** 31 else np.int64
+    for name, matrix in (("items", items), ("items_csc", items.tocsc())):
+        np.save(os.path.join(item_dir, f"{name}_data.npy"), matrix.data)
+        np.save(os.path.join(item_dir, f"{name}_indices.npy"), matrix.indices.astype(index_dtype))
+        np.save(os.path.join(item_dir, f"{name}_indptr.npy"), matrix.indptr.astype(index_dtype))
+
+
+def load_items(item_dir, shape):
+    """
+    Open an item matrix saved by save_items without reading it into memory.
+
+    Parameters:
+    - item_dir (str): Directory holding the .npy files.
+    - shape (tuple): Shape of the item matrix.
+
+    Returns:
+    - tuple: (CSR matrix, CSC matrix) whose arrays are views of the mapped files.
+    """
+    def load(name):
+        return tuple(
+            np.load(os.path.join(item_dir, f"{name}_{part}.npy"), mmap_mode="r")
+            for part in ("data", "indices", "indptr")
+        )
+    return (sp.csr_matrix(load("items"), shape=shape, copy=False),
+            sp.csc_matrix(load("items_csc"), shape=shape, copy=False))
+
+
+def facet_columns(df):
+    """
+    Facet values of every book, from the columns dataAnalysis.py aggregates on.
+
+    Parameters:
+    - df (DataFrame): Books as returned by recommend.load_and_clean_data.
+
+    Returns:
+    - dict: language codes (str array) and publication year, average rating and
+      ratings count (float arrays, NaN where missing).
+    """
+    years = df["publication_date"].astype(str).str.extract(r"^(\d{4})", expand=False)
+    return {
+        "language": df["language_code"].fillna("").astype(str).to_numpy(),
+        "year": years.astype(float).to_numpy(),
+        "rating": df["average_rating"].to_numpy(dtype=np.float64, na_value=np.nan),
+        "ratings_count": df["ratings_count"].to_numpy(dtype=np.float64, na_value=np.nan),
+    }
+
+
+def save_facets(item_dir, columns):
+    """
+    Save the facet index of one block of item rows next to its item matrix.
+
+    Every language gets a sorted array of the rows that have it (stored back to
+    back with an offsets array), and every range facet gets its rows sorted by
+    value, so a filter turns into one slice per facet. The raw values are kept
+    for checking the remaining filters on the candidates of the most selective one.
+
+    Parameters:
+    - item_dir (str): Directory of the item matrix.
+    - columns (dict): Facet values as returned by facet_columns.
+    """
+    languages, codes = np.unique(columns["language"], return_inverse=True)
+    order = np.argsort(codes, kind="stable")
+    np.save(os.path.join(item_dir, "facet_language.npy"), codes.astype(np.int32))
+    np.save(os.path.join(item_dir, "facet_language_rows.npy"), order.astype(np.int32))
+    np.save(os.path.join(item_dir, "facet_language_offsets.npy"),
+            np.searchsorted(codes[order], np.arange(len(languages) + 1)).astype(np.int64))
+    for name in RANGE_FACETS:
+        values = np.asarray(columns[name], dtype=np.float64)
+        rows = np.flatnonzero(~np.isnan(values))
+        rows = rows[np.argsort(values[rows], kind="stable")]
+        np.save(os.path.join(item_dir, f"facet_{name}.npy"), values)
+        np.save(os.path.join(item_dir, f"facet_{name}_rows.npy"), rows.astype(np.int32))
+        np.save(os.path.join(item_dir, f"facet_{name}_sorted.npy"), values[rows])
+    with open(os.path.join(item_dir, FACETS), "w", encoding="utf-8") as f:
+        json.dump({"languages": languages.tolist()}, f, ensure_ascii=False)
+
+
+class FacetIndex:
+    """
+    Memory-mapped facet index of one segment, see save_facets.
+
+    Parameters:
+    - item_dir (str): Directory the facet files were saved to.
+    """
+
+    def __init__(self, item_dir):
+        with open(os.path.join(item_dir, FACETS), encoding="utf-8") as f:
+            self.languages = json.load(f)["languages"]
+
+        def load(name):
+            return np.load(os.path.join(item_dir, f"{name}.npy"), mmap_mode="r")
+        self.language = load("facet_language")
+        self.language_rows = load("facet_language_rows")
+        self.language_offsets = load("facet_language_offsets")
+        self.values = {name: load(f"facet_{name}") for name in RANGE_FACETS}
+        self.sorted_rows = {name: load(f"facet_{name}_rows") for name in RANGE_FACETS}
+        self.sorted_values = {name: load(f"facet_{name}_sorted") for name in RANGE_FACETS}
+
+    def columns(self):
+        """Raw facet values in the format of facet_columns, for merging segments."""
+        columns = {name: np.asarray(values) for name, values in self.values.items()}
+        columns["language"] = np.asarray(self.languages, dtype=object)[np.asarray(self.language)]
+        return columns
+
+    def rows(self, filters):
+        """
+        Rows of this segment that pass every filter.
+
+        The candidate list of the most selective filter is taken from the index
+        and only those rows are checked against the other filters.
+
+        Parameters:
+        - filters (dict): See RecommenderModel.search.
+
+        Returns:
+        - numpy array: Sorted row positions.
+        """
+        candidates, checks = [], []
+        if filters.get("language") is not None:
+            wanted = [filters["language"]] if isinstance(filters["language"], str) else filters["language"]
+            codes = [self.languages.index(code) for code in wanted if code in self.languages]
+            candidates.append(np.concatenate(
+                [self.language_rows[self.language_offsets[c]:self.language_offsets[c + 1]] for c in codes]
+                + [np.empty(0, dtype=np.int32)]))
+            checks.append(lambda rows: np.isin(self.language[rows], codes))
+        for name, (low_key, high_key) in RANGE_FACETS.items():
+            low = filters.get(low_key)
+            high = filters.get(high_key) if high_key else None
+            if low is None and high is None:
+                continue
+            low = -np.inf if low is None else low
+            high = np.inf if high is None else high
+            sorted_values = self.sorted_values[name]
+            start = np.searchsorted(sorted_values, low, side="left")
+            stop = np.searchsorted(sorted_values, high, side="right")
+            candidates.append(self.sorted_rows[name][start:stop])
+            checks.append(lambda rows, name=name, low=low, high=high:
+                          (self.values[name][rows] >= low) & (self.values[name][rows] <= high))
+        if not candidates:
+            return np.arange(len(self.language))
+        smallest = min(range(len(candidates)), key=lambda i: len(candidates[i]))
+        rows = np.sort(candidates[smallest])
+        for i, check in enumerate(checks):
+            if i != smallest and len(rows):
+                rows = rows[check(rows)]
+        return rows
+
+
+def collapse_editions(df, work_ids):
+    """
+    Keep one edition per work, the one with the most ratings.
+
+    Parameters:
+    - df (DataFrame): Books as returned by recommend.load_and_clean_data.
+    - work_ids (DataFrame): bookID -> work_id mapping written by editions.py; books
+      missing from it are works of their own.
+
+    Returns:
+    - tuple: (representative books in catalog order, sorted bookIDs of every edition,
+      item row of the work of every one of them).
+    """
+    work = df["bookID"].map(work_ids.set_index("bookID")["work_id"]).fillna(df["bookID"]).astype(np.int64)
+    ranked = df.assign(work_id=work.to_numpy()).sort_values(["ratings_count", "bookID"], ascending=[False, True])
+    representatives = ranked.drop_duplicates("work_id").sort_index()
+    row_of_work = pd.Series(np.arange(len(representatives)), index=representatives["work_id"].to_numpy())
+    edition_ids = df["bookID"].to_numpy(dtype=np.int64)
+    order = np.argsort(edition_ids, kind="stable")
+    edition_rows = row_of_work[work.to_numpy()].to_numpy()
+    return representatives.drop(columns="work_id"), edition_ids[order], edition_rows[order]
+
+
+def document_frequencies(items, n_text_features):
+    """
+    Count in how many rows every text column is non-zero, for IDF drift tracking.
+    """
+    text_part = sp.csc_matrix(items)[:, :n_text_features]
+    return np.diff(text_part.indptr).astype(np.int64)
+
+
+def build_model(file_path, model_dir, numerical_features=NUMERICAL_FEATURES, hashing_features=None,
+                editions=None):
+    """
+    Fit the recommender on the whole catalog and save it as memory-mappable arrays.
+
+    The artifact directory holds the TF-IDF vocabulary (or hashing width) and IDF
+    weights, the scaler parameters, the bookID of every item row, the document
+    frequencies of the text columns, the normalized item matrix and the facet index
+    used for filtered searches as plain .npy files. With an editions mapping the
+    index is built at work level: only one edition of every work is vectorized,
+    and every edition's bookID is mapped to its work's row, so queries for any
+    edition are answered and other editions of the query's work are never returned.
+
+    Parameters:
+    - file_path (str): Path to the cleaned books CSV file.
+    - model_dir (str): Directory the artifact is written to.
+    - numerical_features (list): List of numerical feature column names.
+    - hashing_features (int): Use a hashing vectorizer with this many columns instead
+      of a fitted vocabulary, see recommend.make_text_vectorizer.
+    - editions (str): Optional bookID,work_id CSV written by editions.py.
+
+    Returns:
+    - str: The artifact directory.
+    """
+    df = load_and_clean_data(file_path)
+    if editions:
+        df, edition_ids, edition_rows = collapse_editions(df, read_work_ids(editions))
+    combined_features, tfidf, scaler = prepare_features(df, numerical_features, hashing_features)
+    n_text_features = combined_features.shape[1] - len(numerical_features)
+    save_items(model_dir, combined_features)
+    save_facets(model_dir, facet_columns(df))
+
+    idf = tfidf[-1].idf_ if hashing_features else tfidf.idf_
+    np.save(os.path.join(model_dir, "idf.npy"), idf)
+    np.save(os.path.join(model_dir, "doc_freq.npy"), document_frequencies(combined_features, n_text_features))
+    np.save(os.path.join(model_dir, "scaler_mean.npy"), scaler.mean_)
+    np.save(os.path.join(model_dir, "scaler_scale.npy"), scaler.scale_)
+    np.save(os.path.join(model_dir, "book_ids.npy"), df["bookID"].to_numpy(dtype=np.int64))
+    for name in ("edition_ids", "edition_rows"):
+        path = os.path.join(model_dir, f"{name}.npy")
+        if editions:
+            np.save(path, edition_ids if name == "edition_ids" else edition_rows)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    meta = {
+        "shape": list(combined_features.shape),
+        "source": os.path.abspath(file_path),
+        "numerical_features": list(numerical_features),
+        "numerical_median": df[numerical_features].median().tolist(),
+        "hashing_features": hashing_features,
+        "editions": os.path.abspath(editions) if editions else None,
+        "vocabulary": None if hashing_features else tfidf.get_feature_names_out().tolist(),
+    }
+    with open(os.path.join(model_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    write_manifest(model_dir, [])
+    return model_dir
+
+
+def read_manifest(model_dir):
+    path = os.path.join(model_dir, MANIFEST)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["segments"]
+
+
+def write_manifest(model_dir, segments):
+    # Write to a temporary file and rename, so readers never see a half-written manifest
+    path = os.path.join(model_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"segments": segments}, f)
+    os.replace(path + ".tmp", path)
+
+
+def artifact_dir(model_dir):
+    """
+    Directory holding the live artifact of a model directory.
+
+    A freshly built model is the directory itself. After segments.rebuild the
+    artifact lives in a generation subdirectory named by the CURRENT file, which
+    is replaced atomically, so a reader always resolves a complete artifact.
+
+    Parameters:
+    - model_dir (str): Directory passed to build_model.
+
+    Returns:
+    - str: The generation subdirectory, or model_dir itself.
+    """
+    try:
+        with open(os.path.join(model_dir, CURRENT), encoding="utf-8") as f:
+            return os.path.join(model_dir, f.read().strip())
+    except FileNotFoundError:
+        return model_dir
+
+
+def publish_generation(model_dir, name):
+    # Point CURRENT at a new generation subdirectory with a single rename
+    path = os.path.join(model_dir, CURRENT)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(path + ".tmp", path)
+
+
+def model_version(model_dir):
+    """
+    Cheap stamp that changes whenever a rebuild is published or the segment manifest is rewritten.
+
+    Parameters:
+    - model_dir (str): Directory passed to build_model.
+
+    Returns:
+    - tuple: (artifact directory, manifest inode, manifest mtime in ns); zeros if there is no manifest.
+    """
+    root = artifact_dir(model_dir)
+    try:
+        stat = os.stat(os.path.join(root, MANIFEST))
+    except FileNotFoundError:
+        return root, 0, 0
+    return root, stat.st_ino, stat.st_mtime_ns
+
+
+class Segment:
+    """
+    One memory-mapped block of item rows: the base catalog or an appended batch.
+    """
+
+    def __init__(self, item_dir, shape, offset):
+        self.item_dir = item_dir
+        self.items, self.items_csc = load_items(item_dir, shape)
+        self.book_ids = np.load(os.path.join(item_dir, "book_ids.npy"), mmap_mode="r")
+        self.offset = offset
+        # Artifacts built before facets existed can only be searched without filters
+        self.facets = FacetIndex(item_dir) if os.path.exists(os.path.join(item_dir, FACETS)) else None
+
+
+class RecommenderModel:
+    """
+    Query-only recommender backed by a memory-mapped artifact from build_model.
+
+    The item matrices are opened with np.load(mmap_mode='r'), so opening is cheap
+    and processes on the same host that open the same artifact share the page
+    cache instead of each holding a private copy. Segments appended later by
+    segments.append_books are searched together with the base catalog. The
+    segments are read once; a long-running reader compares version with
+    model_version(model.root) and reopens the model when it changes.
+    """
+
+    def __init__(self, model_dir):
+        self.root = model_dir
+        self.version = model_version(model_dir)
+        model_dir = self.version[0]
+        self.model_dir = model_dir
+        with open(os.path.join(model_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        n_columns = self.meta["shape"][1]
+        self.segments = [Segment(model_dir, tuple(self.meta["shape"]), 0)]
+        for entry in read_manifest(model_dir):
+            offset = self.segments[-1].offset + self.segments[-1].items.shape[0]
+            self.segments.append(
+                Segment(os.path.join(model_dir, entry["name"]), (entry["rows"], n_columns), offset)
+            )
+        if len(self.segments) == 1:
+            self.book_ids = self.segments[0].book_ids
+        else:
+            self.book_ids = np.concatenate([segment.book_ids for segment in self.segments])
+        self._id_order = np.argsort(self.book_ids, kind="stable")
+        # Work-level models map every edition's bookID (sorted) to the row of its work
+        self.edition_ids, self.edition_rows = None, None
+        if os.path.exists(os.path.join(model_dir, "edition_ids.npy")):
+            self.edition_ids = self._load("edition_ids")
+            self.edition_rows = self._load("edition_rows")
+        self._offsets = np.array([segment.offset for segment in self.segments])
+
+        self.scaler_mean = self._load("scaler_mean")
+        self.scaler_scale = self._load("scaler_scale")
+        self.tfidf = make_text_vectorizer(self.meta["hashing_features"])
+        idf = np.asarray(self._load("idf"))
+        if self.meta["hashing_features"]:
+            self.tfidf[-1].idf_ = idf
+        else:
+            self.tfidf.set_params(vocabulary=self.meta["vocabulary"])
+            self.tfidf.idf_ = idf
+
+    def _load(self, name):
+        return np.load(os.path.join(self.model_dir, f"{name}.npy"), mmap_mode="r")
+
+    def rows_for(self, book_ids):
+        """
+        Map bookIDs to item row positions.
+
+        In a work-level model every edition maps to the row of its work.
+
+        Parameters:
+        - book_ids (list): bookIDs present in the catalog.
+
+        Returns:
+        - numpy array: Row position of every bookID.
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        pos = np.searchsorted(self.book_ids, book_ids, sorter=self._id_order)
+        pos = np.minimum(pos, len(self._id_order) - 1)
+        rows = self._id_order[pos]
+        found = self.book_ids[rows] == book_ids
+        if self.edition_ids is not None:
+            pos = np.minimum(np.searchsorted(self.edition_ids, book_ids), len(self.edition_ids) - 1)
+            edition = self.edition_ids[pos] == book_ids
+            rows = np.where(edition, self.edition_rows[pos], rows)
+            found |= edition
+        missing = book_ids[~found]
+        if len(missing):
+            raise KeyError(f"Unknown bookIDs: {missing.tolist()}")
+        return rows
+
+    def catalog_ids(self):
+        """
+        Every bookID the model answers for: all editions of a work-level model plus
+        the books of appended segments, otherwise the item rows' bookIDs in row order.
+
+        Returns:
+        - numpy array: bookIDs.
+        """
+        if self.edition_ids is None:
+            return np.asarray(self.book_ids)
+        return np.union1d(self.edition_ids, self.book_ids)
+
+    def item_vectors(self, rows):
+        """
+        Fetch the stored item vectors of the given rows.
+
+        Parameters:
+        - rows (numpy array): Row positions as returned by rows_for.
+
+        Returns:
+        - csr_matrix: One item vector per row.
+        """
+        rows = np.asarray(rows)
+        if len(self.segments) == 1:
+            return self.segments[0].items[rows]
+        owner = np.searchsorted(self._offsets, rows, side="right") - 1
+        return sp.vstack(
+            [self.segments[o].items[[r - self.segments[o].offset]] for o, r in zip(owner, rows)],
+            format="csr"
+        )
+
+    def transform_books(self, df):
+        """
+        Vectorize new books with the stored vocabulary/IDF and scaler parameters.
+
+        Parameters:
+        - df (DataFrame): Books as returned by recommend.load_and_clean_data.
+
+        Returns:
+        - csr_matrix: Row-normalized float32 vectors in the item space.
+        """
+        features = self.meta["numerical_features"]
+        text_matrix = self.tfidf.transform(df["text_features"].fillna(''))
+        numerical = df[features].fillna(dict(zip(features, self.meta["numerical_median"])))
+        numerical_matrix = (numerical.to_numpy(dtype=np.float64) - self.scaler_mean) / self.scaler_scale
+        return combine_features(text_matrix, numerical_matrix).astype(np.float32)
+
+    def vectorize_text(self, texts):
+        """
+        Turn free text into query vectors in the item space.
+
+        The numerical part is set to the catalog mean (zero after scaling), so
+        only the text decides the similarity.
+
+        Parameters:
+        - texts (list): Query strings.
+
+        Returns:
+        - csr_matrix: Row-normalized float32 query vectors.
+        """
+        text_matrix = self.tfidf.transform(texts)
+        numerical = np.zeros((len(texts), len(self.meta["numerical_features"])))
+        return combine_features(text_matrix, numerical).astype(np.float32)
+
+    def search(self, queries, n=5, exclude_rows=None, n_jobs=None, block_size=1024, filters=None):
+        """
+        Score query vectors against the catalog and return the top-N bookIDs.
+
+        With filters, the facet index of every segment is intersected first and
+        only the books that pass are scored. When fewer than n books pass, the
+        missing places hold bookID -1 and score -inf.
+
+        Parameters:
+        - queries (csr_matrix): Row-normalized float32 query vectors.
+        - n (int): Number of recommendations per query.
+        - exclude_rows (numpy array): Optional item row to leave out for each query.
+        - n_jobs (int): Scoring threads, see topk.topk_similarity.
+        - block_size (int): Query rows scored per matrix multiply, see topk.topk_similarity.
+        - filters (dict): Optional facet filters: language (code or list of codes),
+          year_min/year_max (publication year, inclusive), min_rating and min_ratings_count.
+
+        Returns:
+        - tuple: (recommended bookIDs, scores) arrays of shape n_queries x n.
+        """
+        extra = 0 if exclude_rows is None else 1
+        filters = {key: value for key, value in (filters or {}).items() if value is not None}
+        unknown = set(filters) - FILTER_KEYS
+        if unknown:
+            raise ValueError(f"Unknown filters: {sorted(unknown)}")
+        indices, scores = None, None
+        for segment in self.segments:
+            # Search every segment on its own and merge the per-segment top-k lists
+            items, rows = segment.items_csc, None
+            if filters:
+                if segment.facets is None:
+                    raise ValueError(f"{segment.item_dir} has no facet index, rebuild the model to filter")
+                rows = segment.facets.rows(filters)
+                if not len(rows):
+                    continue
+                items = segment.items[rows]
+            seg_indices, seg_scores = topk_similarity(queries, items, k=n + extra, n_jobs=n_jobs,
+                                                        block_size=block_size)
+            if rows is not None:
+                seg_indices = rows[seg_indices]
+            seg_indices = seg_indices + segment.offset
+            if indices is None:
+                indices, scores = seg_indices, seg_scores
+                continue
+            order, scores = topk_from_scores(np.hstack((scores, seg_scores)), n + extra)
+            indices = np.take_along_axis(np.hstack((indices, seg_indices)), order, axis=1)
+        if filters:
+            # Pad to n + extra places with row -1, which no query excludes
+            width = 0 if indices is None else indices.shape[1]
+            padding = ((0, 0), (0, n + extra - width))
+            indices = np.pad(np.empty((queries.shape[0], 0), dtype=np.int64) if indices is None else indices,
+                             padding, constant_values=-1)
+            scores = np.pad(np.empty((queries.shape[0], 0)) if scores is None else scores,
+                            padding, constant_values=-np.inf)
+        if exclude_rows is not None:
+            # Drop the query book itself, otherwise drop the last (lowest) neighbour
+            keep = indices != np.asarray(exclude_rows)[:, None]
+            keep[keep.all(axis=1), -1] = False
+            indices = indices[keep].reshape(len(indices), -1)
+            scores = scores[keep].reshape(len(scores), -1)
+        if filters:
+            return np.where(indices >= 0, self.book_ids[np.maximum(indices, 0)], -1), scores
+        return self.book_ids[indices], scores
+
+    def recommend(self, book_ids, n=5, filters=None):
+        """
+        Recommend the top-N most similar books for the given bookIDs.
+
+        Parameters:
+        - book_ids (list): bookIDs present in the catalog.
+        - n (int): Number of recommendations per book.
+        - filters (dict): Optional facet filters, see search.
+
+        Returns:
+        - tuple: (recommended bookIDs, scores) arrays of shape len(book_ids) x n.
+        """
+        rows = self.rows_for(book_ids)
+        return self.search(self.item_vectors(rows), n=n, exclude_rows=rows, filters=filters)
+
+    def similar(self, texts, n=5, filters=None):
+        """
+        Recommend the top-N books for free-text queries.
+
+        Parameters:
+        - texts (list): Query strings, e.g. a title or an author name.
+        - n (int): Number of recommendations per query.
+        - filters (dict): Optional facet filters, see search.
+
+        Returns:
+        - tuple: (recommended bookIDs, scores) arrays of shape len(texts) x n.
+        """
+        return self.search(self.vectorize_text(texts), n=n, filters=filters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a persisted recommender model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Fit on the catalog and save the artifact")
+    build_parser.add_argument("--data", default="books_cleaned.csv")
+    build_parser.add_argument("--model", default="model")
+    build_parser.add_argument("--hashing-features", type=int, default=None,
+                              help="Hash text into this many columns instead of fitting a vocabulary")
+    build_parser.add_argument("--editions", default=None,
+                              help="bookID,work_id CSV from editions.py; index one edition per work")
+    query_parser = subparsers.add_parser("query", help="Answer queries from a saved artifact")
+    query_parser.add_argument("--model", default="model")
+    query_parser.add_argument("--book-id", type=int, nargs="*", default=[])
+    query_parser.add_argument("--text", nargs="*", default=[])
+    query_parser.add_argument("-n", type=int, default=5)
+    query_parser.add_argument("--language", nargs="*", default=None, help="Only recommend books in these languages")
+    query_parser.add_argument("--year-min", type=int, default=None)
+    query_parser.add_argument("--year-max", type=int, default=None)
+    query_parser.add_argument("--min-rating", type=float, default=None)
+    query_parser.add_argument("--min-ratings-count", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        build_model(args.data, args.model, hashing_features=args.hashing_features, editions=args.editions)
+        print(f"Model saved to {args.model} in {time.perf_counter() - start:.2f}s")
+        return
+
+    start = time.perf_counter()
+    model = RecommenderModel(args.model)
+    print(f"Model opened in {(time.perf_counter() - start) * 1000:.1f} ms")
+    filters = {"language": args.language, "year_min": args.year_min, "year_max": args.year_max,
+               "min_rating": args.min_rating, "min_ratings_count": args.min_ratings_count}
+    if args.book_id:
+        recommended, _ = model.recommend(args.book_id, n=args.n, filters=filters)
+        for book_id, row in zip(args.book_id, recommended):
+            print(f"{book_id}: {' '.join(map(str, row))}")
+    if args.text:
+        recommended, _ = model.similar(args.text, n=args.n, filters=filters)
+        for text, row in zip(args.text, recommended):
+            print(f"{text!r}: {' '.join(map(str, row))}")
+
+
+if __name__ == "__main__":
+    main()
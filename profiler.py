@@ -0,0 +1,285 @@
+import atexit
+import contextlib
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+# Set to a JSON path to profile datapreprocess.py, dataAnalysis.py and recommend.py; every run
+# of a script is appended to that one report. Unset, stage() and wrap() cost one attribute check.
+ENV_VAR = "PIPELINE_PROFILE"
+
+_NULL_STAGE = contextlib.nullcontext()
+# Spark REST fields summed over the stages of a profiled block
+SPARK_STAGE_FIELDS = ["numTasks", "numFailedTasks", "inputBytes", "outputBytes", "shuffleReadBytes",
+                      "shuffleWriteBytes", "memoryBytesSpilled", "diskBytesSpilled", "executorRunTime",
+                      "executorCpuTime", "peakExecutionMemory"]
+
+
+def peak_rss():
+    """Peak resident set size (VmHWM) in bytes since start or the last reset_peak_rss()."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak_rss():
+    """
+    Reset VmHWM to the current RSS so the next peak_rss() covers only what follows.
+
+    Returns:
+    - bool: False when the kernel does not allow it; peaks are then process-wide.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageRecord:
+    """Totals of every run of one named stage within a process."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.spark = {}
+
+    def to_dict(self):
+        record = {"name": self.name, "calls": self.calls, "wall_s": round(self.wall, 6),
+                  "cpu_s": round(self.cpu, 6), "peak_rss_mb": round(self.peak_rss / 2 ** 20, 2)}
+        if self.spark:
+            record["spark"] = self.spark
+        return record
+
+
+class _Stage:
+    def __init__(self, profiler, name, spark):
+        self.profiler = profiler
+        self.name = name
+        self.spark = spark
+        self.peak = 0
+
+    def __enter__(self):
+        self.profiler._open(self)
+        if self.spark is not None:
+            self.group = f"profile-{next(self.profiler._groups)}-{self.name}"
+            self.spark.sparkContext.setJobGroup(self.group, self.name)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        spark_metrics = None
+        if self.spark is not None:
+            self.spark.sparkContext.setLocalProperty("spark.jobGroup.id", None)
+            self.spark.sparkContext.setLocalProperty("spark.job.description", None)
+            spark_metrics = spark_group_metrics(self.spark, self.group)
+        self.profiler._close(self, wall, cpu, spark_metrics)
+        return False
+
+
+class Profiler:
+    """
+    Records wall time, CPU time and peak RSS per named stage.
+
+    CPU time is process-wide, so stages that run concurrently (the analyses in
+    dataAnalysis.py, the similarity threads in recommend.py) count each other's CPU.
+    Peak RSS is per stage where the kernel allows resetting VmHWM, otherwise it is the
+    process peak up to the end of the stage. Spark blocks also get the job/stage
+    metrics of the jobs they submitted.
+
+    Parameters:
+    - report_path (str): JSON report to append this run to; None disables profiling.
+    """
+
+    def __init__(self, report_path=None):
+        self.report_path = report_path
+        self.records = {}
+        self.started = time.perf_counter()
+        self.per_stage_peaks = True
+        self.max_peak = 0
+        self._active = []
+        self._lock = threading.Lock()
+        self._groups = itertools.count()
+        self._registered = False
+
+    @property
+    def enabled(self):
+        return self.report_path is not None
+
+    def stage(self, name, spark=None):
+        """
+        Context manager timing one stage; a shared no-op when profiling is off.
+
+        Parameters:
+        - name (str): Stage name; repeated stages are summed.
+        - spark (SparkSession): Session whose jobs inside the block are measured.
+        """
+        if self.report_path is None:
+            return _NULL_STAGE
+        if not self._registered:
+            self._registered = True
+            atexit.register(self.finish)
+        return _Stage(self, name, spark)
+
+    def wrap(self, name, func):
+        """
+        Time every call of func as stage name; returns func itself when profiling is off.
+        """
+        if self.report_path is None:
+            return func
+
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def _open(self, stage):
+        with self._lock:
+            # Credit the peak so far to the stages already open before the counter is reset
+            peak = peak_rss()
+            self.max_peak = max(self.max_peak, peak)
+            for other in self._active:
+                other.peak = max(other.peak, peak)
+            self.per_stage_peaks = reset_peak_rss() and self.per_stage_peaks
+            self._active.append(stage)
+
+    def _close(self, stage, wall, cpu, spark_metrics):
+        with self._lock:
+            peak = peak_rss()
+            self.max_peak = max(self.max_peak, peak)
+            for other in self._active:
+                other.peak = max(other.peak, peak)
+            self._active.remove(stage)
+            record = self.records.setdefault(stage.name, StageRecord(stage.name))
+            record.calls += 1
+            record.wall += wall
+            record.cpu += cpu
+            record.peak_rss = max(record.peak_rss, stage.peak)
+            for key, value in (spark_metrics or {}).items():
+                record.spark[key] = record.spark.get(key, 0) + value
+
+    def run_report(self):
+        return {
+            "script": os.path.basename(sys.argv[0]),
+            "argv": sys.argv[1:],
+            "pid": os.getpid(),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "wall_s": round(time.perf_counter() - self.started, 6),
+            # resetting VmHWM also resets ru_maxrss, so the run peak is tracked across resets
+            "peak_rss_mb": round(max(self.max_peak, peak_rss()) / 2 ** 20, 2),
+            "per_stage_peak_rss": self.per_stage_peaks,
+            "stages": [record.to_dict() for record in self.records.values()],
+        }
+
+    def finish(self):
+        """Append this run to the JSON report and print its summary to stderr."""
+        if self.report_path is None or not self.records:
+            return
+        run = self.run_report()
+        report = {"runs": []}
+        if os.path.exists(self.report_path):
+            with open(self.report_path) as f:
+                report = json.load(f)
+        report["runs"].append(run)
+        tmp_path = f"{self.report_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, self.report_path)
+        print(format_run(run), file=sys.stderr)
+        self.records = {}
+
+
+def spark_group_metrics(spark, group):
+    """
+    Job, stage and task metrics of the Spark jobs submitted under a job group.
+
+    Stage metrics come from the application's REST API on the Spark UI; without a UI only
+    the task counts from the status tracker are reported.
+
+    Returns:
+    - dict: Counts and summed stage metrics (bytes, milliseconds, CPU nanoseconds).
+    """
+    sc = spark.sparkContext
+    tracker = sc.statusTracker()
+    job_ids = tracker.getJobIdsForGroup(group)
+    stage_ids = sorted({s for j in job_ids if tracker.getJobInfo(j) for s in tracker.getJobInfo(j).stageIds})
+    metrics = {"jobs": len(job_ids), "stages": 0, "skippedStages": 0}
+    for stage_id in stage_ids:
+        attempts = _rest_stage(sc, stage_id)
+        if attempts is None:
+            info = tracker.getStageInfo(stage_id)
+            if info is None:
+                metrics["skippedStages"] += 1
+                continue
+            attempts = [{"numTasks": info.numTasks, "numFailedTasks": info.numFailedTasks}]
+        if attempts and attempts[0].get("status") == "SKIPPED":
+            metrics["skippedStages"] += 1
+            continue
+        metrics["stages"] += 1
+        for attempt in attempts:
+            for field in SPARK_STAGE_FIELDS:
+                if field in attempt:
+                    metrics[field] = metrics.get(field, 0) + attempt[field]
+    return metrics
+
+
+def _rest_stage(sc, stage_id):
+    if not sc.uiWebUrl:
+        return None
+    url = f"{sc.uiWebUrl}/api/v1/applications/{sc.applicationId}/stages/{stage_id}?details=false"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
+
+
+def format_run(run):
+    """Human-readable table of one run of the JSON report."""
+    lines = [f"## Profile: {run['script']} {' '.join(run['argv'])}".rstrip(),
+             f"{'stage':<40}{'calls':>6}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}"]
+    for stage in run["stages"]:
+        lines.append(f"{stage['name']:<40}{stage['calls']:>6}{stage['wall_s']:>10.2f}{stage['cpu_s']:>10.2f}"
+                     f"{stage['peak_rss_mb']:>10.1f}")
+        spark = stage.get("spark")
+        if spark:
+            lines.append(f"{'':<4}spark: {spark['jobs']} jobs, {spark['stages']} stages "
+                         f"({spark['skippedStages']} skipped), {spark.get('numTasks', 0)} tasks, "
+                         f"shuffle r/w {spark.get('shuffleReadBytes', 0) / 2 ** 20:.1f}/"
+                         f"{spark.get('shuffleWriteBytes', 0) / 2 ** 20:.1f} MB, "
+                         f"spill {spark.get('diskBytesSpilled', 0) / 2 ** 20:.1f} MB")
+    lines.append(f"{'(run total)':<40}{'':>6}{run['wall_s']:>10.2f}{'':>10}{run['peak_rss_mb']:>10.1f}")
+    if not run["per_stage_peak_rss"]:
+        lines.append("peak RSS could not be reset between stages; values are process peaks")
+    return "\n".join(lines)
+
+
+_profiler = Profiler(os.environ.get(ENV_VAR) or None)
+stage = _profiler.stage
+wrap = _profiler.wrap
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"usage: {ENV_VAR}=report.json python <script> ...; python profiler.py report.json")
+    with open(sys.argv[1]) as f:
+        for run in json.load(f)["runs"]:
+            print(format_run(run) + "\n")
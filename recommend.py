@@ -1,10 +1,17 @@
 import pandas as pd
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler, normalize
 from sklearn.model_selection import train_test_split
 
+from ann import IVFIndex
+import profiler
+from compress import CompressedIndex
+from evaluate import TopKEvaluator, exact_scores_of, relevant_counts
+from ingest import IngestStats, read_books_csv
+from topk import topk_similarity
+
 
 def load_and_clean_data(file_path):
     """
@@ -17,15 +24,11 @@ def load_and_clean_data(file_path):
     - DataFrame: Cleaned pandas DataFrame containing the books data.
     """
     try:
-        # Read CSV with more flexible parsing options
-        df = pd.read_csv(
-            file_path,
-            error_bad_lines=False,
-            encoding='utf-8',
-            low_memory=False,  # Avoid dtype guessing issues
-            escapechar='\\',  # Handle escaped characters
-            quoting=1  # Handle quoted fields (QUOTE_ALL)
-        )
+        # Multi-threaded columnar read; malformed rows are repaired or dropped and counted (see ingest.py)
+        stats = IngestStats()
+        df = read_books_csv(file_path, escape_char='\\', stats=stats)
+        if stats.repaired or stats.dropped:
+            print(f"{file_path}: {stats}")
 
         # Clean text fields
         text_columns = ['title', 'authors']
@@ -49,24 +52,58 @@ def load_and_clean_data(file_path):
         raise
 
 
-def prepare_features(df, numerical_features):
+def combine_features(tfidf_matrix, numerical_matrix):
+    """
+    Stack TF-IDF and scaled numerical features into one L2-normalized CSR matrix.
+
+    Parameters:
+    - tfidf_matrix (sparse matrix): TF-IDF features, one row per book.
+    - numerical_matrix (numpy array): Scaled numerical features with the same number of rows.
+
+    Returns:
+    - csr_matrix: Row-normalized combined features, so a dot product between rows is their cosine similarity.
+    """
+    combined = sp.hstack((tfidf_matrix, sp.csr_matrix(numerical_matrix)), format='csr')
+    return normalize(combined, norm='l2', copy=False)
+
+
+def make_text_vectorizer(hashing_features=None):
+    """
+    Create the unfitted TF-IDF text vectorizer.
+
+    Parameters:
+    - hashing_features (int): If set, hash tokens into this many columns instead of
+      learning a vocabulary, so unseen words in new books still get a column.
+
+    Returns:
+    - TfidfVectorizer or Pipeline: Vectorizer with fit_transform/transform methods.
+    """
+    params = dict(stop_words="english", strip_accents='unicode', token_pattern=r'\w+')
+    if hashing_features:
+        return make_pipeline(
+            HashingVectorizer(n_features=hashing_features, alternate_sign=False, norm=None, **params),
+            TfidfTransformer()
+        )
+    return TfidfVectorizer(
+        max_features=5000,  # Limit features to prevent memory issues
+        **params
+    )
+
+
+def prepare_features(df, numerical_features, hashing_features=None):
     """
     Prepare text and numerical features with error handling.
 
     Parameters:
     - df (DataFrame): pandas DataFrame containing the books data.
     - numerical_features (list): List of numerical feature column names.
+    - hashing_features (int): Optional number of hashed text columns, see make_text_vectorizer.
 
     Returns:
-    - tuple: Combined feature matrix (numpy array), fitted TF-IDF vectorizer, and fitted scaler.
+    - tuple: Combined feature matrix (row-normalized scipy CSR matrix), fitted TF-IDF vectorizer, and fitted scaler.
     """
     # Text features
-    tfidf = TfidfVectorizer(
-        stop_words="english",
-        max_features=5000,  # Limit features to prevent memory issues
-        strip_accents='unicode',
-        token_pattern=r'\w+'
-    )
+    tfidf = make_text_vectorizer(hashing_features)
 
     # Handle potential empty text features
     text_features = df["text_features"].fillna('')
@@ -78,18 +115,37 @@ def prepare_features(df, numerical_features):
     numerical_data = df[numerical_features].fillna(df[numerical_features].median())
     numerical_matrix = scaler.fit_transform(numerical_data)
 
-    # Combine features by horizontally stacking TF-IDF and numerical features
-    combined_features = np.hstack((tfidf_matrix.toarray(), numerical_matrix))
+    # Combine features by sparse horizontal stacking, keeping the TF-IDF part in CSR form
+    combined_features = combine_features(tfidf_matrix, numerical_matrix)
 
     return combined_features, tfidf, scaler
 
 
+def transform_features(df, tfidf, scaler, numerical_features):
+    """
+    Transform new rows with an already fitted TF-IDF vectorizer and scaler.
+
+    Parameters:
+    - df (DataFrame): pandas DataFrame containing the books to transform.
+    - tfidf (TfidfVectorizer): Fitted TF-IDF vectorizer.
+    - scaler (StandardScaler): Fitted scaler for the numerical features.
+    - numerical_features (list): List of numerical feature column names.
+
+    Returns:
+    - csr_matrix: Row-normalized combined features for the given rows.
+    """
+    text_matrix = tfidf.transform(df["text_features"].fillna(''))
+    numerical_matrix = scaler.transform(df[numerical_features].fillna(df[numerical_features].median()))
+    return combine_features(text_matrix, numerical_matrix)
+
+
 def calculate_map_k(similarities, k=10, similarity_threshold=0.5):
     """
     Calculate Mean Average Precision at K (MAP@K) with error handling.
 
     Parameters:
-    - similarities (numpy array): Array of similarity scores between validation and training samples.
+    - similarities (numpy array): Array of similarity scores between validation and training samples,
+      either the full matrix or the per-row top-K scores returned by topk_similarity.
     - k (int): Number of top recommendations to consider.
     - similarity_threshold (float): Threshold to determine relevance.
 
@@ -97,20 +153,10 @@ def calculate_map_k(similarities, k=10, similarity_threshold=0.5):
     - float: MAP@K score.
     """
     try:
-        precisions = []
-        for i in range(len(similarities)):
-            # Get indices of top K similar items
-            top_k = np.argsort(similarities[i])[-k:][::-1]
-            # Determine which of the top K items are relevant based on the similarity threshold
-            relevant = similarities[i][top_k] > similarity_threshold
-            if relevant.sum() > 0:
-                # Calculate precision at each relevant position
-                precision_at_k = np.cumsum(relevant) / np.arange(1, k + 1)
-                # Average precision for this instance
-                ap = np.sum(precision_at_k * relevant) / min(k, relevant.sum())
-                precisions.append(ap)
-        # Return the mean of average precisions
-        return np.mean(precisions) if precisions else 0.0
+        # Top-K selection and average precision are computed for all rows at once
+        evaluator = TopKEvaluator(k=k, similarity_threshold=similarity_threshold)
+        evaluator.update_block(similarities)
+        return evaluator.result()[f"map@{k}"]
     except Exception as e:
         print(f"Error calculating MAP@K: {str(e)}")
         return 0.0
@@ -123,13 +169,22 @@ def main():
         # ---------------------------------------------------
         file_path = "books_cleaned.csv"
         numerical_features = ["average_rating", "ratings_count", "text_reviews_count"]
+        top_k = 10  # Neighbours kept per validation book (MAP@10 needs 10, the submission uses 5)
+        block_size = 512  # Validation rows scored per matrix multiply
+        n_jobs = None  # Worker threads for the similarity step, None uses all cores
+        ann_lists = None  # Number of IVF cells; set to search an approximate index instead (see ann_report.py)
+        ann_probe = 8  # IVF cells scored per query, higher means better recall and slower search
+        compress_rank = None  # SVD dimensions; set to search compressed vectors instead (see compress_report.py)
+        compress_dtype = "int8"  # Storage of the compressed vectors, "float32" or "int8"
 
         # ---------------------------------------------------
         # Step 1: Load and Preprocess Data
         # ---------------------------------------------------
 
-        # Load and clean the dataset
-        df = load_and_clean_data(file_path)
+        # Load and clean the dataset; with PIPELINE_PROFILE set, every step below is
+        # recorded as a profiler stage (see profiler.py)
+        with profiler.stage("recommend.load_csv"):
+            df = load_and_clean_data(file_path)
 
         # ---------------------------------------------------
         # Step 2: Split Data into Training and Validation Sets
@@ -143,47 +198,88 @@ def main():
         # ---------------------------------------------------
 
         # Prepare features and obtain fitted TF-IDF vectorizer and scaler
-        combined_features, tfidf, scaler = prepare_features(train_df, numerical_features)
+        with profiler.stage("recommend.tfidf_fit"):
+            combined_features, tfidf, scaler = prepare_features(train_df, numerical_features)
+
+        # Optionally reduce the training vectors with TruncatedSVD and quantize them
+        if compress_rank:
+            with profiler.stage("recommend.compress"):
+                index = CompressedIndex(rank=compress_rank, dtype=compress_dtype).fit(combined_features)
 
         # ---------------------------------------------------
         # Step 4: Prepare Features for Validation Set
         # ---------------------------------------------------
 
-        # Transform the validation set using the fitted TF-IDF vectorizer
-        val_tfidf = tfidf.transform(val_df["text_features"].fillna(''))
-        # Transform the numerical features of the validation set using the fitted scaler
-        val_numerical = scaler.transform(val_df[numerical_features].fillna(val_df[numerical_features].median()))
-        # Combine TF-IDF and numerical features for the validation set
-        val_combined = np.hstack((val_tfidf.toarray(), val_numerical))
+        # Transform the validation set using the fitted TF-IDF vectorizer and scaler
+        with profiler.stage("recommend.transform"):
+            val_combined = transform_features(val_df, tfidf, scaler, numerical_features)
 
         # ---------------------------------------------------
-        # Step 5: Calculate Cosine Similarities
+        # Step 5: Find the Top-K Most Similar Training Books
         # ---------------------------------------------------
 
-        # Calculate cosine similarity between validation set and training set features
-        similarities = cosine_similarity(val_combined, combined_features)
+        # Rows are L2-normalized, so the blocked sparse dot product is the cosine similarity;
+        # only the top-K indices and scores of each validation row are kept, and every
+        # scored block is fed to the evaluator before it is dropped
+        # (the evaluation runs inside the similarity step, so its time is also part of "similarity")
+        evaluator = TopKEvaluator(k=10)
+        with profiler.stage("recommend.similarity"):
+            if compress_rank:
+                top_indices, top_scores = index.search(val_combined, k=top_k, block_size=block_size, n_jobs=n_jobs)
+                # Judge the compressed ranking by the exact similarities and the exact relevant sets,
+                # as compress_report.py does, so the metrics are comparable with the exact path
+                with profiler.stage("recommend.map_evaluation"):
+                    evaluator.update(
+                        exact_scores_of(val_combined, combined_features, top_indices),
+                        relevant_counts(val_combined, combined_features, evaluator.similarity_threshold,
+                                        block_size=block_size, n_jobs=n_jobs)
+                    )
+            elif ann_lists:
+                index = IVFIndex(n_lists=ann_lists, n_probe=ann_probe).fit(combined_features)
+                top_indices, top_scores = index.search(val_combined, k=top_k)
+                # Same exact judging as the compressed branch: relevant items the index missed count against it
+                with profiler.stage("recommend.map_evaluation"):
+                    evaluator.update(
+                        exact_scores_of(val_combined, combined_features, top_indices),
+                        relevant_counts(val_combined, combined_features, evaluator.similarity_threshold,
+                                        block_size=block_size, n_jobs=n_jobs)
+                    )
+            else:
+                top_indices, top_scores = topk_similarity(
+                    val_combined, combined_features, k=top_k, block_size=block_size, n_jobs=n_jobs,
+                    on_block=profiler.wrap("recommend.map_evaluation", evaluator.observe_block)
+                )
 
         # ---------------------------------------------------
         # Step 6: Calculate and Print MAP@10
         # ---------------------------------------------------
 
-        # Calculate Mean Average Precision at K=10
-        map_10 = calculate_map_k(similarities, k=10)
-        print(f"MAP@10: {map_10:.4f}")
+        # Mean Average Precision at K=10 and the other ranking metrics, accumulated per block
+        with profiler.stage("recommend.map_evaluation"):
+            metrics = evaluator.result()
+        print(f"MAP@10: {metrics['map@10']:.4f}")
+        print(
+            f"Precision@10: {metrics['precision@10']:.4f}, Recall@10: {metrics['recall@10']:.4f}, "
+            f"NDCG@10: {metrics['ndcg@10']:.4f}"
+        )
 
         # ---------------------------------------------------
         # Step 7: Save Sample Recommendations
         # ---------------------------------------------------
 
-        # Generate and save sample recommendations for the first 5 validation samples
-        sample_recommendations = pd.DataFrame({
-            "book_id": val_df["bookID"],
-            "recommended_books": [
-                " ".join(train_df["bookID"].iloc[np.argsort(similarities[i])[-5:][::-1]].astype(str))
-                for i in range(len(val_df))
-            ]
-        })
-        sample_recommendations.to_csv("submission.csv", index=False)
+        # Generate and save the top 5 recommendations for every validation sample
+        with profiler.stage("recommend.submission_write"):
+            train_ids = train_df["bookID"].to_numpy()
+            # The IVF index pads missing neighbours with -1; leave them out instead of indexing train_ids with -1
+            top5 = top_indices[:, :5]
+            short = int((top5 < 0).any(axis=1).sum())
+            if short:
+                print(f"Warning: {short} validation books have fewer than 5 recommendations")
+            sample_recommendations = pd.DataFrame({
+                "book_id": val_df["bookID"],
+                "recommended_books": [" ".join(map(str, train_ids[row[row >= 0]])) for row in top5]
+            })
+            sample_recommendations.to_csv("submission.csv", index=False)
 
     except Exception as e:
         print(f"Error in main execution: {str(e)}")
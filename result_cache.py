@@ -0,0 +1,164 @@
+import ast
+import hashlib
+import inspect
+import json
+import os
+import textwrap
+import threading
+import time
+from glob import glob
+
+from local_backend import is_local_path
+
+# 分析结果缓存：每个分析的键由输入数据的指纹、运行选项和分析代码的规范化文本共同决定
+# 键与清单(manifest)中记录的相同、且输出文件没有被改动时直接沿用上次的结果，不启动Spark作业
+# 清单保存在结果目录下，记录每个输出由哪些输入(路径和指纹)、哪段代码生成，dataView.py读取的结果目录不变
+MANIFEST = "_manifest.json"
+CACHE_VERSION = 1
+CHUNK_SIZE = 1 << 20
+
+
+def normalized_source(obj):
+    # 函数或模块的源代码解析成语法树再输出，注释、空行和格式上的改动不影响结果
+    return ast.dump(ast.parse(textwrap.dedent(inspect.getsource(obj))), annotate_fields=False)
+
+
+def code_digests(modules, builders):
+    # 每个分析的代码指纹 = 它自己的实现(Spark和本地各一个函数) + 各模块中其余的共用代码
+    # 共用代码(读取、预聚合、去重、写出、常量和schema)改动后所有分析都失效，只改某个分析时只有它失效
+    # builders: 分析名称 -> 实现它的函数列表
+    own = {id(fn) for fns in builders.values() for fn in fns}
+    shared = hashlib.sha256()
+    for module in modules:
+        tree = ast.parse(inspect.getsource(module))
+        skip = {fn.__name__ for fn in vars(module).values() if id(fn) in own}
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and node.name in skip:
+                continue
+            if isinstance(node, ast.If) and "__main__" in ast.dump(node.test):
+                continue
+            shared.update(ast.dump(node, annotate_fields=False).encode("utf-8"))
+    shared = shared.hexdigest()
+    digests = {}
+    for name, fns in builders.items():
+        digest = hashlib.sha256(shared.encode("utf-8"))
+        for fn in fns:
+            digest.update(normalized_source(fn).encode("utf-8"))
+        digests[name] = digest.hexdigest()
+    return digests
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def data_files(path):
+    # 单个文件或目录(Parquet数据集、聚合表等)中的数据文件；跳过_SUCCESS、.crc等以_或.开头的文件，与Spark读取时一致
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(("_", ".")))
+        files.extend(os.path.join(root, n) for n in sorted(names) if not n.startswith(("_", ".")))
+    return files
+
+
+def hadoop_files(spark, path):
+    # HDFS等远程路径通过Hadoop FileSystem列出文件，只读元数据和HDFS保存的块校验和，不读取数据也不提交作业
+    jvm = spark.sparkContext._jvm
+    root = jvm.org.apache.hadoop.fs.Path(path)
+    fs = root.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+    entries = {}
+    files = fs.listFiles(root, True)
+    while files.hasNext():
+        status = files.next()
+        if status.getPath().getName().startswith(("_", ".")):
+            continue
+        checksum = fs.getFileChecksum(status.getPath())
+        entries[status.getPath().toString()] = {"size": status.getLen(), "mtime_ms": status.getModificationTime(),
+                                                "checksum": checksum and checksum.toString()}
+    return entries
+
+
+class ResultCache:
+    # 结果目录下的清单；record可以在多个分析线程中并发调用，save统一写出
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get("version") != CACHE_VERSION:
+            manifest = {"version": CACHE_VERSION, "files": {}, "analyses": {}}
+        self.manifest = manifest
+
+    def fingerprint(self, path, spark=None):
+        # 本地文件的指纹为大小和内容哈希；大小和修改时间都没变时沿用清单中记录的哈希，不重新读文件
+        # 远程路径需要spark，指纹为文件大小、修改时间和HDFS校验和
+        if not is_local_path(path):
+            if spark is None:
+                return None
+            entries = hadoop_files(spark, path)
+        else:
+            entries = {}
+            known = self.manifest["files"]
+            for f in data_files(path.replace("file://", "", 1)):
+                stat = os.stat(f)
+                f = os.path.abspath(f)
+                entry = known.get(f)
+                if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(f)}
+                    known[f] = entry
+                entries[f] = {"size": entry["size"], "sha256": entry["sha256"]}
+        digest = hashlib.sha256(json.dumps(sorted(entries.items()), sort_keys=True).encode("utf-8"))
+        return {"path": path, "files": len(entries), "digest": digest.hexdigest()}
+
+    @staticmethod
+    def key(inputs, options, code):
+        payload = {"inputs": {role: fp["digest"] for role, fp in inputs.items()}, "options": options, "code": code}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def output_hashes(self, output):
+        files = sorted(glob(os.path.join(self.output_dir, output, "part-*")))
+        return {os.path.basename(f): file_hash(f) for f in files}
+
+    def is_fresh(self, name, key):
+        # 键相同，且输出目录中的part文件与记录时完全一致(没有被删除或被其他运行覆盖)
+        entry = self.manifest["analyses"].get(name)
+        return bool(entry and entry["key"] == key and entry["files"]
+                    and self.output_hashes(entry["output"]) == entry["files"])
+
+    def preview(self, name, show_rows=20):
+        entry = self.manifest["analyses"][name]
+        lines = []
+        for f in sorted(glob(os.path.join(self.output_dir, entry["output"], "part-*"))):
+            with open(f, encoding="utf-8") as part:
+                lines.extend(line.rstrip("\n") for _, line in zip(range(show_rows - len(lines)), part))
+        return "\n".join(lines)
+
+    def record(self, name, key, output, inputs, options, code, seconds):
+        entry = {"key": key, "output": output, "files": self.output_hashes(output), "inputs": inputs,
+                 "options": options, "code": code, "seconds": round(seconds, 3),
+                 "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with self._lock:
+            self.manifest["analyses"][name] = entry
+
+    def invalidate(self, names):
+        with self._lock:
+            for name in names:
+                self.manifest["analyses"].pop(name, None)
+
+    def save(self):
+        # 先写临时文件再替换，中途失败不会留下不完整的清单
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with self._lock, open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
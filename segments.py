@@ -0,0 +1,392 @@
+import argparse
+import fcntl
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from editions import read_work_ids, write_work_ids
+from model_store import (CURRENT, FACETS, FacetIndex, RecommenderModel, artifact_dir, build_model,
+                         document_frequencies, facet_columns, load_items, publish_generation, read_manifest,
+                         save_facets, save_items, write_manifest)
+from recommend import load_and_clean_data
+
+APPENDED_CSV = "appended.csv"
+LOCK_FILE = ".segments.lock"
+GENERATION = re.compile(r"gen-\d{5}")
+BUILDING = ".building"
+
+
+@contextmanager
+def manifest_lock(model_dir):
+    """
+    Exclusive lock for every read-modify-write of segments.json, appended.csv and CURRENT.
+
+    appends, merges and rebuilds may run in different processes; an flock on a file
+    in the model directory serializes them. The lock is not reentrant.
+
+    Parameters:
+    - model_dir (str): Directory passed to build_model.
+    """
+    with open(os.path.join(model_dir, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_books(model_dir, file_path):
+    """
+    Make new books recommendable without refitting the recommender.
+
+    The new rows are vectorized with the stored vocabulary (or hashing vectorizer),
+    IDF weights and scaler parameters and written as a new memory-mapped segment
+    that RecommenderModel searches together with the existing ones. The raw rows are
+    kept in appended.csv so a later full rebuild sees the whole catalog. Books whose
+    bookID is already in the catalog are skipped. Runs under manifest_lock, so it is
+    safe next to a running merge or rebuild. An already opened RecommenderModel does
+    not see the new segment; serve.py reopens the model when the manifest changes.
+
+    Parameters:
+    - model_dir (str): Artifact directory created by model_store.build_model.
+    - file_path (str): Cleaned CSV file with the new books.
+
+    Returns:
+    - str or None: Name of the new segment, or None if no new book was added.
+    """
+    df = load_and_clean_data(file_path)
+    with manifest_lock(model_dir):
+        return _append(artifact_dir(model_dir), df)
+
+
+def _append(root, df):
+    # Caller holds manifest_lock; root is the live artifact (or a staged generation)
+    model = RecommenderModel(root)
+    df = df[~df["bookID"].isin(model.catalog_ids())].drop_duplicates("bookID")
+    if df.empty:
+        return None
+
+    items = model.transform_books(df)
+    segments = read_manifest(root)
+    name = _reserve_segment(root, segments)
+    _write_segment(root, name, items, df["bookID"].to_numpy(dtype=np.int64), model.meta, facet_columns(df))
+
+    csv_path = os.path.join(root, APPENDED_CSV)
+    df.drop(columns=["text_features"]).to_csv(
+        csv_path, mode="a", header=not os.path.exists(csv_path), index=False
+    )
+    write_manifest(root, segments + [{"name": name, "rows": items.shape[0]}])
+    return name
+
+
+def _reserve_segment(root, segments):
+    # Caller holds manifest_lock. Directories of a merge still in progress are not in
+    # the manifest yet, so they are counted too, and the new directory is created at once
+    names = [s["name"] for s in segments] + [d for d in os.listdir(root) if d.startswith("seg-")]
+    name = f"seg-{max([int(n[4:]) for n in names], default=0) + 1:05d}"
+    os.makedirs(os.path.join(root, name))
+    return name
+
+
+def _write_segment(model_dir, name, items, book_ids, meta, facets=None):
+    segment_dir = os.path.join(model_dir, name)
+    save_items(segment_dir, items)
+    if facets is not None:
+        save_facets(segment_dir, facets)
+    np.save(os.path.join(segment_dir, "book_ids.npy"), book_ids)
+    n_text_features = meta["shape"][1] - len(meta["numerical_features"])
+    np.save(os.path.join(segment_dir, "doc_freq.npy"), document_frequencies(items, n_text_features))
+
+
+def merge_segments(model_dir):
+    """
+    Merge all appended segments into one, so queries run fewer multiplies.
+
+    The merged segment is written next to the old ones without holding the lock.
+    It is then published with an atomic manifest swap that replaces only the merged
+    entries; segments appended meanwhile are kept after it. Readers that still map
+    the old files keep working.
+
+    Parameters:
+    - model_dir (str): Artifact directory.
+
+    Returns:
+    - int: Number of segments that were merged.
+    """
+    with manifest_lock(model_dir):
+        root = artifact_dir(model_dir)
+        segments = read_manifest(root)
+        if len(segments) < 2:
+            return 0
+        name = _reserve_segment(root, segments)
+    with open(os.path.join(root, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    n_columns = meta["shape"][1]
+    items, book_ids, facets = [], [], []
+    for entry in segments:
+        segment_dir = os.path.join(root, entry["name"])
+        items.append(load_items(segment_dir, (entry["rows"], n_columns))[0])
+        book_ids.append(np.load(os.path.join(segment_dir, "book_ids.npy")))
+        if os.path.exists(os.path.join(segment_dir, FACETS)):
+            facets.append(FacetIndex(segment_dir).columns())
+    merged = sp.vstack(items, format="csr")
+    # The merged segment keeps a facet index only if every merged segment had one
+    merged_facets = None
+    if len(facets) == len(segments):
+        merged_facets = {key: np.concatenate([f[key] for f in facets]) for key in facets[0]}
+    _write_segment(root, name, merged, np.concatenate(book_ids), meta, merged_facets)
+
+    merged_names = {entry["name"] for entry in segments}
+    with manifest_lock(model_dir):
+        if artifact_dir(model_dir) != root:
+            # A rebuild was published meanwhile and already contains these books
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            return 0
+        newer = [entry for entry in read_manifest(root) if entry["name"] not in merged_names]
+        write_manifest(root, [{"name": name, "rows": merged.shape[0]}] + newer)
+    for entry in segments:
+        shutil.rmtree(os.path.join(root, entry["name"]), ignore_errors=True)
+    return len(segments)
+
+
+def idf_drift(model_dir):
+    """
+    Relative L1 change between the fitted IDF weights and the IDF of the current catalog.
+
+    Document frequencies of the base catalog and of every appended segment are
+    summed and turned into smoothed IDF weights the same way scikit-learn does.
+    In vocabulary mode words outside the fitted vocabulary are not counted.
+
+    Parameters:
+    - model_dir (str): Artifact directory.
+
+    Returns:
+    - float: sum(|idf_now - idf_fitted|) / sum(idf_fitted).
+    """
+    # Under the lock, so a merge cannot delete a segment between reading the manifest and its files
+    with manifest_lock(model_dir):
+        root = artifact_dir(model_dir)
+        with open(os.path.join(root, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        idf_fitted = np.load(os.path.join(root, "idf.npy"))
+        doc_freq = np.load(os.path.join(root, "doc_freq.npy"))
+        n_docs = meta["shape"][0]
+        for entry in read_manifest(root):
+            doc_freq = doc_freq + np.load(os.path.join(root, entry["name"], "doc_freq.npy"))
+            n_docs += entry["rows"]
+    idf_now = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+    return float(np.abs(idf_now - idf_fitted).sum() / idf_fitted.sum())
+
+
+def rebuild(model_dir):
+    """
+    Refit the recommender on the original catalog plus all appended books.
+
+    The new artifact is built in a generation subdirectory (gen-NNNNN) without
+    holding the lock, so appends continue meanwhile. Under the lock, books appended
+    during the build are added to the new artifact as a segment, and the new
+    generation is published by atomically replacing the CURRENT pointer file, so
+    the model directory always resolves to a complete artifact. The previous
+    generation is kept for readers that resolved it just before the switch; older
+    ones are removed. A work-level model stays work-level: its editions mapping is
+    copied next to the catalog, and every appended book that is not in it becomes
+    a work of its own.
+
+    Parameters:
+    - model_dir (str): Artifact directory.
+
+    Returns:
+    - bool: False if another rebuild was published first and this one was discarded.
+    """
+    with manifest_lock(model_dir):
+        root = artifact_dir(model_dir)
+        _remove_generations(model_dir, keep={root})
+        gens = [int(d[4:]) for d in os.listdir(model_dir) if GENERATION.fullmatch(d)]
+        generation = f"gen-{max(gens, default=0) + 1:05d}"
+        staging = os.path.join(model_dir, generation)
+        os.makedirs(staging)
+        # Held until the generation is published or discarded, so concurrent cleanups leave it alone
+        building = open(staging + BUILDING, "a")
+        fcntl.flock(building, fcntl.LOCK_EX)
+        with open(os.path.join(root, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        appended_path = os.path.join(root, APPENDED_CSV)
+        appended = pd.read_csv(appended_path) if os.path.exists(appended_path) else None
+    try:
+        return _build_generation(model_dir, root, staging, meta, appended)
+    finally:
+        building.close()
+        if os.path.exists(staging + BUILDING):
+            os.remove(staging + BUILDING)
+
+
+def _build_generation(model_dir, root, staging, meta, appended):
+    catalog = pd.read_csv(meta["source"])
+    if appended is not None:
+        catalog = pd.concat([catalog, appended], ignore_index=True)
+    full_catalog = os.path.join(staging, "catalog.csv")
+    catalog.to_csv(full_catalog, index=False)
+    editions = None
+    if meta.get("editions"):
+        work_ids = read_work_ids(meta["editions"])
+        new_ids = catalog.loc[~catalog["bookID"].isin(work_ids["bookID"]), "bookID"].to_numpy(dtype=np.int64)
+        editions = os.path.join(staging, "editions.csv")
+        write_work_ids(np.concatenate((work_ids["bookID"].to_numpy(), new_ids)),
+                       np.concatenate((work_ids["work_id"].to_numpy(), new_ids)), editions)
+    build_model(full_catalog, staging, meta["numerical_features"], meta["hashing_features"], editions=editions)
+    # The copied catalog (and editions mapping) are the source of the next rebuild
+    with open(os.path.join(staging, "meta.json"), encoding="utf-8") as f:
+        new_meta = json.load(f)
+    new_meta["source"] = os.path.abspath(full_catalog)
+    if editions:
+        new_meta["editions"] = os.path.abspath(editions)
+    with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(new_meta, f, ensure_ascii=False)
+
+    with manifest_lock(model_dir):
+        if artifact_dir(model_dir) != root:
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        # Books appended while the model was being built
+        appended_path = os.path.join(root, APPENDED_CSV)
+        seen = 0 if appended is None else len(appended)
+        if os.path.exists(appended_path):
+            late = pd.read_csv(appended_path).iloc[seen:]
+            if len(late):
+                pending = os.path.join(staging, "pending.csv")
+                late.to_csv(pending, index=False)
+                _append(staging, load_and_clean_data(pending))
+                os.remove(pending)
+        publish_generation(model_dir, os.path.basename(staging))
+        _remove_generations(model_dir, keep={root, staging})
+    return True
+
+
+def _remove_generations(model_dir, keep):
+    # Caller holds manifest_lock. Removes generations not in keep (and the original
+    # top-level artifact once it is no longer kept), skipping generations still being built
+    model_dir = os.path.normpath(model_dir)
+    keep = {os.path.normpath(path) for path in keep}
+    for name in os.listdir(model_dir):
+        path = os.path.join(model_dir, name)
+        if not GENERATION.fullmatch(name) or path in keep:
+            continue
+        with open(path + BUILDING, "a") as building:
+            try:
+                fcntl.flock(building, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        os.remove(path + BUILDING)
+    if model_dir not in keep:
+        for name in os.listdir(model_dir):
+            if name in (LOCK_FILE, CURRENT) or GENERATION.fullmatch(name) or name.endswith(BUILDING):
+                continue
+            path = os.path.join(model_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def maintain(model_dir, max_segments=8, drift_threshold=0.05):
+    """
+    Run one maintenance pass: full rebuild if the IDF drifted, otherwise merge segments.
+
+    Returns:
+    - str: "rebuild", "merge" or "none".
+    """
+    segments = read_manifest(artifact_dir(model_dir))
+    if segments and idf_drift(model_dir) > drift_threshold:
+        rebuild(model_dir)
+        return "rebuild"
+    if len(segments) > max_segments:
+        merge_segments(model_dir)
+        return "merge"
+    return "none"
+
+
+class BackgroundMaintainer(threading.Thread):
+    """
+    Daemon thread that calls maintain every interval seconds.
+
+    A failing pass is reported on stderr and retried at the next interval.
+
+    Parameters:
+    - model_dir (str): Artifact directory.
+    - interval (float): Seconds between maintenance passes.
+    - max_segments (int): Merge once more than this many appended segments exist.
+    - drift_threshold (float): Rebuild once idf_drift exceeds this value.
+    """
+
+    def __init__(self, model_dir, interval=60.0, max_segments=8, drift_threshold=0.05):
+        super().__init__(daemon=True)
+        self.model_dir = model_dir
+        self.interval = interval
+        self.max_segments = max_segments
+        self.drift_threshold = drift_threshold
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                action = maintain(self.model_dir, self.max_segments, self.drift_threshold)
+            except Exception:
+                print("Segment maintenance failed, retrying at the next interval:", file=sys.stderr)
+                traceback.print_exc()
+                continue
+            if action != "none":
+                print(f"Segment maintenance: {action}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental catalog updates for a persisted recommender")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    append_parser = subparsers.add_parser("append", help="Add new books as a new index segment")
+    append_parser.add_argument("--data", required=True)
+    for name in ("append", "merge", "drift", "rebuild", "maintain"):
+        sub = append_parser if name == "append" else subparsers.add_parser(name)
+        sub.add_argument("--model", default="model")
+        if name == "maintain":
+            sub.add_argument("--interval", type=float, default=60.0)
+            sub.add_argument("--max-segments", type=int, default=8)
+            sub.add_argument("--drift-threshold", type=float, default=0.05)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "append":
+        name = append_books(args.model, args.data)
+        print(f"Segment {name} written" if name else "No new books to add")
+    elif args.command == "merge":
+        print(f"Merged {merge_segments(args.model)} segments")
+    elif args.command == "drift":
+        print(f"IDF drift: {idf_drift(args.model):.4f}")
+    elif args.command == "rebuild":
+        rebuild(args.model)
+        print("Model rebuilt")
+    else:
+        maintainer = BackgroundMaintainer(args.model, args.interval, args.max_segments, args.drift_threshold)
+        maintainer.start()
+        try:
+            maintainer.join()
+        except KeyboardInterrupt:
+            maintainer.stop()
+        return
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
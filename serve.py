@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import collections
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import scipy.sparse as sp
+
+from model_store import RecommenderModel, model_version
+
+
+class LatencyStats:
+    """
+    Request latency and throughput counters for the /metrics endpoint.
+
+    Parameters:
+    - window (int): Number of most recent latencies used for the percentiles.
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_queries = 0
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+        self.requests += 1
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        latencies = np.asarray(self.latencies) * 1000
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "uptime_s": round(elapsed, 3),
+            "throughput_rps": round(self.requests / elapsed, 2) if elapsed else 0.0,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            "latency_p99_ms": round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class MicroBatcher:
+    """
+    Collect concurrent queries into micro-batches scored with one matrix multiply.
+
+    A batch is flushed when it holds max_batch queries or when max_wait_ms has
+    passed since its first query arrived, whichever comes first.
+
+    Parameters:
+    - model (RecommenderModel): Opened recommender artifact.
+    - stats (LatencyStats): Counters updated for every flushed batch.
+    - max_batch (int): Maximum number of queries per batch.
+    - max_wait_ms (float): Maximum time the first query of a batch waits for company.
+    - reload_interval (float): Seconds between checks whether segments were appended,
+      merged or a rebuild was published; the model is reopened when they were. 0 disables it.
+    """
+
+    def __init__(self, model, stats, max_batch=64, max_wait_ms=2.0, reload_interval=1.0):
+        self.model = model
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.reload_interval = reload_interval
+        self.checked = time.monotonic()
+        self.queue = asyncio.Queue()
+
+    async def submit(self, kind, value, n):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((kind, value, n, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Score off the event loop so new requests keep queueing up meanwhile
+            try:
+                results = await loop.run_in_executor(None, self._score, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats.batches += 1
+            self.stats.batched_queries += len(batch)
+            for (*_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                # A query that could not be vectorized fails alone; KeyError is returned as a 404 result
+                if isinstance(result, Exception) and not isinstance(result, KeyError):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _reload(self):
+        # Runs before scoring a batch, so a batch is always scored against one model
+        if not self.reload_interval or time.monotonic() - self.checked < self.reload_interval:
+            return
+        self.checked = time.monotonic()
+        try:
+            if model_version(self.model.root) != self.model.version:
+                self.model = RecommenderModel(self.model.root)
+        except Exception as e:
+            # Keep answering from the model already open; the next check retries
+            print(f"Reloading {self.model.root} failed: {e!r}")
+
+    def _score(self, batch):
+        # Book queries exclude their own row; text queries use -1, which matches no row.
+        # Errors while vectorizing one query are kept as its result; only a failing search fails the batch
+        self._reload()
+        results = [None] * len(batch)
+        vectors, exclude, positions = [], [], []
+        for i, (kind, value, n, _) in enumerate(batch):
+            try:
+                if kind == "book":
+                    row = self.model.rows_for([value])
+                    vectors.append(self.model.item_vectors(row))
+                    exclude.append(row[0])
+                else:
+                    vectors.append(self.model.vectorize_text([value]))
+                    exclude.append(-1)
+                positions.append(i)
+            except Exception as e:
+                results[i] = e
+        if positions:
+            n_max = max(batch[i][2] for i in positions)
+            book_ids, scores = self.model.search(sp.vstack(vectors, format="csr"), n=n_max, exclude_rows=np.asarray(exclude))
+            for j, i in enumerate(positions):
+                n = batch[i][2]
+                results[i] = {"recommended": book_ids[j, :n].tolist(), "scores": np.round(scores[j, :n], 6).tolist()}
+        return results
+
+
+class RecommendServer:
+    """
+    Minimal asyncio HTTP/1.1 server for online recommendations.
+
+    Endpoints:
+    - GET /recommend?book_id=<id>&n=<count>: books similar to a catalog book.
+    - GET /similar?text=<query>&n=<count>: books matching free text.
+    - GET /metrics: latency percentiles, throughput and batching counters.
+
+    n must be between 1 and max_n; other values are rejected with 400 before the
+    query is batched, since a batch is scored for its largest n. Books appended with
+    segments.py become recommendable within reload_interval seconds, without a restart.
+    """
+
+    def __init__(self, model, max_batch=64, max_wait_ms=2.0, max_n=100, reload_interval=1.0):
+        self.max_n = max_n
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(model, self.stats, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                                    reload_interval=reload_interval)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode("latin-1").split()
+                if len(parts) < 2:
+                    break
+                status, body = await self.dispatch(parts[0], parts[1])
+                keep_alive = headers.get("connection", "").lower() != "close"
+                payload = json.dumps(body).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target):
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        if method != "GET":
+            return "405 Method Not Allowed", {"error": "only GET is supported"}
+        if url.path == "/metrics":
+            return "200 OK", self.stats.snapshot()
+
+        start = time.perf_counter()
+        try:
+            n = int(params.get("n", ["5"])[0])
+            if not 1 <= n <= self.max_n:
+                raise ValueError(f"n must be between 1 and {self.max_n}")
+            if url.path == "/recommend" and "book_id" in params:
+                result = await self.batcher.submit("book", int(params["book_id"][0]), n)
+            elif url.path == "/similar" and "text" in params:
+                result = await self.batcher.submit("text", params["text"][0], n)
+            else:
+                return "404 Not Found", {"error": "use /recommend?book_id=, /similar?text= or /metrics"}
+        except ValueError as e:
+            self.stats.errors += 1
+            return "400 Bad Request", {"error": str(e)}
+        except Exception as e:
+            self.stats.errors += 1
+            return "500 Internal Server Error", {"error": str(e)}
+        if isinstance(result, KeyError):
+            self.stats.errors += 1
+            return "404 Not Found", {"error": str(result.args[0])}
+        self.stats.record(time.perf_counter() - start)
+        return "200 OK", result
+
+    async def serve(self, host, port):
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving recommendations on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recommendations from a persisted model over HTTP")
+    parser.add_argument("--model", default="model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=64, help="Maximum queries scored per matrix multiply")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Maximum time a query waits for a batch")
+    parser.add_argument("--max-n", type=int, default=100, help="Largest number of recommendations per request")
+    parser.add_argument("--reload-interval", type=float, default=1.0,
+                        help="Seconds between checks for appended segments or a rebuilt model, 0 to disable")
+    args = parser.parse_args()
+
+    server = RecommendServer(RecommenderModel(args.model), max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+                             max_n=args.max_n, reload_interval=args.reload_interval)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import heapq
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from pyspark import SparkConf
+from pyspark.ml.feature import (CountVectorizerModel, ElementwiseProduct, HashingTF, IDF, Normalizer,
+                                RegexTokenizer, StopWordsRemover, VectorAssembler)
+from pyspark.ml.linalg import DenseVector, Vectors
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import avg, coalesce, col, concat_ws, explode, expr, lit, pandas_udf, stddev_pop
+from pyspark.sql.types import LongType, StringType, StructField, StructType
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, strip_accents_unicode
+
+import profiler
+import topk
+from dataAnalysis import BOOKS_SCHEMA
+
+NUMERICAL_FEATURES = ["average_rating", "ratings_count", "text_reviews_count"]
+MAX_FEATURES = 5000
+# Python's \w+ (recommend.make_text_vectorizer) in Java syntax: Java's \w is ASCII-only and even
+# (?U)\w also matches joiners and combining marks that Python's does not
+TOKEN_PATTERN = r"[\p{L}\p{N}_]+"
+
+
+@pandas_udf(StringType())
+def _preprocess_text(texts: pd.Series) -> pd.Series:
+    # Lowercase then strip accents, the order scikit-learn's vectorizers apply them in
+    return texts.str.lower().map(strip_accents_unicode)
+
+
+def read_books(spark, input_path):
+    """
+    Read cleaned books with a positional row id and the combined text column.
+
+    Parameters:
+    - spark (SparkSession): Active session.
+    - input_path (str): books_cleaned.csv on a local path or HDFS.
+
+    Returns:
+    - DataFrame: Books with row_id (0-based file position) and text_features.
+    """
+    # pandas writes quotes inside values doubled, so "" is the escape rather than Spark's default \
+    books = spark.read.schema(BOOKS_SCHEMA).option("escape", '"').csv(input_path, header=True)
+    books = books.select("bookID", "title", "authors", *NUMERICAL_FEATURES)
+    # zipWithIndex numbers rows in partition order, which is file order for a CSV input
+    schema = StructType(books.schema.fields + [StructField("row_id", LongType())])
+    books = books.rdd.zipWithIndex().map(lambda pair: tuple(pair[0]) + (pair[1],)).toDF(schema)
+    return books.withColumn("text_features", concat_ws(" ", coalesce(col("title"), lit("")),
+                                                       coalesce(col("authors"), lit(""))))
+
+
+def split_rows(spark, n_rows, test_size=0.2, seed=42):
+    """
+    Reproduce sklearn.model_selection.train_test_split(test_size, random_state=seed).
+
+    Only the permutation of row positions is generated on the driver; the books
+    themselves stay distributed and are joined to it.
+
+    Parameters:
+    - spark (SparkSession): Active session.
+    - n_rows (int): Number of books.
+    - test_size (float): Share of books used as queries.
+    - seed (int): random_state of the split.
+
+    Returns:
+    - tuple: (train, validation) DataFrames of row_id and pos, the row's position in
+      train_df or val_df.
+    """
+    permutation = np.random.RandomState(seed).permutation(n_rows)
+    n_test = math.ceil(test_size * n_rows)
+
+    def frame(row_ids):
+        return spark.createDataFrame(pd.DataFrame({"row_id": row_ids.astype(np.int64),
+                                                   "pos": np.arange(len(row_ids), dtype=np.int64)}))
+    return frame(permutation[n_test:]), frame(permutation[:n_test])
+
+
+def fit_vocabulary(tokens, max_features=MAX_FEATURES):
+    """
+    Pick the vocabulary the way TfidfVectorizer(max_features=...) does.
+
+    Terms are counted over the corpus with a distributed aggregation; only the
+    (term, count) table reaches the driver. The selection is scikit-learn's own:
+    an unstable argsort of the negated counts over the alphabetically sorted
+    terms, so terms tied at the cut-off are chosen exactly as recommend.py chooses them.
+
+    Parameters:
+    - tokens (DataFrame): Rows with a "words" array column.
+    - max_features (int): Vocabulary size.
+
+    Returns:
+    - list: Vocabulary terms.
+    """
+    counts = tokens.select(explode("words").alias("term")).groupBy("term").count().toPandas()
+    counts = counts.sort_values("term", kind="stable")
+    if len(counts) <= max_features:
+        return counts["term"].tolist()
+    chosen = (-counts["count"].to_numpy()).argsort()[:max_features]
+    return counts["term"].to_numpy()[chosen].tolist()
+
+
+def build_features(train, queries=None, num_features=None, max_features=MAX_FEATURES):
+    """
+    Build the recommender's item vectors with Spark ML.
+
+    The same features as recommend.prepare_features/transform_features:
+    - TF-IDF of title + authors (lowercased, accents stripped, scikit-learn's
+      English stop words, vocabulary of the max_features most frequent terms);
+      the IDF is log((1 + n) / (1 + df)) + 1, Spark's IDF plus one, and rows
+      are L2-normalized;
+    - average_rating, ratings_count and text_reviews_count with missing values
+      filled by the median of their own set, standardized with the training mean
+      and population standard deviation;
+    - both parts assembled and L2-normalized, so a dot product is the cosine.
+
+    Parameters:
+    - train (DataFrame): Books the vectorizer and scaler are fitted on.
+    - queries (DataFrame): Optional books transformed with the fitted parameters.
+    - num_features (int): Hash terms into this many columns with HashingTF instead
+      of fitting a vocabulary.
+    - max_features (int): Vocabulary size when not hashing.
+
+    Returns:
+    - tuple: (train features, query features or None); each DataFrame has the
+      input columns plus a "features" vector column.
+    """
+    tokenizer = RegexTokenizer(inputCol="text", outputCol="tokens", pattern=TOKEN_PATTERN, gaps=False,
+                               toLowercase=False)
+    remover = StopWordsRemover(inputCol="tokens", outputCol="words", stopWords=sorted(ENGLISH_STOP_WORDS),
+                               caseSensitive=True)
+
+    def tokenize(df):
+        return remover.transform(tokenizer.transform(df.withColumn("text", _preprocess_text("text_features"))))
+
+    train_tokens = tokenize(train).cache()
+    if num_features:
+        counter = HashingTF(inputCol="words", outputCol="tf", numFeatures=num_features)
+    else:
+        counter = CountVectorizerModel.from_vocabulary(fit_vocabulary(train_tokens, max_features),
+                                                       inputCol="words", outputCol="tf")
+    train_tf = counter.transform(train_tokens)
+    idf = IDF(inputCol="tf", outputCol="raw_idf").fit(train_tf).idf.toArray() + 1.0
+    weigh = ElementwiseProduct(inputCol="tf", outputCol="weighted", scalingVec=Vectors.dense(idf))
+    text_norm = Normalizer(inputCol="weighted", outputCol="tfidf", p=2.0)
+
+    stats = train.select(*[x for c in NUMERICAL_FEATURES
+                           for x in (avg(c).alias(f"{c}_mean"), stddev_pop(c).alias(f"{c}_std"))]).first()
+    assembler = VectorAssembler(inputCols=["tfidf"] + [f"{c}_scaled" for c in NUMERICAL_FEATURES],
+                                outputCol="combined")
+    combined_norm = Normalizer(inputCol="combined", outputCol="features", p=2.0)
+
+    def transform(df, tf):
+        # Missing values take the median of the set itself, as in recommend.py (exact, interpolated like pandas)
+        medians = df.select(*[expr(f"percentile({c}, 0.5)").alias(c) for c in NUMERICAL_FEATURES]).first()
+        for c in NUMERICAL_FEATURES:
+            # StandardScaler leaves constant columns unscaled
+            scale = stats[f"{c}_std"] or 1.0
+            filled = coalesce(col(c).cast("double"), lit(medians[c]))
+            tf = tf.withColumn(f"{c}_scaled", (filled - stats[f"{c}_mean"]) / scale)
+        features = combined_norm.transform(assembler.transform(text_norm.transform(weigh.transform(tf))))
+        return features.drop("text", "tokens", "words", "tf", "weighted", "tfidf", "combined",
+                             *[f"{c}_scaled" for c in NUMERICAL_FEATURES])
+
+    train_features = transform(train, train_tf)
+    query_features = None if queries is None else transform(queries, counter.transform(tokenize(queries)))
+    return train_features, query_features
+
+
+def _block_matrix(rows, n_features):
+    # (pos, bookID, vector) rows sorted by pos -> (positions, bookIDs, CSR matrix)
+    # VectorAssembler emits DenseVector rows when most columns are non-zero; keep only their non-zeros
+    rows = sorted(rows, key=lambda r: r[0])
+    indices, values = [], []
+    for r in rows:
+        if isinstance(r[2], DenseVector):
+            array = r[2].toArray()
+            nonzero = np.flatnonzero(array)
+            indices.append(nonzero)
+            values.append(array[nonzero])
+        else:
+            indices.append(r[2].indices)
+            values.append(r[2].values)
+    indptr = np.concatenate(([0], np.cumsum([len(i) for i in indices])))
+    matrix = sp.csr_matrix((np.concatenate(values), np.concatenate(indices), indptr), shape=(len(rows), n_features))
+    return np.array([r[0] for r in rows], dtype=np.int64), np.array([r[1] for r in rows], dtype=np.int64), matrix
+
+
+def _score_blocks(query_block, item_block, k, exclude_self):
+    # Top-k of every query of one block against one item block: [(query pos, [(score, item pos, bookID)])]
+    q_pos, q_ids, queries = query_block
+    i_pos, i_ids, items = item_block
+    scores = (queries @ items.T).toarray()
+    if exclude_self:
+        scores[q_pos[:, None] == i_pos[None, :]] = -np.inf
+    top, top_scores = topk.topk_from_scores(scores, k)
+    return [(int(q), [(float(s), int(i_pos[j]), int(i_ids[j])) for j, s in zip(top[r], top_scores[r])
+                      if s > -np.inf])
+            for r, q in enumerate(q_pos)]
+
+
+def _merge_topk(a, b, k):
+    # Highest score first, ties to the lower item position (as topk.topk_from_scores)
+    return heapq.nsmallest(k, a + b, key=lambda t: (-t[0], t[1]))
+
+
+def distributed_topk(queries, items, k=5, query_block=1024, item_block=4096, exclude_self=False):
+    """
+    Exact top-k cosine neighbours by a blocked sparse matrix multiply on the cluster.
+
+    Query and item vectors are grouped into blocks of consecutive positions; every
+    (query block, item block) pair is one task that multiplies the two CSR blocks
+    and keeps the top k of each query, and the per-block lists of a query are
+    merged with reduceByKey. Only the top-k lists are shuffled after the blocks
+    are built, and no vectors go through the driver.
+
+    Parameters:
+    - queries (DataFrame): pos, bookID and features of the query books.
+    - items (DataFrame): pos, bookID and features of the candidate books.
+    - k (int): Neighbours per query.
+    - query_block (int): Query rows per block.
+    - item_block (int): Item rows per block.
+    - exclude_self (bool): Queries and items are the same books; leave each book
+      out of its own list.
+
+    Returns:
+    - RDD: (query pos, [(score, item pos, item bookID)]) sorted by descending score.
+    """
+    n_features = items.first()["features"].size
+
+    def blocks(df, size):
+        return df.select("pos", "bookID", "features").rdd \
+                 .map(lambda r: (r.pos // size, (r.pos, r.bookID, r.features))) \
+                 .groupByKey() \
+                 .mapValues(lambda rows: _block_matrix(rows, n_features))
+
+    # Every block is read by many pairs, so both sides are built once and cached
+    query_blocks = blocks(queries, query_block).cache()
+    item_blocks = blocks(items, item_block).cache()
+    pairs = query_blocks.cartesian(item_blocks)
+    partial = pairs.flatMap(lambda pair: _score_blocks(pair[0][1], pair[1][1], k, exclude_self))
+    return partial.reduceByKey(lambda a, b: _merge_topk(a, b, k))
+
+
+def recommend(spark, input_path, output_path, n=5, test_size=0.2, seed=42, num_features=None,
+              query_block=1024, item_block=4096):
+    """
+    Write recommend.py's submission with Spark: top-n training books for every validation book.
+
+    With test_size=0 every book is a query and the whole catalog, minus the
+    book itself, is searched (as batch_recommend.py does for a saved model).
+
+    Parameters:
+    - spark (SparkSession): Active session.
+    - input_path (str): books_cleaned.csv on a local path or HDFS.
+    - output_path (str): Directory the book_id,recommended_books CSV is written to.
+    - n (int): Recommendations per book.
+    - test_size (float): Share of books used as queries, split as in recommend.py.
+    - seed (int): random_state of the split.
+    - num_features (int): Use HashingTF with this many columns instead of a vocabulary.
+    - query_block (int): Query rows per block multiply.
+    - item_block (int): Item rows per block multiply.
+
+    Returns:
+    - int: Number of books written.
+    """
+    with profiler.stage("spark_recommend.features", spark):
+        books = read_books(spark, input_path).cache()
+        if test_size:
+            train_rows, query_rows = split_rows(spark, books.count(), test_size, seed)
+            train = books.join(train_rows, "row_id")
+            queries = books.join(query_rows, "row_id")
+            train_features, query_features = build_features(train, queries, num_features)
+        else:
+            train_features, _ = build_features(books.withColumnRenamed("row_id", "pos"), None, num_features)
+            query_features = train_features
+        train_features = train_features.cache()
+        query_features = query_features.cache() if test_size else train_features
+
+    with profiler.stage("spark_recommend.similarity", spark):
+        neighbours = distributed_topk(query_features, train_features, n, query_block, item_block,
+                                      exclude_self=not test_size)
+        lines = neighbours.map(lambda pair: (pair[0], " ".join(str(t[2]) for t in pair[1])))
+        result = spark.createDataFrame(lines, "pos long, recommended_books string") \
+                      .join(query_features.select("pos", col("bookID").alias("book_id")), "pos")
+
+    with profiler.stage("spark_recommend.write", spark):
+        # Rows in val_df order like submission.csv; one part file with a header
+        result = result.orderBy("pos").select("book_id", "recommended_books").coalesce(1).cache()
+        result.write.csv(output_path, header=True, mode="overwrite")
+        written = result.count()
+        result.unpersist()
+    books.unpersist()
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TF-IDF book recommendations computed on Spark")
+    parser.add_argument("--input", default="books_cleaned.csv", help="Cleaned books CSV, local or hdfs://")
+    parser.add_argument("--output", default="submission_spark", help="Output directory (submission.csv format)")
+    parser.add_argument("--master", default=None, help="Spark master, e.g. local[*]; defaults to spark-submit's")
+    parser.add_argument("-n", type=int, default=5)
+    parser.add_argument("--test-size", type=float, default=0.2,
+                        help="Share of books used as queries (as in recommend.py); 0 recommends for every book")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--num-features", type=int, default=None,
+                        help="Hash terms into this many columns with HashingTF instead of fitting a vocabulary")
+    parser.add_argument("--query-block", type=int, default=1024, help="Query rows per block multiply")
+    parser.add_argument("--item-block", type=int, default=4096, help="Catalog rows per block multiply")
+    args = parser.parse_args()
+
+    conf = SparkConf()
+    if args.master:
+        conf.setMaster(args.master)
+    spark = SparkSession.builder.config(conf=conf).getOrCreate()
+    # The block multiply runs topk.topk_from_scores on the executors
+    spark.sparkContext.addPyFile(topk.__file__)
+    start = time.perf_counter()
+    books = recommend(spark, args.input, args.output, args.n, args.test_size, args.seed, args.num_features,
+                      args.query_block, args.item_block)
+    print(f"Wrote {books} books to {args.output} in {time.perf_counter() - start:.2f}s")
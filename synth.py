@@ -0,0 +1,184 @@
+import argparse
+import re
+
+import numpy as np
+import pandas as pd
+
+# 按books.csv的分布生成任意规模的合成图书目录(与books.csv相同的表头和格式，日期为m/d/Y)：
+# 出版社和作者按Zipf分布倾斜，多作者用/连接，语言、评分、评分人数、评论数、页数和日期从真实数据中抽样，
+# 另外按比例加入畸形行(多一个逗号、不存在的日期、缺失字段)和完全重复的行，用来测试清洗和分析在大数据量下的表现
+
+HEADER = ("bookID,title,authors,average_rating,isbn,isbn13,language_code,  num_pages,ratings_count,"
+          "text_reviews_count,publication_date,publisher")
+NUMERIC_COLUMNS = ["average_rating", "num_pages", "ratings_count", "text_reviews_count"]
+
+
+def parse_rows(text):
+    # 支持100k、1m、10m这样的写法
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([km]?)", text.strip().lower())
+    if not match:
+        raise ValueError(f"invalid row count: {text}")
+    return int(float(match.group(1)) * {"": 1, "k": 1000, "m": 1000000}[match.group(2)])
+
+
+def clean_token(text):
+    # 合成的字段中不出现逗号和引号，保证每行正好12个字段(畸形行除外)
+    return re.sub(r'[,"/]', " ", text).strip()
+
+
+class CatalogProfile:
+    # 从真实数据中统计的分布和词表
+    def __init__(self, src="books.csv"):
+        books = pd.read_csv(src, on_bad_lines="skip", dtype=str)
+        books.columns = books.columns.str.strip()
+        books = books.dropna()
+        self.numeric = books[NUMERIC_COLUMNS].to_numpy()
+        self.dates = books["publication_date"].to_numpy()
+        self.languages = books["language_code"].to_numpy()
+        author_counts = books["authors"].str.count("/").to_numpy() + 1
+        self.author_counts = author_counts
+        self.title_words = np.array(sorted({w for title in books["title"] for w in clean_token(title).split()}))
+        title_lengths = books["title"].map(lambda t: len(clean_token(t).split())).to_numpy()
+        self.title_lengths = np.clip(title_lengths, 1, 12)
+        names = pd.Series([clean_token(a) for a in books["authors"].str.split("/").explode()])
+        parts = names[names.str.contains(" ")].str.rsplit(" ", n=1)
+        first_names = sorted({f for f in parts.str[0] if f[0].isalpha()})
+        last_names = sorted({l for l in parts.str[1] if re.fullmatch(r"[A-Z][\w'-]+", l)})
+        # 打乱顺序，编号相近的作者不会有相同的名或姓
+        shuffle = np.random.default_rng(0)
+        self.first_names = shuffle.permutation(first_names)
+        self.last_names = shuffle.permutation(last_names)
+        # 真实的出版社按出现次数排序，Zipf分布中排名靠前的就是真实的大出版社
+        self.publishers = np.array([clean_token(p) for p in books["publisher"].value_counts().index])
+
+
+class ZipfSampler:
+    # 排名1..n上权重为1/k^exponent的Zipf分布；只为前head个排名保存精确的累积分布，内存与n无关
+    # 其余排名的概率质量用积分近似(第k名对应区间[k-0.5, k+0.5))，按逆函数直接求排名
+    # n不超过head时与精确的累积分布完全相同
+    def __init__(self, n, exponent, head=1 << 20):
+        self.n = n
+        self.exponent = exponent
+        self.head = min(n, head)
+        self.cumulative = np.cumsum(1.0 / np.arange(1, self.head + 1) ** exponent)
+        self.start = self.head + 0.5
+        self.total = self.cumulative[-1] + self.tail_mass(n + 0.5)
+        self.cdf = self.cumulative / self.total
+
+    def tail_mass(self, x):
+        # 从start到x的积分
+        if self.exponent == 1:
+            return np.log(x / self.start)
+        return (x ** (1 - self.exponent) - self.start ** (1 - self.exponent)) / (1 - self.exponent)
+
+    def sample(self, u):
+        # u为[0, 1)上的均匀随机数，返回从0开始的排名
+        ranks = np.searchsorted(self.cdf, u)
+        tail = ranks >= self.head
+        if tail.any():
+            mass = u[tail] * self.total - self.cumulative[-1]
+            if self.exponent == 1:
+                x = self.start * np.exp(mass)
+            else:
+                x = (self.start ** (1 - self.exponent) + mass * (1 - self.exponent)) ** (1 / (1 - self.exponent))
+            ranks[tail] = np.clip(np.floor(x - 0.5).astype(np.int64), self.head, self.n - 1)
+        return ranks
+
+
+def author_name(profile, i):
+    # 作者编号 -> 姓名，编号超出姓名组合数时加罗马数字后缀区分
+    first, last = profile.first_names, profile.last_names
+    # 同一个名的作者各自使用不同的姓，相邻编号的作者的姓也不同
+    base = f"{first[i % len(first)]} {last[(i // len(first) + 7 * (i % len(first))) % len(last)]}"
+    generation = i // (len(first) * len(last))
+    return base if generation == 0 else f"{base} {'I' * (generation + 1)}"
+
+
+def publisher_name(profile, i):
+    publishers = profile.publishers
+    return publishers[i] if i < len(publishers) else f"{publishers[i % len(publishers)]} {i // len(publishers)}"
+
+
+def generate_chunk(rng, profile, start_id, n, authors_zipf, publishers_zipf, malformed_rate, duplicate_rate):
+    # 生成一块行文本(不含换行)，bookID从start_id开始连续编号
+    sample = rng.integers(0, len(profile.numeric), n)
+    numeric = profile.numeric[sample]
+
+    n_authors = profile.author_counts[rng.integers(0, len(profile.author_counts), n)]
+    author_ids = authors_zipf.sample(rng.random(n_authors.sum()))
+    names = {i: author_name(profile, i) for i in np.unique(author_ids)}
+    bounds = np.concatenate(([0], np.cumsum(n_authors)))
+    authors = ["/".join(names[a] for a in author_ids[bounds[j]:bounds[j + 1]]) for j in range(n)]
+
+    publisher_ids = publishers_zipf.sample(rng.random(n))
+    publishers = {i: publisher_name(profile, i) for i in np.unique(publisher_ids)}
+
+    lengths = profile.title_lengths[rng.integers(0, len(profile.title_lengths), n)]
+    words = profile.title_words[rng.integers(0, len(profile.title_words), lengths.sum())]
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    titles = [" ".join(words[bounds[j]:bounds[j + 1]]) for j in range(n)]
+
+    isbn = rng.integers(0, 10 ** 10, n)
+    frame = pd.DataFrame({
+        "bookID": np.arange(start_id, start_id + n).astype(str),
+        "title": titles,
+        "authors": authors,
+        "average_rating": numeric[:, 0],
+        "isbn": [f"{v:010d}" for v in isbn],
+        "isbn13": [f"978{v:010d}" for v in isbn],
+        "language_code": profile.languages[rng.integers(0, len(profile.languages), n)],
+        "num_pages": numeric[:, 1],
+        "ratings_count": numeric[:, 2],
+        "text_reviews_count": numeric[:, 3],
+        "publication_date": profile.dates[rng.integers(0, len(profile.dates), n)],
+        "publisher": [publishers[p] for p in publisher_ids],
+    })
+
+    # 畸形行：作者中多一个未加引号的逗号(与books.csv中被跳过的行相同)、不存在的日期、缺失出版社
+    malformed = np.flatnonzero(rng.random(n) < malformed_rate)
+    kinds = rng.integers(0, 3, len(malformed))
+    frame.loc[malformed[kinds == 0], "authors"] += ", Jr."
+    frame.loc[malformed[kinds == 1], "publication_date"] = "2/30/2001"
+    frame.loc[malformed[kinds == 2], "publisher"] = ""
+
+    lines = frame["bookID"].str.cat([frame[c] for c in frame.columns[1:]], sep=",")
+    # 完全重复的行紧跟在原行之后
+    duplicates = rng.random(n) < duplicate_rate
+    if duplicates.any():
+        lines = pd.concat([lines, lines[duplicates]]).sort_index(kind="stable")
+    return lines
+
+
+def generate_catalog(dst, rows, seed=42, src="books.csv", chunksize=100000, malformed_rate=0.0005,
+                     duplicate_rate=0.001, author_exponent=0.7, publisher_exponent=0.9):
+    # 分块生成并追加写入，内存占用与rows无关(Zipf抽样只保存前head个排名)；同样的seed和参数生成同样的文件
+    profile = CatalogProfile(src)
+    rng = np.random.default_rng(seed)
+    # 作者和出版社的数量随规模增长(与books.csv中每本书约0.8个不同作者、0.2个出版社的比例相近)
+    authors_zipf = ZipfSampler(max(1000, int(rows * 0.8)), author_exponent)
+    publishers_zipf = ZipfSampler(max(100, int(rows * 0.2)), publisher_exponent)
+    written = 0
+    with open(dst, "w", encoding="utf-8") as f:
+        f.write(HEADER + "\n")
+        for start in range(0, rows, chunksize):
+            n = min(chunksize, rows - start)
+            lines = generate_chunk(rng, profile, start + 1, n, authors_zipf, publishers_zipf, malformed_rate,
+                                   duplicate_rate)
+            f.write("\n".join(lines) + "\n")
+            written += len(lines)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成与books.csv格式相同的合成图书目录")
+    parser.add_argument("--rows", default="100k", help="书籍数量，例如100k、1m、10m")
+    parser.add_argument("--output", default="books_synth.csv")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--source", default="books.csv", help="提供分布和词表的真实数据")
+    parser.add_argument("--malformed-rate", type=float, default=0.0005, help="畸形行的比例")
+    parser.add_argument("--duplicate-rate", type=float, default=0.001, help="重复行的比例")
+    args = parser.parse_args()
+
+    lines = generate_catalog(args.output, parse_rows(args.rows), args.seed, args.source,
+                             malformed_rate=args.malformed_rate, duplicate_rate=args.duplicate_rate)
+    print(f"wrote {lines} lines to {args.output}")
@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def _score_block(block, items_t):
+    # Dense similarity block of shape block x n_items
+    scores = block @ items_t
+    return scores.toarray() if sp.issparse(scores) else np.asarray(scores)
+
+
+def topk_from_scores(scores, k):
+    """
+    Select the k highest scores of every row without fully sorting the rows.
+
+    Parameters:
+    - scores (numpy array): Dense score matrix, one row per query.
+    - k (int): Number of neighbours to keep per row.
+
+    Returns:
+    - tuple: (indices, scores) arrays of shape rows x k, sorted by descending score.
+    """
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    # Order the k survivors by score, breaking ties by item position
+    order = np.lexsort((top, -top_scores), axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def topk_similarity(queries, items, k=10, block_size=1024, n_jobs=None, on_block=None):
+    """
+    Find the top-k most similar items for every query with bounded memory.
+
+    The query set is split into blocks; each block is scored with one matrix
+    multiply and trimmed with argpartition, so at most n_jobs blocks of
+    block_size x n_items scores exist at any time and only the n_queries x k
+    result is kept.
+
+    Parameters:
+    - queries (sparse matrix or numpy array): Row-normalized query vectors.
+    - items (sparse matrix or numpy array): Row-normalized item vectors.
+    - k (int): Number of neighbours to return per query.
+    - block_size (int): Number of query rows scored per matrix multiply.
+    - n_jobs (int): Number of worker threads; defaults to the number of CPUs.
+    - on_block (callable): Optional callback invoked from the worker thread as
+      on_block(start, block scores, block top-k scores) before the block is dropped,
+      e.g. evaluate.TopKEvaluator.observe_block.
+
+    Returns:
+    - tuple: (indices, scores) arrays of shape n_queries x k, sorted by descending score.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    items_t = items.T.tocsr() if sp.issparse(items) else items.T
+    k = min(k, items.shape[0])
+    indices = np.empty((queries.shape[0], k), dtype=np.int64)
+    scores = np.empty((queries.shape[0], k), dtype=np.float64)
+
+    def run(start):
+        block = _score_block(queries[start:start + block_size], items_t)
+        block_idx, block_scores = topk_from_scores(block, k)
+        if on_block is not None:
+            on_block(start, block, block_scores)
+        indices[start:start + block_size] = block_idx
+        scores[start:start + block_size] = block_scores
+
+    starts = range(0, queries.shape[0], block_size)
+    if n_jobs == 1:
+        for start in starts:
+            run(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(run, starts))
+    return indices, scores